@@ -1,94 +1,41 @@
-import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State, callback_context
-import plotly.express as px
-import plotly.graph_objects as go
-import dash_bootstrap_components as dbc
-
-# =========================
-# Load data
-# =========================
-df = pd.read_csv("integrated_crashes_for_app.csv", parse_dates=["CRASH_DATE"], low_memory=False)
-
-# Ensure some columns exist
-if "BOROUGH" not in df.columns:
-    df["BOROUGH"] = "UNKNOWN"
-
-if "YEAR" not in df.columns:
-    df["YEAR"] = df["CRASH_DATE"].dt.year
-
-if "HOUR" not in df.columns and "CRASH_TIME" in df.columns:
-    df["HOUR"] = pd.to_datetime(df["CRASH_TIME"], format="%H:%M", errors="coerce").dt.hour
-
-if "DAY_OF_WEEK" not in df.columns:
-    df["DAY_OF_WEEK"] = df["CRASH_DATE"].dt.day_name()
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
 
-if "SEVERITY" not in df.columns:
-    def classify_severity(row):
-        if row.get("NUMBER_OF_PERSONS_KILLED", 0) > 0:
-            return "Fatal"
-        elif row.get("NUMBER_OF_PERSONS_INJURED", 0) > 0:
-            return "Injury"
-        else:
-            return "No Injury"
-    df["SEVERITY"] = df.apply(classify_severity, axis=1)
-
-# =========================
-# Helper: apply filters + search
-# =========================
-def apply_filters(data, borough, year, factor, severity, search_query):
-    d = data.copy()
-
-    if borough and borough != "All":
-        d = d[d["BOROUGH"] == borough]
-
-    if year and year != "All":
-        d = d[d["YEAR"] == int(year)]
-
-    if factor and factor != "All" and "CONTRIBUTING FACTOR VEHICLE 1" in d.columns:
-        d = d[d["CONTRIBUTING FACTOR VEHICLE 1"] == factor]
-
-    if severity and severity != "All" and "SEVERITY" in d.columns:
-        d = d[d["SEVERITY"] == severity]
-
-    # Simple search mode: look in BOROUGH, PERSON_TYPES, PERSON_INJURIES, factor
-    if search_query and search_query.strip():
-        q = search_query.strip().lower()
-        mask = (
-            d["BOROUGH"].fillna("").str.lower().str.contains(q)
-            | d.get("PERSON_TYPES", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d.get("PERSON_INJURIES", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d.get("CONTRIBUTING FACTOR VEHICLE 1", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d["YEAR"].astype(str).str.contains(q)
-        )
-        d = d[mask]
+from dash import Dash, dcc, html, Input, Output, State, Patch, callback_context, no_update
+import dash_bootstrap_components as dbc
 
-    return d
+# Data loading, filtering and aggregation are shared with the Flask API in backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import crash_data  # noqa: E402
+from reports import DEFAULT_GRANULARITY, GRANULARITIES  # noqa: E402
 
 # =========================
-# Dash app
+# Load data
 # =========================
-app = Dash(__name__)
-server = app.server  # for deployment (gunicorn)
-
-borough_options = ["All"] + sorted([b for b in df["BOROUGH"].dropna().unique() if b != "UNKNOWN"])
-year_options = ["All"] + sorted(df["YEAR"].dropna().astype(int).unique().tolist())
-factor_options = ["All"]
-if "CONTRIBUTING FACTOR VEHICLE 1" in df.columns:
-    factor_options += sorted(df["CONTRIBUTING FACTOR VEHICLE 1"].dropna().unique().tolist())
-severity_options = ["All"] + sorted(df["SEVERITY"].dropna().unique().tolist())
+# The CSV is read on a background thread so the server (and its health check)
+# is up immediately; pandas and plotly are only imported once they are needed.
+# The callbacks work on row positions of the in-memory table, so this app
+# always uses the pandas backend.
+crash_data.start_loading(backend="pandas")
 
 # =========================
 # Dash app
 # =========================
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+app = Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    suppress_callback_exceptions=True,  # the layout changes once the data is loaded
+)
 server = app.server  # for deployment (gunicorn)
 
-borough_options = ["All"] + sorted([b for b in df["BOROUGH"].dropna().unique() if b != "UNKNOWN"])
-year_options = ["All"] + sorted(df["YEAR"].dropna().astype(int).unique().tolist())
-factor_options = ["All"]
-if "CONTRIBUTING FACTOR VEHICLE 1" in df.columns:
-    factor_options += sorted(df["CONTRIBUTING FACTOR VEHICLE 1"].dropna().unique().tolist())
-severity_options = ["All"] + sorted(df["SEVERITY"].dropna().unique().tolist())
+@server.route("/api/health")
+def health():
+    """Liveness, plus whether the data is loaded (ready) yet"""
+    return {"status": "ok", "ready": crash_data.is_ready(), "data": crash_data.status()}
 
 # Custom CSS for modern styling
 app.index_string = '''
@@ -426,285 +373,402 @@ app.index_string = '''
 </html>
 '''
 
-app.layout = html.Div(
-    style={"margin": "0", "padding": "0"},
-    children=[
-        # Header
-        html.Div(
-            className="navbar-top",
-            children=[
-                html.Div(
-                    style={"maxWidth": "1400px", "margin": "0 auto", "paddingLeft": "40px"},
-                    children=[
-                        html.H1("📊 NYC Motor Vehicle Collisions"),
-                        html.P("Interactive Dashboard - Explore and Analyze Crash Data"),
-                    ]
-                )
-            ]
-        ),
+def loading_layout():
+    """Shown while the data loads; reloads the page once it is ready"""
+    return html.Div(
+        className="main-container",
+        style={"maxWidth": "1400px", "margin": "0 auto", "textAlign": "center"},
+        children=[
+            html.H1("📊 NYC Motor Vehicle Collisions"),
+            html.P("⏳ Loading crash data…", id="loading-status", style={"marginTop": "20px"}),
+            dcc.Interval(id="loading-poll", interval=2000),
+            dcc.Location(id="loading-url", refresh=True),
+        ],
+    )
+
+
+def dashboard_layout():
+    from vehicles import types_in
+
+    df = crash_data.get_data()
+    borough_options = sorted([b for b in df["BOROUGH"].dropna().unique() if b != "UNKNOWN"])
+    year_options = sorted(df["YEAR"].dropna().astype(int).unique().tolist())
+    # Factors of any vehicle, from the factor index
+    factor_options = crash_data.get_index("factors")["factors"].tolist()
+    severity_options = sorted(df["SEVERITY"].dropna().unique().tolist())
+    vehicle_type_options = types_in(crash_data.get_index("vehicles")["bits"])
+    date_min = df["CRASH_DATE"].min().date()
+    date_max = df["CRASH_DATE"].max().date()
+
+    return html.Div(
+        style={"margin": "0", "padding": "0"},
+        children=[
+            # Header
+            html.Div(
+                className="navbar-top",
+                children=[
+                    html.Div(
+                        style={"maxWidth": "1400px", "margin": "0 auto", "paddingLeft": "40px"},
+                        children=[
+                            html.H1("📊 NYC Motor Vehicle Collisions"),
+                            html.P("Interactive Dashboard - Explore and Analyze Crash Data"),
+                        ]
+                    )
+                ]
+            ),
         
-        # Main Container
-        html.Div(
-            className="main-container",
-            style={"maxWidth": "1400px", "margin": "0 auto"},
-            children=[
-                # Filter Section
-                html.Div(
-                    className="filter-section",
-                    children=[
-                        html.H5("🎯 Filter & Search"),
+            # Main Container
+            html.Div(
+                className="main-container",
+                style={"maxWidth": "1400px", "margin": "0 auto"},
+                children=[
+                    # Filter Section
+                    html.Div(
+                        className="filter-section",
+                        children=[
+                            html.H5("🎯 Filter & Search"),
                         
-                        # Filter Group
-                        html.Div(
-                            className="filter-group",
-                            children=[
-                                html.Div(
-                                    className="filter-item",
-                                    children=[
-                                        html.Label("Borough"),
-                                        dcc.Dropdown(
-                                            id="filter-borough",
-                                            options=[{"label": b, "value": b} for b in borough_options],
-                                            value="All",
-                                            clearable=False,
-                                            searchable=True,
-                                        ),
-                                    ],
-                                ),
-                                html.Div(
-                                    className="filter-item",
-                                    children=[
-                                        html.Label("Year"),
-                                        dcc.Dropdown(
-                                            id="filter-year",
-                                            options=[{"label": str(y), "value": str(y)} for y in year_options],
-                                            value="All",
-                                            clearable=False,
-                                            searchable=True,
-                                        ),
-                                    ],
-                                ),
-                                html.Div(
-                                    className="filter-item",
-                                    children=[
-                                        html.Label("Contributing Factor"),
-                                        dcc.Dropdown(
-                                            id="filter-factor",
-                                            options=[{"label": f, "value": f} for f in factor_options],
-                                            value="All",
-                                            clearable=True,
-                                            searchable=True,
-                                        ),
-                                    ],
-                                ),
-                                html.Div(
-                                    className="filter-item",
-                                    children=[
-                                        html.Label("Severity"),
-                                        dcc.Dropdown(
-                                            id="filter-severity",
-                                            options=[{"label": s, "value": s} for s in severity_options],
-                                            value="All",
-                                            clearable=False,
-                                            searchable=True,
-                                        ),
-                                    ],
-                                ),
-                            ],
-                        ),
+                            # Filter Group
+                            html.Div(
+                                className="filter-group",
+                                children=[
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Borough"),
+                                            dcc.Dropdown(
+                                                id="filter-borough",
+                                                options=[{"label": b, "value": b} for b in borough_options],
+                                                value=[],
+                                                multi=True,
+                                                placeholder="All",
+                                                clearable=True,
+                                                searchable=True,
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Year"),
+                                            dcc.Dropdown(
+                                                id="filter-year",
+                                                options=[{"label": str(y), "value": str(y)} for y in year_options],
+                                                value=[],
+                                                multi=True,
+                                                placeholder="All",
+                                                clearable=True,
+                                                searchable=True,
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Contributing Factor"),
+                                            dcc.Dropdown(
+                                                id="filter-factor",
+                                                options=[{"label": f, "value": f} for f in factor_options],
+                                                value=[],
+                                                multi=True,
+                                                placeholder="All",
+                                                clearable=True,
+                                                searchable=True,
+                                            ),
+                                            dcc.RadioItems(
+                                                id="filter-factor-scope",
+                                                options=[
+                                                    {"label": " Vehicle 1", "value": "vehicle_1"},
+                                                    {"label": " Any vehicle", "value": "any_vehicle"},
+                                                ],
+                                                value="vehicle_1",
+                                                inline=True,
+                                                inputStyle={"marginLeft": "10px"},
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Severity"),
+                                            dcc.Dropdown(
+                                                id="filter-severity",
+                                                options=[{"label": s, "value": s} for s in severity_options],
+                                                value=[],
+                                                multi=True,
+                                                placeholder="All",
+                                                clearable=True,
+                                                searchable=True,
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Vehicle Type"),
+                                            dcc.Dropdown(
+                                                id="filter-vehicle-type",
+                                                options=[{"label": v, "value": v} for v in vehicle_type_options],
+                                                value=[],
+                                                multi=True,
+                                                placeholder="All",
+                                                clearable=True,
+                                                searchable=True,
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Date Range"),
+                                            dcc.DatePickerRange(
+                                                id="filter-dates",
+                                                min_date_allowed=date_min,
+                                                max_date_allowed=date_max,
+                                                start_date_placeholder_text="Start",
+                                                end_date_placeholder_text="End",
+                                                clearable=True,
+                                            ),
+                                        ],
+                                    ),
+                                    html.Div(
+                                        className="filter-item",
+                                        children=[
+                                            html.Label("Time Granularity"),
+                                            dcc.Dropdown(
+                                                id="filter-granularity",
+                                                options=[{"label": g.capitalize(), "value": g} for g in GRANULARITIES],
+                                                value=DEFAULT_GRANULARITY,
+                                                clearable=False,
+                                            ),
+                                        ],
+                                    ),
+                                ],
+                            ),
                         
-                        # Search Row
-                        html.Div(
-                            className="search-section",
-                            children=[
-                                html.Div(
-                                    className="search-input-wrapper",
-                                    children=[
-                                        html.Label("📝 Search Query (e.g., 'Brooklyn 2022 pedestrian')"),
-                                        dcc.Input(
-                                            id="search-query",
-                                            type="text",
-                                            placeholder="Type keywords to search across all fields…",
-                                        ),
-                                    ],
-                                ),
-                                html.Button(
-                                    "🔍 Generate Report",
-                                    id="btn-generate",
-                                    n_clicks=0,
-                                    className="btn-generate",
-                                ),
-                            ],
-                        ),
-                    ]
-                ),
+                            # Search Row
+                            html.Div(
+                                className="search-section",
+                                children=[
+                                    html.Div(
+                                        className="search-input-wrapper",
+                                        children=[
+                                            html.Label("📝 Search Query (e.g., 'Brooklyn 2022 pedestrian')"),
+                                            dcc.Input(
+                                                id="search-query",
+                                                type="text",
+                                                placeholder="Type keywords to search across all fields…",
+                                            ),
+                                        ],
+                                    ),
+                                    html.Button(
+                                        "🔍 Generate Report",
+                                        id="btn-generate",
+                                        n_clicks=0,
+                                        className="btn-generate",
+                                    ),
+                                ],
+                            ),
+                        ]
+                    ),
                 
-                # Summary Box
-                html.Div(
-                    id="summary-box",
-                    className="summary-box",
-                    style={"marginTop": "25px", "display": "none"},
-                ),
+                    # Summary Box
+                    html.Div(
+                        id="summary-box",
+                        className="summary-box",
+                        style={"marginTop": "25px", "display": "none"},
+                    ),
+
+                    # Key of the current selection in the server-side cache
+                    dcc.Store(id="selection"),
                 
-                # Charts Section
-                html.Div(
-                    className="charts-section",
-                    children=[
-                        html.Div(
-                            className="charts-grid",
-                            children=[
-                                html.Div(
-                                    className="chart-card",
-                                    children=[dcc.Graph(id="chart-borough")],
-                                ),
-                                html.Div(
-                                    className="chart-card",
-                                    children=[dcc.Graph(id="chart-time")],
-                                ),
-                                html.Div(
-                                    className="chart-card",
-                                    children=[dcc.Graph(id="chart-severity")],
-                                ),
-                                html.Div(
-                                    className="chart-card",
-                                    children=[dcc.Graph(id="chart-heatmap")],
-                                ),
-                            ],
-                        ),
-                    ]
-                ),
-            ]
-        ),
-    ]
+                    # Charts Section
+                    html.Div(
+                        className="charts-section",
+                        children=[
+                            html.Div(
+                                className="charts-grid",
+                                children=[
+                                    html.Div(
+                                        className="chart-card",
+                                        children=[dcc.Graph(id="chart-borough")],
+                                    ),
+                                    html.Div(
+                                        className="chart-card",
+                                        children=[dcc.Graph(id="chart-time")],
+                                    ),
+                                    html.Div(
+                                        className="chart-card",
+                                        children=[dcc.Graph(id="chart-severity")],
+                                    ),
+                                    html.Div(
+                                        className="chart-card",
+                                        children=[dcc.Graph(id="chart-heatmap")],
+                                    ),
+                                    html.Div(
+                                        className="chart-card",
+                                        children=[dcc.Graph(id="chart-factors")],
+                                    ),
+                                ],
+                            ),
+                        ]
+                    ),
+                ]
+            ),
+        ]
+    )
+
+
+def serve_layout():
+    # Called on every page load, so the dashboard appears as soon as the data is ready
+    if not crash_data.is_ready():
+        return loading_layout()
+    return dashboard_layout()
+
+
+app.layout = serve_layout
+
+
+@app.callback(
+    Output("loading-url", "href"),
+    Output("loading-status", "children"),
+    Input("loading-poll", "n_intervals"),
 )
+def poll_loading(n_intervals):
+    status = crash_data.status()
+    if status["state"] == "ready":
+        return "/", no_update
+    if status["state"] == "failed":
+        return no_update, f"❌ Could not load data: {status['error']}"
+    return no_update, f"⏳ Loading crash data… ({status['load_seconds'] or 0:.0f}s)"
 
 # =========================
-# Callback: Generate Report button updates all visuals
+# Server-side selection cache
+# =========================
+# "Generate Report" resolves the filters to a set of row positions once and
+# keeps it here. The browser only holds a small dcc.Store ("selection") with
+# the cache key and the normalized filters; each chart has its own callback
+# that reads the rows from this cache, and figures are memoized per key, so a
+# chart is only recomputed and re-sent when its own inputs change. The filters
+# travel with the key so that a worker that has not seen it can rebuild it.
+SELECTION_CACHE_SIZE = 16
+FIGURE_CACHE_SIZE = 64
+_selections = OrderedDict()
+_figures = OrderedDict()
+_cache_lock = threading.Lock()
+
+CHART_STYLE = dict(title_font_size=16, font_size=12, margin=dict(l=50, r=50, t=50, b=50))
+
+
+def _cached(cache, key, compute, max_size):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    value = compute()
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+    return value
+
+
+def selected_positions(selection):
+    from filters import filter_positions
+
+    return _cached(
+        _selections,
+        selection["key"],
+        lambda: filter_positions(crash_data.get_data(), **selection["filters"]),
+        SELECTION_CACHE_SIZE,
+    )
+
+
+def selected_rows(selection, columns):
+    """Only the given columns of the selected rows"""
+    df = crash_data.get_data()
+    columns = [c for c in columns if c in df.columns]
+    return df.iloc[selected_positions(selection), df.columns.get_indexer(columns)]
+
+
+def memoized_figure(chart, selection, build, *args):
+    return _cached(_figures, (chart, selection["key"]) + args, build, FIGURE_CACHE_SIZE)
+
+
+def empty_figure(title):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.update_layout(title=title, xaxis={"visible": False}, yaxis={"visible": False})
+    return fig
+
+
+# =========================
+# Callback: Generate Report button resolves the filters to a selection
 # =========================
 @app.callback(
-    [
-        Output("chart-borough", "figure"),
-        Output("chart-time", "figure"),
-        Output("chart-severity", "figure"),
-        Output("chart-heatmap", "figure"),
-        Output("summary-box", "children"),
-        Output("summary-box", "style"),
-    ],
+    Output("selection", "data"),
     Input("btn-generate", "n_clicks"),
     [
         State("filter-borough", "value"),
         State("filter-year", "value"),
         State("filter-factor", "value"),
+        State("filter-factor-scope", "value"),
         State("filter-severity", "value"),
+        State("filter-vehicle-type", "value"),
         State("search-query", "value"),
+        State("filter-dates", "start_date"),
+        State("filter-dates", "end_date"),
+        State("selection", "data"),
     ]
 )
-def update_report(n_clicks, borough, year, factor, severity, search_query):
-    # Apply filters & search
-    d = apply_filters(df, borough, year, factor, severity, search_query)
+def update_selection(n_clicks, borough, year, factor, factor_scope, severity, vehicle_type, search_query, start_date,
+                     end_date, current):
+    from filters import parse_filters
 
-    if d.empty:
-        empty_fig = go.Figure()
-        empty_fig.update_layout(
-            title="No data for selected filters",
-            xaxis={"visible": False},
-            yaxis={"visible": False}
-        )
-        empty_summary = html.Div("❌ No data found for this selection.", style={"padding": "20px"})
-        return empty_fig, empty_fig, empty_fig, empty_fig, empty_summary, {"display": "block"}
-
-    # Borough bar chart
-    borough_count = d["BOROUGH"].value_counts().reset_index()
-    borough_count.columns = ["BOROUGH", "COUNT"]
-    fig_borough = px.bar(
-        borough_count, 
-        x="BOROUGH", 
-        y="COUNT", 
-        title="Crashes by Borough",
-        color="COUNT",
-        color_continuous_scale="Viridis",
-        labels={"COUNT": "Number of Crashes"}
-    )
-    fig_borough.update_layout(
-        hovermode="x unified",
-        title_font_size=16,
-        font_size=12,
-        margin=dict(l=50, r=50, t=50, b=50),
-    )
+    filters = parse_filters({
+        "borough": borough,
+        "year": year,
+        "factor": factor,
+        "factor_scope": factor_scope,
+        "severity": severity,
+        "vehicle_type": vehicle_type,
+        "search_query": (search_query or "").strip(),
+        "start_date": start_date,
+        "end_date": end_date,
+    })
+    key = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()[:16]
+    if current and current.get("key") == key:
+        # Same selection as on screen: nothing downstream needs to run
+        return no_update
+    selection = {"key": key, "filters": filters}
+    selected_positions(selection)
+    return selection
 
-    # Time line chart (by month in selected year or overall)
-    d_time = d.copy()
-    d_time["MONTH"] = d_time["CRASH_DATE"].dt.to_period("M").astype(str)
-    monthly = d_time.groupby("MONTH")["NUMBER_OF_PERSONS_INJURED"].sum().reset_index()
-    fig_time = px.line(
-        monthly, 
-        x="MONTH", 
-        y="NUMBER_OF_PERSONS_INJURED",
-        title="Injured Persons Over Time",
-        markers=True,
-        labels={"NUMBER_OF_PERSONS_INJURED": "Total Injured"}
-    )
-    fig_time.update_traces(line=dict(color="#667eea", width=3), marker=dict(size=8))
-    fig_time.update_layout(
-        hovermode="x unified",
-        title_font_size=16,
-        font_size=12,
-        margin=dict(l=50, r=50, t=50, b=50),
-    )
 
-    # Severity pie chart
-    sev_count = d["SEVERITY"].value_counts().reset_index()
-    sev_count.columns = ["SEVERITY", "COUNT"]
-    fig_severity = px.pie(
-        sev_count, 
-        values="COUNT", 
-        names="SEVERITY",
-        title="Crash Severity Distribution",
-        color_discrete_map={
-            "Fatal": "#d62728",
-            "Injury": "#ff7f0e",
-            "No Injury": "#2ca02c"
-        }
-    )
-    fig_severity.update_layout(
-        title_font_size=16,
-        font_size=12,
-        margin=dict(l=50, r=50, t=50, b=50),
-    )
+# =========================
+# Callbacks: one per visual, each driven by the selection
+# =========================
+@app.callback(
+    Output("summary-box", "children"),
+    Output("summary-box", "style"),
+    Input("selection", "data"),
+)
+def update_summary(selection):
+    from reports import summarize
 
-    # Hour vs Day heatmap
-    if "HOUR" in d.columns:
-        heat = d.groupby(["DAY_OF_WEEK", "HOUR"]).size().reset_index(name="COUNT")
-        day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        heat["DAY_OF_WEEK"] = pd.Categorical(heat["DAY_OF_WEEK"], categories=day_order, ordered=True)
-        heat = heat.sort_values(["DAY_OF_WEEK", "HOUR"])
-        fig_heat = px.density_heatmap(
-            heat,
-            x="HOUR",
-            y="DAY_OF_WEEK",
-            z="COUNT",
-            title="Crash Density by Hour and Day",
-            nbinsx=24,
-            color_continuous_scale="RdYlBu_r",
-            labels={"COUNT": "Crash Count"}
-        )
-        fig_heat.update_layout(
-            title_font_size=16,
-            font_size=12,
-            margin=dict(l=50, r=50, t=50, b=50),
-        )
-    else:
-        fig_heat = go.Figure()
-        fig_heat.update_layout(
-            title="No HOUR information available",
-            xaxis={"visible": False},
-            yaxis={"visible": False}
-        )
+    if not selection:
+        return no_update, no_update
 
-    # Summary statistics
-    total_crashes = len(d)
-    total_injured = int(d["NUMBER_OF_PERSONS_INJURED"].sum()) if "NUMBER_OF_PERSONS_INJURED" in d.columns else 0
-    total_killed = int(d["NUMBER_OF_PERSONS_KILLED"].sum()) if "NUMBER_OF_PERSONS_KILLED" in d.columns else 0
+    d = selected_rows(selection, ["NUMBER_OF_PERSONS_INJURED", "NUMBER_OF_PERSONS_KILLED"])
+    if d.empty:
+        empty_summary = html.Div("❌ No data found for this selection.", style={"padding": "20px"})
+        return empty_summary, {"marginTop": "25px", "display": "block"}
+
+    summary = summarize(d)
+    total_crashes = summary["crashes"]
+    total_injured = summary["injured"]
+    total_killed = summary["killed"]
 
     summary_content = html.Div(
         style={"display": "flex", "alignItems": "center", "justifyContent": "space-around", "width": "100%", "flexWrap": "wrap"},
@@ -734,8 +798,157 @@ def update_report(n_clicks, borough, year, factor, severity, search_query):
             ),
         ]
     )
+    return summary_content, {"marginTop": "25px", "display": "flex"}
+
+
+@app.callback(Output("chart-borough", "figure"), Input("selection", "data"))
+def update_borough_chart(selection):
+    if not selection:
+        return no_update
+
+    def build():
+        import plotly.express as px
+        from reports import borough_counts
+
+        d = selected_rows(selection, ["BOROUGH"])
+        if d.empty:
+            return empty_figure("No data for selected filters")
+        fig = px.bar(
+            borough_counts(d),
+            x="BOROUGH",
+            y="COUNT",
+            title="Crashes by Borough",
+            color="COUNT",
+            color_continuous_scale="Viridis",
+            labels={"COUNT": "Number of Crashes"}
+        )
+        fig.update_layout(hovermode="x unified", **CHART_STYLE)
+        return fig
+
+    return memoized_figure("borough", selection, build)
+
+
+@app.callback(
+    Output("chart-time", "figure"),
+    Input("selection", "data"),
+    Input("filter-granularity", "value"),
+)
+def update_time_chart(selection, granularity):
+    from reports import injured_over_time
+
+    if not selection:
+        return no_update
+
+    granularity = granularity or DEFAULT_GRANULARITY
+    d = selected_rows(selection, ["CRASH_DATE", "NUMBER_OF_PERSONS_INJURED"])
+    if d.empty:
+        return empty_figure("No data for selected filters")
+
+    if callback_context.triggered_id == "filter-granularity":
+        # Same rows, new buckets: only send the new points and axis title
+        over_time = injured_over_time(d, granularity)
+        patch = Patch()
+        patch["data"][0]["x"] = over_time["PERIOD"].dt.strftime("%Y-%m-%d").tolist()
+        patch["data"][0]["y"] = over_time["NUMBER_OF_PERSONS_INJURED"].tolist()
+        patch["layout"]["xaxis"]["title"]["text"] = granularity.capitalize()
+        return patch
+
+    def build():
+        import plotly.express as px
+
+        fig = px.line(
+            injured_over_time(d, granularity),
+            x="PERIOD",
+            y="NUMBER_OF_PERSONS_INJURED",
+            title="Injured Persons Over Time",
+            markers=True,
+            labels={"NUMBER_OF_PERSONS_INJURED": "Total Injured", "PERIOD": granularity.capitalize()}
+        )
+        fig.update_traces(line=dict(color="#667eea", width=3), marker=dict(size=8))
+        fig.update_layout(hovermode="x unified", **CHART_STYLE)
+        return fig
+
+    return memoized_figure("time", selection, build, granularity)
+
+
+@app.callback(Output("chart-severity", "figure"), Input("selection", "data"))
+def update_severity_chart(selection):
+    if not selection:
+        return no_update
+
+    def build():
+        import plotly.express as px
+        from reports import severity_counts
+
+        d = selected_rows(selection, ["SEVERITY"])
+        if d.empty:
+            return empty_figure("No data for selected filters")
+        fig = px.pie(
+            severity_counts(d),
+            values="COUNT",
+            names="SEVERITY",
+            title="Crash Severity Distribution",
+            color_discrete_map={
+                "Fatal": "#d62728",
+                "Injury": "#ff7f0e",
+                "No Injury": "#2ca02c"
+            }
+        )
+        fig.update_layout(**CHART_STYLE)
+        return fig
+
+    return memoized_figure("severity", selection, build)
+
+
+@app.callback(Output("chart-heatmap", "figure"), Input("selection", "data"))
+def update_heatmap_chart(selection):
+    if not selection:
+        return no_update
+
+    def build():
+        import plotly.express as px
+        from reports import day_hour_counts
+
+        d = selected_rows(selection, ["DAY_OF_WEEK", "HOUR"])
+        if d.empty:
+            return empty_figure("No data for selected filters")
+        heat = day_hour_counts(d)
+        if heat is None:
+            return empty_figure("No HOUR information available")
+        fig = px.density_heatmap(
+            heat,
+            x="HOUR",
+            y="DAY_OF_WEEK",
+            z="COUNT",
+            title="Crash Density by Hour and Day",
+            nbinsx=24,
+            color_continuous_scale="RdYlBu_r",
+            labels={"COUNT": "Crash Count"}
+        )
+        fig.update_layout(**CHART_STYLE)
+        return fig
+
+    return memoized_figure("heatmap", selection, build)
+
+
+@app.callback(Output("chart-factors", "figure"), Input("selection", "data"))
+def update_factors_chart(selection):
+    if not selection:
+        return no_update
+
+    def build():
+        from factors import factor_counts
+        from reports import factor_figure
+
+        # Only the row labels are needed, the counts come from the factor index
+        counts = factor_counts(selected_rows(selection, []))
+        if counts is None or counts.empty:
+            return empty_figure("No data for selected filters")
+        fig = factor_figure(counts)
+        fig.update_layout(**CHART_STYLE)
+        return fig
 
-    return fig_borough, fig_time, fig_severity, fig_heat, summary_content, {"display": "flex"}
+    return memoized_figure("factors", selection, build)
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,176 @@
+"""Admission control for the data endpoints.
+
+Each request is put in a cost class before it runs. Every class has its own
+number of concurrent slots, a bounded queue of requests waiting for a slot
+and a deadline, so a burst of expensive queries cannot take the threads that
+cheap ones need. Over budget, a request is turned away straight away with
+429 (queue full) or 503 (no slot freed up in time) and a Retry-After, rather
+than piling up. All limits are per process.
+"""
+import math
+import threading
+import time
+
+# name -> concurrent requests, requests allowed to wait, seconds a request
+# may wait for a slot, seconds of work allowed once admitted (None: no limit)
+CLASSES = {
+    "light": {"limit": 6, "queue": 16, "wait": 2.0, "deadline": 10.0},
+    "heavy": {"limit": 2, "queue": 4, "wait": 5.0, "deadline": 30.0},
+    "export": {"limit": 2, "queue": 2, "wait": 1.0, "deadline": None},
+}
+
+# Estimated cost (rows scanned x passes over them) above which a query is heavy
+HEAVY_COST = 1_000_000
+
+# Filter passes per row: one per active filter dimension, and the search
+# query tests five columns
+SEARCH_PASSES = 5
+
+
+class Overloaded(Exception):
+    """The request was not admitted. `status` is 429 or 503."""
+
+    def __init__(self, klass, status, reason, retry_after):
+        super().__init__(reason)
+        self.klass = klass
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Raised by checkpoint() once the running request is past its deadline."""
+
+
+class _Gate:
+    def __init__(self, name, limit, queue, wait, deadline):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.deadline = deadline
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_wait_timeout": 0,
+            "deadline_exceeded": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "busy_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from the average time per request."""
+        with self._lock:
+            done = max(self.counters["admitted"] - self.counters["in_flight"], 1)
+            per_request = self.counters["busy_seconds"] / done
+            ahead = self.counters["waiting"] + 1
+        return max(1, math.ceil(per_request * ahead / self.limit))
+
+    def enter(self):
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.counters["waiting"] >= self.queue:
+                    self.counters["rejected_queue_full"] += 1
+                    full = True
+                else:
+                    self.counters["waiting"] += 1
+                    self.counters["queued"] += 1
+                    full = False
+            if full:
+                raise Overloaded(self.name, 429, f"Too many {self.name} requests waiting", self.retry_after())
+            acquired = self._slots.acquire(timeout=self.wait)
+            with self._lock:
+                self.counters["waiting"] -= 1
+                if not acquired:
+                    self.counters["rejected_wait_timeout"] += 1
+            if not acquired:
+                raise Overloaded(self.name, 503, f"No {self.name} slot freed up in {self.wait:g}s", self.retry_after())
+        waited = time.monotonic() - start
+        with self._lock:
+            self.counters["admitted"] += 1
+            self.counters["in_flight"] += 1
+            self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], round(waited, 3))
+        return Ticket(self)
+
+    def leave(self, started):
+        with self._lock:
+            self.counters["in_flight"] -= 1
+            self.counters["busy_seconds"] = round(self.counters["busy_seconds"] + time.monotonic() - started, 3)
+        self._slots.release()
+
+
+_gates = {name: _Gate(name, **settings) for name, settings in CLASSES.items()}
+_local = threading.local()
+
+
+class Ticket:
+    """A held slot. Release it exactly once, when the response is done."""
+
+    def __init__(self, gate):
+        self.gate = gate
+        self.started = time.monotonic()
+        self._released = False
+        _local.deadline = self.started + gate.deadline if gate.deadline else None
+        _local.gate = gate
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        _local.deadline = None
+        self.gate.leave(self.started)
+
+
+def checkpoint():
+    """Stop the current request with DeadlineExceeded if it ran out of time.
+
+    Called between the phases of a query; a no-op outside admitted requests.
+    """
+    deadline = getattr(_local, "deadline", None)
+    if deadline is not None and time.monotonic() > deadline:
+        gate = _local.gate
+        with gate._lock:
+            gate.counters["deadline_exceeded"] += 1
+        _local.deadline = None
+        raise DeadlineExceeded(f"Query exceeded the {gate.deadline:g}s deadline of {gate.name} requests")
+
+
+def estimate_cost(data, filters, passes=1):
+    """Rough cost of a query: rows in its date range x filter passes over them.
+
+    `data` is the crash table or a SqliteStore.
+    """
+    import pandas as pd
+    from filters import MULTI_FILTERS, date_bounds
+
+    bounds = date_bounds if isinstance(data, pd.DataFrame) else type(data).date_bounds
+    lo, hi = bounds(data, filters.get("start_date"), filters.get("end_date"))
+    filter_passes = sum(1 for key in MULTI_FILTERS if filters.get(key))
+    if filters.get("search_query"):
+        filter_passes += SEARCH_PASSES
+    return (hi - lo) * (filter_passes + passes)
+
+
+def classify(cost):
+    """"light" or "heavy" for a query of estimated `cost`."""
+    return "heavy" if cost > HEAVY_COST else "light"
+
+
+def admit(klass):
+    """Take a slot of class `klass`, waiting in its queue if needed. Raises Overloaded."""
+    return _gates[klass].enter()
+
+
+def stats():
+    """Per-class limits and counters, for /api/admission."""
+    out = {}
+    for name, gate in _gates.items():
+        with gate._lock:
+            out[name] = {**CLASSES[name], **gate.counters}
+    return {"heavy_cost": HEAVY_COST, "classes": out}
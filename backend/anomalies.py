@@ -0,0 +1,210 @@
+"""Weekly crash spikes per BOROUGH x contributing factor x SEVERITY.
+
+    python anomalies.py [--out FILE] [--window 12] [--z 3.0] [--min-count 5]
+
+Weekly counts of every series come out of the daily rollup (rollups.py) as
+one (series x weeks) matrix, in one bincount. Each week is compared with the
+`window` weeks before it: the trailing mean and standard deviation come from
+running sums along the week axis, so the baselines and z-scores of all
+series are computed together, without a loop per series. A week is flagged
+when its z-score reaches `z` and it has at least `min_count` crashes.
+
+The flagged weeks are written to ANOMALIES_PATH with the signature of the
+data they were computed from (bundle.data_signature) and the detection
+parameters. At load the app uses that file when both match, and recomputes
+otherwise; /api/anomalies sends the stored result as it is.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ANOMALIES_PATH = os.environ.get(
+    "ANOMALIES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "anomalies.json"),
+)
+
+WINDOW = 12         # weeks of baseline before each week
+Z_THRESHOLD = 3.0
+MIN_COUNT = 5       # fewer crashes than this in a week are never a spike
+# Floor of the baseline standard deviation: a series that was flat (often
+# all zeros) would otherwise flag its first crash
+MIN_STD = 1.0
+
+SERIES_DIMENSIONS = ["borough", "factor", "severity"]
+
+# Day numbers count from 1970-01-01, a Thursday: + 3 counts from a Monday
+_MONDAY_OFFSET = 3
+
+
+def weekly_counts(rollup):
+    """Crashes per series and week from the daily rollup.
+
+    Returns (counts, series, first_week): counts is a (series x weeks) int
+    matrix, series a frame with the borough / factor / severity of each row
+    (UNKNOWN where the value is missing), and first_week the Monday of column 0.
+    Only series with at least one crash are kept.
+    """
+    day = rollup["day"].astype(np.int64)
+    if not len(day):
+        return np.zeros((0, 0), dtype=np.int64), pd.DataFrame(columns=SERIES_DIMENSIONS), None
+    week = (day + _MONDAY_OFFSET) // 7
+    first, n_weeks = int(week.min()), int(week.max() - week.min() + 1)
+
+    # One code per (borough, factor, severity); missing values (-1) get the last slot
+    sizes = [len(rollup["categories"][name]) + 1 for name in SERIES_DIMENSIONS]
+    code = np.zeros(len(day), dtype=np.int64)
+    for name, size in zip(SERIES_DIMENSIONS, sizes):
+        values = rollup[name].astype(np.int64)
+        code = code * size + np.where(values < 0, size - 1, values)
+    codes, series_of = np.unique(code, return_inverse=True)
+    counts = np.bincount(series_of * n_weeks + (week - first), weights=rollup["crashes"],
+                         minlength=len(codes) * n_weeks).astype(np.int64).reshape(len(codes), n_weeks)
+
+    series = {}
+    for name, position in zip(SERIES_DIMENSIONS, np.unravel_index(codes, sizes)):
+        labels = np.append(rollup["categories"][name].astype(object).to_numpy(), "UNKNOWN")
+        series[name] = labels[position]
+    first_week = np.datetime64(first * 7 - _MONDAY_OFFSET, "D")
+    return counts, pd.DataFrame(series), first_week
+
+
+def rolling_zscores(counts, window=WINDOW, min_std=MIN_STD):
+    """Trailing baseline, standard deviation and z-score of every week of every series.
+
+    All three are (series x weeks) float matrices. Week t is compared with
+    weeks t - window .. t - 1; the first `window` weeks have no baseline
+    and are NaN.
+    """
+    values = counts.astype(np.float64)
+    zeros = np.zeros((len(values), 1))
+    # Window sums are differences of running sums along the week axis
+    s1 = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+    s2 = np.concatenate([zeros, np.cumsum(values * values, axis=1)], axis=1)
+    weeks = np.arange(window, values.shape[1])
+
+    baseline = np.full(values.shape, np.nan)
+    std = np.full(values.shape, np.nan)
+    total = s1[:, weeks] - s1[:, weeks - window]
+    squares = s2[:, weeks] - s2[:, weeks - window]
+    baseline[:, weeks] = total / window
+    # Whole counts keep the sums exact; dividing once keeps z exact at the threshold
+    std[:, weeks] = np.sqrt(np.maximum(window * squares - total * total, 0)) / window
+    z = (values - baseline) / np.maximum(std, min_std)
+    return baseline, std, z
+
+
+def parameters(window=WINDOW, z_threshold=Z_THRESHOLD, min_count=MIN_COUNT, min_std=MIN_STD):
+    """The detection parameters, as recorded in a result."""
+    return {"window": int(window), "z_threshold": float(z_threshold), "min_count": int(min_count),
+            "min_std": float(min_std)}
+
+
+def detect(rollup, window=WINDOW, z_threshold=Z_THRESHOLD, min_count=MIN_COUNT, min_std=MIN_STD):
+    """Flagged weeks of the rollup's series, newest first and by z-score within a week."""
+    counts, series, first_week = weekly_counts(rollup)
+    baseline, std, z = rolling_zscores(counts, window, min_std)
+    if counts.shape[1]:
+        # The last week is only complete when the data runs to its Sunday
+        last_day = int(rollup["day"].max())
+        if (last_day + _MONDAY_OFFSET) % 7 != 6:
+            z[:, -1] = np.nan
+    flagged = (z >= z_threshold) & (counts >= min_count)
+    rows, weeks = np.nonzero(flagged)
+    order = np.lexsort((-z[rows, weeks], -weeks))
+    rows, weeks = rows[order], weeks[order]
+
+    week_starts = (first_week + 7 * weeks).astype(str) if len(weeks) else []
+    anomalies = [
+        {"week": str(start), **{name: series[name].iat[r] for name in SERIES_DIMENSIONS},
+         "crashes": int(counts[r, w]), "baseline": round(float(baseline[r, w]), 2),
+         "std": round(float(std[r, w]), 2), "z": round(float(z[r, w]), 2)}
+        for start, r, w in zip(week_starts, rows.tolist(), weeks.tolist())
+    ]
+    return {
+        **parameters(window, z_threshold, min_count, min_std),
+        "series": int(counts.shape[0]),
+        "weeks": int(counts.shape[1]),
+        "first_week": str(first_week) if first_week is not None else None,
+        "anomalies": anomalies,
+    }
+
+
+def write_anomalies(result, path=ANOMALIES_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f, indent=1)
+    os.replace(tmp, path)
+
+
+def load_anomalies(df, path=ANOMALIES_PATH, **params):
+    """Index builder: the stored anomalies when they match `df` and the parameters, else computed from the daily rollup.
+
+    `params` are those of `detect`, the defaults when omitted. Returns
+    {"result", "encoded"}; `encoded` is the response body, serialized and
+    compressed once (compression.Encoded).
+    """
+    import crash_data
+    from bundle import data_signature
+    from compression import Encoded
+
+    signature = data_signature(df)
+    wanted = parameters(**params)
+    result = None
+    try:
+        with open(path) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if result is not None and result.get("data") != signature:
+        print(f"✗ Ignoring {path}: computed from other data")
+        result = None
+    if result is not None and {k: result.get(k) for k in wanted} != wanted:
+        print(f"✗ Ignoring {path}: computed with other parameters")
+        result = None
+    if result is None:
+        rollup = crash_data.get_index("daily")
+        if rollup is None:
+            from rollups import build_daily_rollup
+            rollup = build_daily_rollup(df)
+        result = dict(detect(rollup, **wanted), data=signature)
+    print(f"✓ Anomalies: {len(result['anomalies'])} flagged weeks over {result['series']} series")
+    return {"result": result, "encoded": Encoded(result)}
+
+
+def select(result, borough=None, factor=None, severity=None, limit=None):
+    """The flagged weeks of `result` matching the filters (one value or a list each), up to `limit`."""
+    from filters import as_value_list
+
+    wanted = {name: as_value_list(values) for name, values in
+              [("borough", borough), ("factor", factor), ("severity", severity)]}
+    anomalies = [a for a in result["anomalies"]
+                 if all(not values or str(a[name]) in values for name, values in wanted.items())]
+    return dict(result, anomalies=anomalies[:limit] if limit else anomalies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default=ANOMALIES_PATH, help="where to write the anomalies (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=WINDOW, help="weeks of baseline")
+    parser.add_argument("--z", type=float, default=Z_THRESHOLD, help="z-score that flags a week")
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT, help="fewest crashes in a flagged week")
+    args = parser.parse_args()
+
+    import crash_data
+    from bundle import data_signature
+    from rollups import build_daily_rollup
+
+    df = crash_data.load_data()
+    result = dict(detect(build_daily_rollup(df), args.window, args.z, args.min_count), data=data_signature(df))
+    write_anomalies(result, args.out)
+    print(f"✓ Wrote {len(result['anomalies'])} flagged weeks over {result['series']} series "
+          f"and {result['weeks']} weeks to {args.out}")
+    if parameters(args.window, args.z, args.min_count) != parameters():
+        print("✗ Not the default parameters: the app ignores this file and recomputes with the defaults")
+
+
+if __name__ == "__main__":
+    main()
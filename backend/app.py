@@ -1,220 +1,624 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import gzip
 import json
+import threading
 from datetime import datetime
+from functools import wraps
 
-app = Flask(__name__)
-CORS(app)
-
-# Load data
-import os
-
-# Try multiple paths for CSV file
-possible_paths = [
-    os.path.join(os.path.dirname(__file__), "integrated_crashes_for_app.csv"),
-    os.path.join(os.path.dirname(__file__), "..", "integrated_crashes_for_app.csv"),
-    "integrated_crashes_for_app.csv"
-]
-
-csv_path = None
-for path in possible_paths:
-    if os.path.exists(path):
-        csv_path = path
-        print(f"✓ Found CSV at: {csv_path}")
-        break
-
-if csv_path is None:
-    print(f"✗ CSV not found. Tried: {possible_paths}")
-    raise FileNotFoundError(f"CSV file not found. Tried: {possible_paths}")
-
-df = pd.read_csv(csv_path, parse_dates=["CRASH_DATE"], low_memory=False)
-print(f"✓ Loaded CSV from: {csv_path} - {len(df)} rows")
-
-# Ensure columns exist
-if "BOROUGH" not in df.columns:
-    df["BOROUGH"] = "UNKNOWN"
-
-if "YEAR" not in df.columns:
-    df["YEAR"] = df["CRASH_DATE"].dt.year
-
-if "HOUR" not in df.columns and "CRASH_TIME" in df.columns:
-    df["HOUR"] = pd.to_datetime(df["CRASH_TIME"], format="%H:%M", errors="coerce").dt.hour
-
-if "DAY_OF_WEEK" not in df.columns:
-    df["DAY_OF_WEEK"] = df["CRASH_DATE"].dt.day_name()
-
-if "SEVERITY" not in df.columns:
-    def classify_severity(row):
-        if row.get("NUMBER_OF_PERSONS_KILLED", 0) > 0:
-            return "Fatal"
-        elif row.get("NUMBER_OF_PERSONS_INJURED", 0) > 0:
-            return "Injury"
-        else:
-            return "No Injury"
-    df["SEVERITY"] = df.apply(classify_severity, axis=1)
-
-# Helper function to apply filters
-def apply_filters(data, borough=None, year=None, factor=None, severity=None, search_query=None):
-    d = data.copy()
-
-    if borough and borough != "All":
-        d = d[d["BOROUGH"] == borough]
+import compression
+import crash_data
+import report_cache
 
-    if year and year != "All":
-        d = d[d["YEAR"] == int(year)]
+# pandas, plotly and the query modules (filters, reports, export) are imported
+# inside the handlers: importing this module only pulls in Flask, so gunicorn
+# can start answering /api/health right away while the CSV loads in the
+# background.
 
-    if factor and factor != "All" and "CONTRIBUTING FACTOR VEHICLE 1" in d.columns:
-        d = d[d["CONTRIBUTING FACTOR VEHICLE 1"] == factor]
-
-    if severity and severity != "All" and "SEVERITY" in d.columns:
-        d = d[d["SEVERITY"] == severity]
-
-    if search_query and search_query.strip():
-        q = search_query.strip().lower()
-        mask = (
-            d["BOROUGH"].fillna("").str.lower().str.contains(q)
-            | d.get("PERSON_TYPES", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d.get("PERSON_INJURIES", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d.get("CONTRIBUTING FACTOR VEHICLE 1", pd.Series("", index=d.index)).fillna("").str.lower().str.contains(q)
-            | d["YEAR"].astype(str).str.contains(q)
-        )
-        d = d[mask]
+app = Flask(__name__)
+CORS(app)
 
-    return d
+# Load data in the background
+crash_data.start_loading()
+
+@app.after_request
+def compress_response(response):
+    """gzip / brotli JSON responses the client accepts (see compression.py)"""
+    return compression.compress_response(response, request.accept_encodings)
+
+def requires_data(view):
+    """Answer 503 + Retry-After (or 500 if loading failed) until the data is ready"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not crash_data.is_ready():
+            status = crash_data.status()
+            if status["state"] == "failed":
+                return jsonify({"error": "Data not loaded", "data": status}), 500
+            response = jsonify({"error": "Data is still loading, retry shortly", "data": status})
+            response.status_code = 503
+            response.headers["Retry-After"] = "5"
+            return response
+        return view(*args, **kwargs)
+    return wrapper
+
+def requires_table(view):
+    """Answer 501 with QUERY_BACKEND=sqlite: the view works on the in-memory table"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if crash_data.query_backend() != "pandas":
+            return jsonify({"error": f"{request.path} needs the in-memory table (QUERY_BACKEND=pandas)"}), 501
+        return view(*args, **kwargs)
+    return wrapper
+
+def query_source():
+    """What the filters run on: the in-memory table, or the SqliteStore"""
+    return crash_data.get_store() if crash_data.query_backend() == "sqlite" else crash_data.get_data()
+
+def admitted(cost_class):
+    """Run the view only once admission control gives it a slot (see admission.py).
+
+    `cost_class(payload)` names the class of the request. Over budget the
+    request gets 429/503 with Retry-After; a streamed response keeps its slot
+    until the stream is closed.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            import admission
+
+            try:
+                ticket = admission.admit(cost_class(request_payload()))
+            except admission.Overloaded as e:
+                return overloaded(e.reason, e.status, e.retry_after, e.klass)
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except admission.DeadlineExceeded as e:
+                ticket.release()
+                return overloaded(str(e), 503, ticket.gate.retry_after(), ticket.gate.name)
+            except Exception:
+                ticket.release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+        return wrapper
+    return decorator
+
+def overloaded(reason, status, retry_after, klass):
+    response = jsonify({"error": reason, "class": klass})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def light(payload):
+    return "light"
+
+def filtered_query(passes):
+    """Cost class of a query scanning the filtered rows `passes` times"""
+    def cost_class(payload):
+        import admission
+        from filters import parse_filters
+
+        try:
+            filters = parse_filters(payload)
+        except ValueError:
+            return "light"   # answered with a 400 right away
+        return admission.classify(admission.estimate_cost(query_source(), filters, passes))
+    return cost_class
+
+def report_class(payload):
+    if payload.get("mode") == "approximate":
+        return "light"
+    if is_precomputed(payload):
+        return "light"   # answered from the bundle or the report cache
+    # Aggregations on top of the filter scan
+    return filtered_query(passes=4)(payload)
+
+def is_precomputed(payload):
+    """Is this report request answered from the bundle or the report cache"""
+    from filters import parse_filters
+    from reports import DEFAULT_GRANULARITY
+
+    granularity = payload.get("granularity", DEFAULT_GRANULARITY)
+    try:
+        filters = parse_filters(payload)
+    except ValueError:
+        return False
+    if bundled_report(filters, granularity):
+        return True
+    return report_cache.peek(report_cache.report_key(filters, granularity)) is not None
+
+def compare_class(payload):
+    import admission
+    from compare import parse_variants
+
+    try:
+        variants = parse_variants(payload)
+    except ValueError:
+        return "light"
+    data = query_source()
+    return admission.classify(sum(admission.estimate_cost(data, filters, passes=4) for _, filters in variants))
+
+def request_payload():
+    """JSON body, or the query string with repeated keys collected into lists"""
+    data = request.get_json(silent=True)
+    if data is not None:
+        return data
+    return {key: values if len(values) > 1 else values[0] for key, values in request.args.lists()}
 
 # ========================
 # API Routes
 # ========================
 
 @app.route('/api/filters', methods=['GET'])
+@requires_data
+@admitted(light)
 def get_filters():
     """Get available filter options"""
-    borough_options = ["All"] + sorted([b for b in df["BOROUGH"].dropna().unique() if b != "UNKNOWN"])
-    year_options = ["All"] + sorted(df["YEAR"].dropna().astype(int).unique().tolist())
-    factor_options = ["All"]
-    if "CONTRIBUTING FACTOR VEHICLE 1" in df.columns:
-        factor_options += sorted(df["CONTRIBUTING FACTOR VEHICLE 1"].dropna().unique().tolist())
-    severity_options = ["All"] + sorted(df["SEVERITY"].dropna().unique().tolist())
+    from factors import FACTOR_SCOPES
+    from reports import GRANULARITIES
+    from vehicles import types_in
+
+    if crash_data.query_backend() == "sqlite":
+        options = crash_data.get_store().filter_options()
+        borough_options = ["All"] + options["boroughs"]
+        year_options = ["All"] + options["years"]
+        factor_options = ["All"] + options["factors"]
+        severity_options = ["All"] + options["severities"]
+        vehicle_type_options = ["All"] + options["vehicle_types"]
+        date_range = options["date_range"]
+    else:
+        df = crash_data.get_data()
+        borough_options = ["All"] + sorted([b for b in df["BOROUGH"].dropna().unique() if b != "UNKNOWN"])
+        year_options = ["All"] + sorted(df["YEAR"].dropna().astype(int).unique().tolist())
+        # Factors of any vehicle, from the factor index
+        factor_options = ["All"] + crash_data.get_index("factors")["factors"].tolist()
+        severity_options = ["All"] + sorted(df["SEVERITY"].dropna().unique().tolist())
+        vehicle_type_options = ["All"] + types_in(crash_data.get_index("vehicles")["bits"])
+        dates = df["CRASH_DATE"].dropna()
+        date_range = {
+            "min": dates.iloc[0].strftime("%Y-%m-%d") if len(dates) else None,
+            "max": dates.iloc[-1].strftime("%Y-%m-%d") if len(dates) else None,
+        }
 
     return jsonify({
         "boroughs": borough_options,
         "years": [str(y) for y in year_options],
         "factors": factor_options,
-        "severities": severity_options
+        "factor_scopes": FACTOR_SCOPES,
+        "severities": severity_options,
+        "vehicle_types": vehicle_type_options,
+        "date_range": date_range,
+        "granularities": GRANULARITIES
     })
 
+REPORT_MODES = ["exact", "approximate", "progressive"]
+
+def report_parts(filters, granularity):
+    """The summary, then each chart figure as soon as it is built.
+
+    Yields ("summary", summary) and (chart name, figure) pairs; stops after
+    the summary when no rows match.
+    """
+    from filters import apply_filters
+    from reports import chart_json, iter_series
+
+    import admission
+
+    if crash_data.query_backend() == "sqlite":
+        # Every aggregate is one SQL query on the store
+        parts = crash_data.get_store().iter_series(granularity, **filters)
+    else:
+        filtered_df = apply_filters(crash_data.get_data(), **filters)
+        admission.checkpoint()
+        parts = iter_series(filtered_df, granularity)
+    for name, aggregate in parts:
+        if name == "summary":
+            yield name, aggregate
+            if aggregate["crashes"] == 0:
+                return
+            continue
+        admission.checkpoint()
+        figure = chart_json(name, aggregate, granularity)
+        if figure is not None:
+            yield name, figure
+
+def exact_report(filters, granularity):
+    """Report body computed from all matching rows"""
+    body = {"charts": {}}
+    for name, value in report_parts(filters, granularity):
+        if name == "summary":
+            body["summary"] = value
+        else:
+            body["charts"][name] = value
+    if body["summary"]["crashes"] == 0:
+        body["error"] = "No data found for selected filters"
+    return body
+
+def bundled_report(filters, granularity):
+    """Path of the pre-rendered report for these filters (see bundle.py), or None"""
+    from bundle import bundled_file
+
+    return bundled_file(crash_data.get_index("bundle"), filters, granularity)
+
+def send_bundled(path):
+    """Send a gzipped bundle file as is when the client accepts gzip, else inflated"""
+    if "gzip" in request.accept_encodings:
+        response = send_file(path, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        with gzip.open(path, "rb") as f:
+            response = Response(f.read(), mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def send_encoded(entry):
+    """Send a pre-encoded body as stored, in the encoding the client accepts"""
+    data, encoding = entry.pick(compression.negotiate(request.accept_encodings))
+    response = Response(data, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+def encoded_report(filters, granularity):
+    """exact_report serialized and compressed once (a compression.Encoded)"""
+    return compression.Encoded(exact_report(filters, granularity))
+
+def cached_report(filters, granularity):
+    """Encoded exact_report from the report cache, counting the request towards warm-up"""
+    key = report_cache.report_key(filters, granularity)
+    report_cache.record(key)
+    return report_cache.get_or_compute(key, lambda: encoded_report(filters, granularity))
+
+def approximate_report(filters, granularity):
+    """Report body estimated from the stratified sample, with 95% error bounds"""
+    from reports import build_charts
+    from sampling import approximate_series
+
+    sample = crash_data.get_index("sample")
+    series, error_bounds, sample_rows = approximate_series(sample, granularity, **filters)
+    body = {
+        "approximate": True,
+        "error_bounds": error_bounds,
+        "sample": {"rows": sample_rows, "fraction": sample["fraction"]},
+        "summary": series["summary"]
+    }
+    if sample_rows == 0:
+        body.update(error="No sampled rows match the selected filters", charts={})
+    else:
+        body["charts"] = build_charts(series, granularity)
+    return body
+
 @app.route('/api/report', methods=['POST'])
+@requires_data
+@admitted(report_class)
 def generate_report():
-    """Generate report with filters and charts"""
+    """Generate report with filters and charts.
+
+    mode "exact" (default) scans all rows, "approximate" answers from the
+    stratified sample, and "progressive" streams both as NDJSON lines: the
+    approximate report first, then the exact one.
+    """
+    from filters import parse_filters
+    from reports import DEFAULT_GRANULARITY, GRANULARITIES
+
     data = request.json
-    borough = data.get("borough", "All")
-    year = data.get("year", "All")
-    factor = data.get("factor", "All")
-    severity = data.get("severity", "All")
-    search_query = data.get("search_query", "")
+    granularity = data.get("granularity", DEFAULT_GRANULARITY)
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"Unknown granularity '{granularity}'"}), 400
+    mode = data.get("mode", "exact")
+    if mode not in REPORT_MODES:
+        return jsonify({"error": f"Unknown mode '{mode}'. Use one of: {', '.join(REPORT_MODES)}"}), 400
 
     # Apply filters
-    filtered_df = apply_filters(df, borough, year, factor, severity, search_query)
-
-    if filtered_df.empty:
-        return jsonify({
-            "error": "No data found for selected filters",
-            "charts": {},
-            "summary": {"crashes": 0, "injured": 0, "killed": 0}
-        }), 200
-
-    # Borough bar chart
-    borough_count = filtered_df["BOROUGH"].value_counts().reset_index()
-    borough_count.columns = ["BOROUGH", "COUNT"]
-    fig_borough = px.bar(
-        borough_count,
-        x="BOROUGH",
-        y="COUNT",
-        title="Crashes by Borough",
-        color="COUNT",
-        color_continuous_scale="Viridis",
-        labels={"COUNT": "Number of Crashes"}
-    )
-    fig_borough.update_layout(hovermode="x unified", showlegend=False, height=400)
-
-    # Time line chart
-    d_time = filtered_df.copy()
-    d_time["MONTH"] = d_time["CRASH_DATE"].dt.to_period("M").astype(str)
-    monthly = d_time.groupby("MONTH")["NUMBER_OF_PERSONS_INJURED"].sum().reset_index()
-    fig_time = px.line(
-        monthly,
-        x="MONTH",
-        y="NUMBER_OF_PERSONS_INJURED",
-        title="Injured Persons Over Time",
-        markers=True,
-        labels={"NUMBER_OF_PERSONS_INJURED": "Total Injured"}
-    )
-    fig_time.update_traces(line=dict(color="#667eea", width=3), marker=dict(size=8))
-    fig_time.update_layout(hovermode="x unified", height=400)
-
-    # Severity pie chart
-    sev_count = filtered_df["SEVERITY"].value_counts().reset_index()
-    sev_count.columns = ["SEVERITY", "COUNT"]
-    fig_severity = px.pie(
-        sev_count,
-        values="COUNT",
-        names="SEVERITY",
-        title="Crash Severity Distribution",
-        color_discrete_map={
-            "Fatal": "#d62728",
-            "Injury": "#ff7f0e",
-            "No Injury": "#2ca02c"
-        }
+    try:
+        filters = parse_filters(data)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    sampled = crash_data.get_index("sample") is not None
+    if mode == "approximate":
+        if not sampled:
+            return jsonify({"error": "Approximate reports need the in-memory table (QUERY_BACKEND=pandas)"}), 501
+        return jsonify(approximate_report(filters, granularity))
+    bundled = bundled_report(filters, granularity)
+    if mode == "progressive":
+        def generate():
+            import admission
+
+            if bundled:
+                with gzip.open(bundled, "rb") as f:
+                    yield f.read().decode() + "\n"
+                return
+            # With the exact report cached (or no sample) there is nothing to estimate
+            if sampled and report_cache.peek(report_cache.report_key(filters, granularity)) is None:
+                yield json.dumps(approximate_report(filters, granularity)) + "\n"
+            try:
+                yield cached_report(filters, granularity).identity.decode() + "\n"
+            except admission.DeadlineExceeded as e:
+                # The estimate is already out, end the stream with the reason
+                yield json.dumps({"error": str(e), "deadline_exceeded": True}) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    if bundled:
+        return send_bundled(bundled)
+    return send_encoded(cached_report(filters, granularity))
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/report/stream', methods=['GET', 'POST'])
+@requires_data
+@admitted(report_class)
+def stream_report():
+    """Exact report as Server-Sent Events, each part sent as soon as it is computed.
+
+    Events: "approximate" (the approximate_report from the stratified sample,
+    when there is a sample and the exact report is not bundled or cached),
+    then "summary", one "chart" ({"name", "figure"}) per chart, and "done".
+    A report with no matching rows, or one that runs out of time, ends with
+    an "error" event instead.
+    """
+    from filters import parse_filters
+    from reports import DEFAULT_GRANULARITY, GRANULARITIES
+
+    data = request_payload()
+    granularity = data.get("granularity", DEFAULT_GRANULARITY)
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"Unknown granularity '{granularity}'"}), 400
+    try:
+        filters = parse_filters(data)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter value: {e}"}), 400
+
+    key = report_cache.report_key(filters, granularity)
+    report_cache.record(key)
+    bundled = bundled_report(filters, granularity)
+
+    def generate():
+        import admission
+
+        if bundled:
+            with gzip.open(bundled, "rb") as f:
+                ready = json.loads(f.read())
+        else:
+            cached = report_cache.peek(key)
+            ready = cached.body if cached is not None else None
+        if ready is not None:
+            parts = [("summary", ready["summary"]), *ready["charts"].items()]
+        else:
+            parts = report_parts(filters, granularity)
+
+        body = {"charts": {}}
+        try:
+            # An estimate to draw while the exact parts are computed
+            if ready is None and crash_data.get_index("sample") is not None:
+                yield sse("approximate", approximate_report(filters, granularity))
+            for name, value in parts:
+                if name == "summary":
+                    body["summary"] = value
+                    yield sse("summary", value)
+                else:
+                    body["charts"][name] = value
+                    yield sse("chart", {"name": name, "figure": value})
+        except admission.DeadlineExceeded as e:
+            yield sse("error", {"error": str(e), "deadline_exceeded": True})
+            return
+        if body["summary"]["crashes"] == 0:
+            body["error"] = "No data found for selected filters"
+            yield sse("error", {"error": body["error"]})
+        else:
+            yield sse("done", {"charts": list(body["charts"]), "cached": ready is not None})
+        if ready is None:
+            report_cache.get_or_compute(key, lambda: compression.Encoded(body))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    fig_severity.update_layout(height=400)
-
-    # Hour vs Day heatmap
-    if "HOUR" in filtered_df.columns:
-        heat = filtered_df.groupby(["DAY_OF_WEEK", "HOUR"]).size().reset_index(name="COUNT")
-        day_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        heat["DAY_OF_WEEK"] = pd.Categorical(heat["DAY_OF_WEEK"], categories=day_order, ordered=True)
-        heat = heat.sort_values(["DAY_OF_WEEK", "HOUR"])
-        fig_heat = px.density_heatmap(
-            heat,
-            x="HOUR",
-            y="DAY_OF_WEEK",
-            z="COUNT",
-            title="Crash Density by Hour and Day",
-            nbinsx=24,
-            color_continuous_scale="RdYlBu_r",
-            labels={"COUNT": "Crash Count"}
+
+@app.route('/api/compare', methods=['POST'])
+@requires_data
+@requires_table
+@admitted(compare_class)
+def compare_reports():
+    """Summaries and chart series for several filter sets, computed in one pass"""
+    import admission
+    from compare import comparison_charts, compare_series, parse_variants, series_json
+    from reports import DEFAULT_GRANULARITY, GRANULARITIES
+
+    data = request.json or {}
+    granularity = data.get("granularity", DEFAULT_GRANULARITY)
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"Unknown granularity '{granularity}'"}), 400
+    try:
+        variants = parse_variants(data)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid comparison: {e}"}), 400
+
+    results = compare_series(crash_data.get_data(), variants, granularity)
+    admission.checkpoint()
+    names = [name for name, _ in variants]
+    body = {
+        "variants": [
+            {"name": name, "filters": filters, **series_json(series)}
+            for (name, filters), series in zip(variants, results)
+        ]
+    }
+    if data.get("charts", True):
+        body["charts"] = comparison_charts(names, results, granularity)
+    return jsonify(body)
+
+@app.route('/api/pivot', methods=['GET', 'POST'])
+@requires_data
+@requires_table
+@admitted(filtered_query(passes=3))
+def pivot_table():
+    """Group the filtered rows by up to three dimensions and aggregate measures"""
+    from filters import parse_filters
+    from pivot import parse_pivot, pivot
+
+    data = request_payload()
+    try:
+        result = pivot(crash_data.get_data(), **parse_pivot(data), **parse_filters(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+def hotspots_class(payload):
+    from filters import parse_filters
+    from hotspots import is_partitioned
+
+    try:
+        filters = parse_filters(payload)
+    except ValueError:
+        return "light"
+    if is_partitioned(filters):
+        return "light"   # merged from the per-partition counts
+    return filtered_query(passes=2)(payload)
+
+@app.route('/api/hotspots', methods=['GET', 'POST'])
+@requires_data
+@requires_table
+@admitted(hotspots_class)
+def top_hotspots():
+    """Top-K streets or intersections by crashes, injured or killed"""
+    from filters import parse_filters
+    from hotspots import hotspots, parse_hotspots
+
+    data = request_payload()
+    try:
+        result = hotspots(crash_data.get_data(), **parse_hotspots(data), **parse_filters(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/anomalies', methods=['GET', 'POST'])
+@requires_data
+@requires_table
+@admitted(light)
+def anomalies():
+    """Weeks with a crash spike per borough x factor x severity, precomputed at load (anomalies.py)"""
+    from anomalies import select
+
+    index = crash_data.get_index("anomalies")
+    data = request_payload()
+    wanted = {name: data.get(name) for name in ("borough", "factor", "severity", "limit")}
+    if not any(v not in (None, "", "All", []) for v in wanted.values()):
+        return send_encoded(index["encoded"])
+    try:
+        limit = int(wanted.pop("limit") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(select(index["result"], limit=max(limit, 0), **wanted))
+
+@app.route('/api/export', methods=['GET', 'POST'])
+@requires_data
+@admitted(lambda payload: "export")
+def export_rows():
+    """Stream the filtered crash rows as CSV, NDJSON or Arrow IPC"""
+    from filters import parse_filters
+    from export import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, stream_export
+
+    data = request_payload()
+    fmt = data.get("format", "csv")
+
+    try:
+        chunks = stream_export(
+            query_source(),
+            fmt,
+            columns=data.get("columns"),
+            chunk_size=data.get("chunk_size", DEFAULT_CHUNK_SIZE),
+            **parse_filters(data),
         )
-        fig_heat.update_layout(height=400)
-    else:
-        fig_heat = go.Figure()
-        fig_heat.update_layout(title="No HOUR information available")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=crashes.{extension}"},
+    )
 
-    # Summary stats
-    total_crashes = len(filtered_df)
-    total_injured = int(filtered_df["NUMBER_OF_PERSONS_INJURED"].sum()) if "NUMBER_OF_PERSONS_INJURED" in filtered_df.columns else 0
-    total_killed = int(filtered_df["NUMBER_OF_PERSONS_KILLED"].sum()) if "NUMBER_OF_PERSONS_KILLED" in filtered_df.columns else 0
+TREND_VIEWS = {
+    "rolling": "rolling_series",
+    "yoy": "year_over_year",
+    "weekday": "weekday_profile",
+}
+
+@app.route('/api/trends/<view>', methods=['GET', 'POST'])
+@requires_data
+@requires_table
+@admitted(light)
+def trends(view):
+    """Rolling average, year-over-year or weekday profile, from the daily rollup"""
+    import rollups
+    from filters import parse_filters
+
+    if view not in TREND_VIEWS:
+        return jsonify({"error": f"Unknown trend '{view}'. Use one of: {', '.join(TREND_VIEWS)}"}), 400
+    data = request_payload()
+    options = {"metric": data.get("metric", "crashes")}
+    try:
+        if view == "rolling":
+            options["window"] = int(data.get("window", rollups.DEFAULT_WINDOW))
+            if not 1 <= options["window"] <= rollups.MAX_WINDOW:
+                raise ValueError(f"window must be between 1 and {rollups.MAX_WINDOW} days")
+        result = getattr(rollups, TREND_VIEWS[view])(crash_data.get_index("daily"), **options, **parse_filters(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@app.route('/api/collision/<int:collision_id>', methods=['GET'])
+@requires_data
+@requires_table
+@admitted(light)
+def collision(collision_id):
+    """Crash attributes and persons involved for one COLLISION_ID"""
+    from persons import collision_detail
+
+    detail = collision_detail(crash_data.get_data(), crash_data.get_index("collisions"), collision_id)
+    if detail is None:
+        return jsonify({"error": f"Collision {collision_id} not found"}), 404
+    return jsonify(detail)
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Liveness: the process is up. Also reports data readiness, always 200"""
     return jsonify({
-        "charts": {
-            "borough": json.loads(fig_borough.to_json()),
-            "time": json.loads(fig_time.to_json()),
-            "severity": json.loads(fig_severity.to_json()),
-            "heatmap": json.loads(fig_heat.to_json())
-        },
-        "summary": {
-            "crashes": total_crashes,
-            "injured": total_injured,
-            "killed": total_killed
-        }
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "ready": crash_data.is_ready(),
+        "data": crash_data.status()
     })
 
-@app.route('/api/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({"status": "ok", "timestamp": datetime.now().isoformat()})
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Report cache size, hits and misses, and warm-up progress"""
+    return jsonify(report_cache.status())
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    """Admission control limits and counters per cost class"""
+    import admission
+
+    return jsonify(admission.stats())
+
+@app.route('/api/health/ready', methods=['GET'])
+def readiness():
+    """Readiness: 200 once rows are loaded, indexes built and popular reports warmed, 503 before"""
+    status = crash_data.status()
+    ready = crash_data.is_ready() and report_cache.warmup_finished()
+    state = "ready" if ready else ("warming" if crash_data.is_ready() else status["state"])
+    response = jsonify({"status": state, "data": status, "cache": report_cache.status()["warmup"]})
+    response.status_code = 200 if ready else 503
+    if not ready:
+        response.headers["Retry-After"] = "5"
+    return response
 
 @app.route('/', methods=['GET'])
 def index():
@@ -223,11 +627,32 @@ def index():
         "name": "NYC Motor Vehicle Collisions API",
         "version": "1.0.0",
         "endpoints": {
-            "/api/health": "Health check",
+            "/api/health": "Liveness check with data loading status",
+            "/api/health/ready": "Readiness check (503 until data is loaded)",
+            "/api/admission": "Admission control limits and counters",
+            "/api/cache": "Report cache counters and warm-up progress",
             "/api/filters": "Get available filter options",
-            "/api/report": "Generate report with charts (POST)"
+            "/api/report": "Generate report with charts (POST)",
+            "/api/report/stream": "Report as Server-Sent Events, one event per chart",
+            "/api/compare": "Side-by-side reports for several filter sets (POST)",
+            "/api/pivot": "Counts and totals grouped by up to three dimensions",
+            "/api/export": "Stream filtered rows as CSV, NDJSON or Arrow",
+            "/api/trends/<rolling|yoy|weekday>": "Daily trends from the precomputed rollup",
+            "/api/anomalies": "Weekly crash spikes per borough, factor and severity",
+            "/api/collision/<id>": "One crash and the persons involved"
         }
     })
 
+# ========================
+# Report cache warm-up
+# ========================
+
+def warm_report_cache():
+    """Once the data is loaded, precompute the reports most requested before the last restart"""
+    if crash_data.wait_ready():
+        report_cache.warm_up(encoded_report)
+
+threading.Thread(target=warm_report_cache, name="report-cache-warmup", daemon=True).start()
+
 if __name__ == '__main__':
     app.run(debug=False, host='0.0.0.0', port=5000)
@@ -0,0 +1,81 @@
+"""Bytes on the wire and CPU per request of report responses, by encoding.
+
+    python bench_compression.py [--requests 200]
+
+For a few typical reports, compares serving a cache hit by re-encoding it on
+every request (json.dumps, plus gzip or brotli when compressing) with sending
+the pre-encoded bytes stored in the report cache. CPU is process time per
+request, measured through the Flask test client.
+"""
+import argparse
+import json
+import os
+import time
+
+REPORTS = {
+    "all rows": {},
+    "one borough": {"borough": "BROOKLYN"},
+    "borough + year": {"borough": "QUEENS", "year": "2022"},
+    "search + any-vehicle factor": {"search_query": "pedestrian", "factor": "Unsafe Speed", "factor_scope": "any_vehicle"},
+}
+
+
+def _cpu_ms(func, n):
+    start = time.process_time()
+    for _ in range(n):
+        func()
+    return round((time.process_time() - start) * 1000 / n, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per measurement")
+    args = parser.parse_args()
+
+    os.environ.setdefault("REPORT_USAGE_FILE", os.devnull)
+    import crash_data
+    crash_data.start_loading(background=False)
+    import app as api
+    import compression
+    from filters import parse_filters
+
+    client = api.app.test_client()
+    encodings = [None] + compression.ENCODINGS
+    print(f"Encodings: {', '.join(compression.ENCODINGS)}\n")
+
+    print("| report | identity (bytes) | " + " | ".join(f"{e} (bytes)" for e in compression.ENCODINGS) + " |")
+    print("|---" * (2 + len(compression.ENCODINGS)) + "|")
+    entries = {}
+    for name, payload in REPORTS.items():
+        entry = api.encoded_report(parse_filters(payload), "month")
+        entries[name] = (payload, entry)
+        sizes = entry.sizes()
+        print(f"| {name} | {sizes['identity']:,} | " + " | ".join(
+            f"{sizes[e]:,} ({sizes[e] / sizes['identity']:.1%})" for e in compression.ENCODINGS) + " |")
+
+    # CPU to produce the response bytes of a cache hit
+    print("\nCPU per cache hit, response bytes only (ms):\n")
+    print("| report | re-encode | " + " | ".join(f"re-encode + {e}" for e in compression.ENCODINGS) + " | pre-encoded |")
+    print("|---" * (3 + len(compression.ENCODINGS)) + "|")
+    for name, (_, entry) in entries.items():
+        cells = [_cpu_ms(lambda: json.dumps(entry.body).encode(), args.requests)]
+        for e in compression.ENCODINGS:
+            cells.append(_cpu_ms(lambda: compression.compress(json.dumps(entry.body).encode(), e, compression.DYNAMIC_LEVELS[e]), args.requests))
+        cells.append(_cpu_ms(lambda: entry.pick(compression.ENCODINGS[0]), args.requests))
+        print(f"| {name} | " + " | ".join(str(c) for c in cells) + " |")
+
+    # Whole requests, with the report already cached
+    print("\nCPU per /api/report cache hit, whole request through Flask (ms):\n")
+    print("| Accept-Encoding | bytes sent | CPU (ms) |")
+    print("|---|---|---|")
+    payload = {**entries["one borough"][0], "granularity": "month"}
+    client.post("/api/report", json=payload)
+    for e in encodings:
+        headers = {"Accept-Encoding": e} if e else {}
+        sent = len(client.post("/api/report", json=payload, headers=headers).get_data())
+        cpu = _cpu_ms(lambda: client.post("/api/report", json=payload, headers=headers).get_data(), args.requests)
+        print(f"| {e or 'none'} | {sent:,} | {cpu} |")
+
+
+if __name__ == "__main__":
+    main()
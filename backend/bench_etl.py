@@ -0,0 +1,67 @@
+"""Wall time of the ETL from 1 to N worker processes.
+
+    python bench_etl.py CRASHES_CSV [PERSONS_CSV] [VEHICLES_CSV] [--workers 1,2,4,8] [--chunksize N]
+
+Runs etl.run once per worker count, into a fresh temporary directory, and
+reports the time of each phase. Partitioning and merging run in the main
+process, so only "process" scales with the workers. Also checks that every
+run wrote the same bytes.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+
+def _digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _default_workers():
+    counts, n = [], 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return ",".join(str(c) for c in counts + [os.cpu_count() or 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("crashes", help="raw crashes CSV")
+    parser.add_argument("persons", nargs="?", help="raw persons CSV")
+    parser.add_argument("vehicles", nargs="?", help="raw vehicles CSV")
+    parser.add_argument("--workers", default=_default_workers(), help="comma-separated worker counts (default: 1, 2, 4, ... cpu count)")
+    parser.add_argument("--chunksize", type=int, default=None, help="rows per chunk (default: etl.CHUNKSIZE)")
+    args = parser.parse_args()
+
+    import etl
+    from crash_data import CSV_NAME
+    from persons import PERSONS_CSV_NAME
+
+    print(f"CPUs: {os.cpu_count()}\n")
+    print("| workers | total (s) | partition (s) | process (s) | merge (s) | speedup (process) | output |")
+    print("|---|---|---|---|---|---|---|")
+    base = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        with tempfile.TemporaryDirectory() as out_dir:
+            start = time.perf_counter()
+            report = etl.run(args.crashes, args.persons, out_dir, workers, args.chunksize or etl.CHUNKSIZE,
+                             vehicles_path=args.vehicles)
+            total = time.perf_counter() - start
+            digest = _digest([os.path.join(out_dir, CSV_NAME), os.path.join(out_dir, PERSONS_CSV_NAME)])
+        phases = report["etl"]["phases"]
+        partition = sum(v for k, v in phases.items() if k.startswith("partition_"))
+        base = base or phases["process"]
+        print(f"| {workers} | {total:.2f} | {partition:.2f} | {phases['process']:.2f} | {phases['merge']:.2f} "
+              f"| {base / phases['process']:.2f}x | {digest} |", flush=True)
+
+
+if __name__ == "__main__":
+    main()
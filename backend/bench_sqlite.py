@@ -0,0 +1,119 @@
+"""Memory and latency of the pandas and SQLite query backends.
+
+    python bench_sqlite.py [--scale N] [--runs 5]
+
+Each backend runs in its own process, which loads the data and then times
+the report aggregations (report_series, without the charts) for a fixed set
+of filters. `--scale N` benchmarks N stacked copies of the CSV, to approach
+the size of the full history. Linux only (memory is read from /proc).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+QUERIES = {
+    "all rows": {},
+    "borough": {"borough": "BROOKLYN"},
+    "years + severity": {"year": ["2019", "2020"], "severity": "Injury"},
+    "factor, any vehicle": {"factor": "Unspecified", "factor_scope": "any_vehicle"},
+    "search 'pedestrian'": {"search_query": "pedestrian"},
+    "one month": {"start_date": "2020-06-01", "end_date": "2020-06-30"},
+}
+
+
+def _memory_mb():
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS", "VmHWM", "RssAnon", "RssFile")):
+                name, kb = line.split()[:2]
+                values[name.rstrip(":")] = round(int(kb) / 1024, 1)
+    return values
+
+
+def _child(backend, csv_path, db_path, runs):
+    import crash_data
+    from filters import apply_filters, parse_filters
+    from reports import report_series
+
+    start = time.perf_counter()
+    if backend == "sqlite":
+        from sqlite_store import SqliteStore
+        store = SqliteStore(db_path)
+        series = lambda filters: store.report_series("month", **filters)
+    else:
+        crash_data.find_csv = lambda: csv_path
+        crash_data.start_loading(background=False, backend="pandas")
+        df = crash_data.get_data()
+        series = lambda filters: report_series(apply_filters(df, **filters), "month")
+    result = {"load_seconds": round(time.perf_counter() - start, 2), "loaded": _memory_mb(), "queries": {}}
+
+    for name, payload in QUERIES.items():
+        filters = parse_filters(payload)
+        times = []
+        for _ in range(runs):
+            t = time.perf_counter()
+            series(filters)
+            times.append((time.perf_counter() - t) * 1000)
+        result["queries"][name] = round(sorted(times)[len(times) // 2], 1)
+    result["after_queries"] = _memory_mb()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=1, help="stack N copies of the CSV (default: 1)")
+    parser.add_argument("--runs", type=int, default=5, help="runs per query, the median is reported")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.csv, args.db, args.runs)
+        return
+
+    import pandas as pd
+    import crash_data
+    from sqlite_store import build_database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = crash_data.find_csv()
+        if args.scale > 1:
+            scaled = os.path.join(tmp, "crashes.csv")
+            source = pd.read_csv(csv_path, low_memory=False)
+            for i in range(args.scale):
+                copy = source.assign(COLLISION_ID=source["COLLISION_ID"] + i * 100_000_000) if "COLLISION_ID" in source else source
+                copy.to_csv(scaled, mode="a", header=i == 0, index=False)
+            csv_path = scaled
+        db_path = os.path.join(tmp, "crashes.sqlite")
+        start = time.perf_counter()
+        build_database(crash_data.load_data(csv_path), db_path)
+        print(f"Built {db_path} in {time.perf_counter() - start:.1f}s ({os.path.getsize(db_path) / 1e6:.1f} MB)\n")
+
+        results = {}
+        for backend in ["pandas", "sqlite"]:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", backend, "--csv", csv_path, "--db", db_path, "--runs", str(args.runs)],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            results[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print("| | pandas | sqlite |")
+    print("|---|---|---|")
+    print(f"| load (s) | {results['pandas']['load_seconds']} | {results['sqlite']['load_seconds']} |")
+    # RssAnon is the worker's private memory. RssFile is mostly the memory-mapped
+    # SQLite file, which the OS shares between workers.
+    for key, label in [("loaded", "after load"), ("after_queries", "after queries")]:
+        for field in ["RssAnon", "RssFile"]:
+            print(f"| {field} {label} (MB) | {results['pandas'][key][field]} | {results['sqlite'][key][field]} |")
+    print(f"| peak RSS (MB) | {results['pandas']['after_queries']['VmHWM']} | {results['sqlite']['after_queries']['VmHWM']} |")
+    for name in QUERIES:
+        print(f"| {name} (ms) | {results['pandas']['queries'][name]} | {results['sqlite']['queries'][name]} |")
+
+
+if __name__ == "__main__":
+    main()
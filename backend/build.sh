@@ -9,3 +9,17 @@ pip install --upgrade pip setuptools wheel
 
 # Install requirements with preference for binary wheels
 pip install --prefer-binary -r requirements.txt
+
+# Check the data quality and pre-render the borough x year x severity reports
+# and flag weekly crash spikes (see profiling.py, bundle.py and anomalies.py).
+# A failed quality threshold stops the build.
+if [ -f integrated_crashes_for_app.csv ] || [ -f ../integrated_crashes_for_app.csv ]; then
+    python profiling.py
+    python bundle.py
+    python anomalies.py
+fi
+
+# Ingest the CSV into SQLite for QUERY_BACKEND=sqlite (see sqlite_store.py)
+if [ "$QUERY_BACKEND" = "sqlite" ]; then
+    python sqlite_store.py
+fi
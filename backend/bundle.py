@@ -0,0 +1,289 @@
+"""Pre-rendered report bundle.
+
+Without a factor, search query or date range, a report is fully determined by
+its borough, year and severity (each "All" or one value). That product space
+is small, so `python bundle.py` computes every such report ahead of time and
+writes them as gzipped JSON files plus a manifest.json. The files can be put on
+a static host, or served by /api/report straight from disk.
+
+All reports come from one grouped pass: the rows are aggregated once per
+(borough, year, severity) cell, and each report sums the cells it covers.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from compare import _codes, _counts_frame, _grouped
+from factors import FACTOR_COLUMNS
+from reports import DAY_ORDER, DEFAULT_GRANULARITY, GRANULARITIES, build_charts, period_start
+
+BUNDLE_DIR = os.environ.get(
+    "REPORT_BUNDLE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_bundle"),
+)
+MANIFEST_NAME = "manifest.json"
+
+# Filter -> column of the bundle dimensions, in file name order
+DIMENSIONS = {"borough": "BOROUGH", "year": "YEAR", "severity": "SEVERITY"}
+
+# Columns the pre-computed results are made of (reports here, anomalies.py),
+# hashed into the data signature
+SIGNATURE_COLUMNS = (["COLLISION_ID", "CRASH_DATE", "BOROUGH", "YEAR", "SEVERITY", "HOUR", "DAY_OF_WEEK",
+                      "NUMBER_OF_PERSONS_INJURED", "NUMBER_OF_PERSONS_KILLED"] + FACTOR_COLUMNS)
+
+# (weak reference to the table, its signature) of the last table signed
+_last_signature = (None, None)
+
+
+def _slug(value):
+    return "all" if value is None else re.sub(r"[^a-z0-9]+", "-", str(value).lower()).strip("-")
+
+
+def report_file(granularity, borough, year, severity):
+    """Path of a report inside the bundle, relative to its directory."""
+    return f"{granularity}/{_slug(borough)}_{_slug(year)}_{_slug(severity)}.json.gz"
+
+
+def _fingerprint(data):
+    """SHA-1 of the SIGNATURE_COLUMNS of the table, row by row in table order.
+
+    Numbers and dates are hashed as their raw bytes, categoricals as their
+    categories and codes; only text columns go through pandas' row hashing.
+    """
+    digest = hashlib.sha1()
+    for column in SIGNATURE_COLUMNS:
+        if column not in data.columns:
+            continue
+        values = data[column]
+        digest.update(column.encode())
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            digest.update("\x1f".join(map(str, values.cat.categories)).encode())
+            raw = values.cat.codes.to_numpy()
+        elif values.dtype.kind in "biufmM":
+            raw = values.to_numpy()
+        else:
+            raw = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        digest.update(np.ascontiguousarray(raw).view(np.uint8))
+    return digest.hexdigest()[:16]
+
+
+def data_signature(data):
+    """Row count, date range and content fingerprint of the table, to tell whether pre-computed results match it.
+
+    The loaded table is signed once: later calls with the same table object
+    reuse the signature (the table is not modified after load).
+    """
+    global _last_signature
+    table, signature = _last_signature
+    if table is not None and table() is data:
+        return signature
+    dates = data["CRASH_DATE"].dropna()
+    signature = {
+        "rows": int(len(data)),
+        "min_date": dates.iloc[0].strftime("%Y-%m-%d") if len(dates) else None,
+        "max_date": dates.iloc[-1].strftime("%Y-%m-%d") if len(dates) else None,
+        "fingerprint": _fingerprint(data),
+    }
+    _last_signature = (weakref.ref(data), signature)
+    return signature
+
+
+def _cell_aggregates(data, granularity, factor_index=None):
+    """Every report aggregate per (borough, year, severity) cell, in one pass over the rows."""
+    from factors import grouped_factor_counts, loaded_index
+
+    codes, labels = {}, {}
+    for name, column in DIMENSIONS.items():
+        codes[name], labels[name] = _codes(data[column])
+    shape = tuple(len(labels[name]) + 1 for name in DIMENSIONS)   # + missing
+    cell = np.ravel_multi_index(tuple(codes[name] for name in DIMENSIONS), shape)
+    n_cells = int(np.prod(shape))
+    one = np.zeros(len(data), dtype=np.int64)
+
+    injured = data["NUMBER_OF_PERSONS_INJURED"].fillna(0).to_numpy(dtype=float) if "NUMBER_OF_PERSONS_INJURED" in data.columns else np.zeros(len(data))
+    killed = data["NUMBER_OF_PERSONS_KILLED"].fillna(0).to_numpy(dtype=float) if "NUMBER_OF_PERSONS_KILLED" in data.columns else np.zeros(len(data))
+
+    period_codes, periods = pd.factorize(period_start(data["CRASH_DATE"], granularity), sort=True)
+    period_codes = np.where(period_codes < 0, len(periods), period_codes)
+
+    agg = {
+        "shape": shape,
+        "labels": labels,
+        "crashes": _grouped(one, cell, n_cells, 1)[0],
+        "injured": _grouped(one, cell, n_cells, 1, weights=injured)[0],
+        "killed": _grouped(one, cell, n_cells, 1, weights=killed)[0],
+        "periods": periods,
+        "over_time": _grouped(cell, period_codes, len(periods), n_cells, weights=injured),
+        "period_rows": _grouped(cell, period_codes, len(periods), n_cells),
+        "heat": None,
+        "hour_dtype": None,
+        "factor_index": factor_index if factor_index is not None else loaded_index(),
+        "factors": None,
+    }
+    if "HOUR" in data.columns:
+        day = pd.Categorical(data["DAY_OF_WEEK"], categories=DAY_ORDER).codes.astype(np.int64)
+        hour = data["HOUR"].to_numpy(dtype=float)
+        valid = (day >= 0) & ~np.isnan(hour)
+        heat_cell = np.where(valid, day * 24 + np.nan_to_num(hour, nan=0).astype(np.int64), 7 * 24)
+        agg["heat"] = _grouped(cell, heat_cell, 7 * 24, n_cells)
+        agg["hour_dtype"] = data["HOUR"].dtype
+    if agg["factor_index"] is not None:
+        agg["factors"] = grouped_factor_counts(data.index.to_numpy(), cell, n_cells, agg["factor_index"])
+    return agg
+
+
+def _combo_series(agg, values):
+    """report_series of the rows whose cells match `values` (dimension -> value or None)."""
+    from factors import top_factors
+
+    selected = np.ones(agg["shape"], dtype=bool)
+    for axis, name in enumerate(DIMENSIONS):
+        if values[name] is None:
+            continue
+        keep = np.zeros(agg["shape"][axis], dtype=bool)
+        keep[agg["labels"][name].get_loc(values[name])] = True
+        selected &= np.expand_dims(keep, [a for a in range(len(DIMENSIONS)) if a != axis])
+    cells = np.flatnonzero(selected.ravel())
+
+    crashes = agg["crashes"].reshape(agg["shape"])
+    borough = np.where(selected, crashes, 0).sum(axis=(1, 2))[:-1]
+    severity = np.where(selected, crashes, 0).sum(axis=(0, 1))[:-1]
+    over_time = agg["over_time"][cells].sum(axis=0)
+    seen = agg["period_rows"][cells].sum(axis=0) > 0
+
+    series = {
+        "summary": {
+            "crashes": int(agg["crashes"][cells].sum()),
+            "injured": int(round(agg["injured"][cells].sum())),
+            "killed": int(round(agg["killed"][cells].sum())),
+        },
+        "borough": _counts_frame("BOROUGH", agg["labels"]["borough"], borough),
+        "time": pd.DataFrame({
+            "PERIOD": agg["periods"][seen],
+            "NUMBER_OF_PERSONS_INJURED": np.round(over_time[seen]).astype(int),
+        }),
+        "severity": _counts_frame("SEVERITY", agg["labels"]["severity"], severity),
+        "heatmap": None,
+        "factors": None,
+    }
+    if agg["heat"] is not None:
+        heat = agg["heat"][cells].sum(axis=0)
+        present = np.flatnonzero(heat)
+        series["heatmap"] = pd.DataFrame({
+            "DAY_OF_WEEK": pd.Categorical(np.array(DAY_ORDER)[present // 24], categories=DAY_ORDER, ordered=True),
+            "HOUR": (present % 24).astype(agg["hour_dtype"]),
+            "COUNT": heat[present].astype(int),
+        })
+    if agg["factors"] is not None:
+        series["factors"] = top_factors(agg["factor_index"], agg["factors"][cells].sum(axis=0))
+    return series
+
+
+def combinations(data):
+    """Every (borough, year, severity) the bundle covers: "All" (None) or one filter option each."""
+    boroughs = [None] + sorted(b for b in data["BOROUGH"].dropna().unique() if b != "UNKNOWN")
+    years = [None] + sorted(data["YEAR"].dropna().astype(int).unique().tolist())
+    severities = [None] + sorted(data["SEVERITY"].dropna().unique().tolist())
+    return [(b, y, s) for b in boroughs for y in years for s in severities]
+
+
+def build_bundle(data, out_dir=BUNDLE_DIR, granularities=(DEFAULT_GRANULARITY,), factor_index=None):
+    """Write every bundled report of `data` under `out_dir`, then the manifest. Returns the manifest."""
+    combos = combinations(data)
+    reports = []
+    for granularity in granularities:
+        agg = _cell_aggregates(data, granularity, factor_index)
+        os.makedirs(os.path.join(out_dir, granularity), exist_ok=True)
+        for borough, year, severity in combos:
+            series = _combo_series(agg, {"borough": borough, "year": year, "severity": severity})
+            if series["summary"]["crashes"] == 0:
+                body = {"error": "No data found for selected filters", "charts": {}, "summary": series["summary"]}
+            else:
+                body = {"charts": build_charts(series, granularity), "summary": series["summary"]}
+            path = report_file(granularity, borough, year, severity)
+            with gzip.open(os.path.join(out_dir, path), "wb", compresslevel=9) as f:
+                f.write(json.dumps(body).encode())
+            reports.append({
+                "granularity": granularity,
+                "borough": borough,
+                "year": None if year is None else str(year),
+                "severity": severity,
+                "file": path,
+                "bytes": os.path.getsize(os.path.join(out_dir, path)),
+            })
+    manifest = {
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "data": data_signature(data),
+        "granularities": list(granularities),
+        "reports": reports,
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_bundle(df, bundle_dir=BUNDLE_DIR):
+    """Index builder: {"dir", "files"} of the bundle matching `df`, or None.
+
+    `files` maps (granularity, borough, year, severity) to the file path. A
+    bundle built from other data is ignored.
+    """
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("data") != data_signature(df):
+        print(f"✗ Ignoring report bundle in {bundle_dir}: built from other data")
+        return None
+    files = {
+        (r["granularity"], r["borough"], r["year"], r["severity"]): os.path.join(bundle_dir, r["file"])
+        for r in manifest["reports"]
+    }
+    print(f"✓ Loaded report bundle: {len(files)} reports")
+    return {"dir": bundle_dir, "files": files}
+
+
+def bundled_file(bundle, filters, granularity):
+    """Path of the pre-rendered report for these parsed filters, or None if it is not bundled."""
+    if bundle is None:
+        return None
+    if filters["factor"] or filters["vehicle_type"] or filters["search_query"] or filters["start_date"] or filters["end_date"]:
+        return None
+    key = [granularity]
+    for name in DIMENSIONS:
+        values = filters[name]
+        if values is not None and len(values) != 1:
+            return None
+        key.append(values[0] if values else None)
+    return bundle["files"].get(tuple(key))
+
+
+def main():
+    import crash_data
+    from factors import build_factor_index
+
+    parser = argparse.ArgumentParser(description="Pre-render the reports of every borough x year x severity combination.")
+    parser.add_argument("--out", default=BUNDLE_DIR, help="output directory (default: %(default)s)")
+    parser.add_argument("--granularity", action="append", choices=GRANULARITIES,
+                        help=f"time granularity to bundle, repeatable (default: {DEFAULT_GRANULARITY})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = crash_data.load_data()
+    manifest = build_bundle(data, args.out, args.granularity or [DEFAULT_GRANULARITY], build_factor_index(data))
+    size = sum(r["bytes"] for r in manifest["reports"])
+    print(f"✓ Wrote {len(manifest['reports'])} reports ({size / 1e6:.1f} MB) to {args.out} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from filters import date_bounds, filter_mask, parse_filters
+from reports import DAY_ORDER, period_start
+
+MAX_VARIANTS = 20
+
+
+def parse_variants(payload):
+    """Filter sets of a comparison request: `filters` common to all, merged into each of `variants`.
+
+    Returns a list of (name, filters) pairs. Raises ValueError on a bad request.
+    """
+    variants = payload.get("variants")
+    if not isinstance(variants, list) or not variants:
+        raise ValueError("variants must be a non-empty list of filter sets")
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"At most {MAX_VARIANTS} variants per comparison")
+    base = payload.get("filters") or {}
+    parsed = []
+    for i, variant in enumerate(variants):
+        if not isinstance(variant, dict):
+            raise ValueError(f"variant {i} must be an object of filters")
+        name = str(variant.get("name") or f"Variant {i + 1}")
+        parsed.append((name, parse_filters({**base, **variant})))
+    return parsed
+
+
+def _codes(column):
+    """Integer codes and labels of a column; missing values get the code len(labels)."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, labels = column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    else:
+        codes, labels = pd.factorize(column, sort=True)
+    return np.where(codes < 0, len(labels), codes), labels
+
+
+def _grouped(variant_of, codes, n_codes, n_variants, weights=None):
+    """(variants x codes) table of row counts or weight sums, in one bincount."""
+    keys = variant_of * (n_codes + 1) + codes
+    table = np.bincount(keys, weights=weights, minlength=n_variants * (n_codes + 1))
+    return table.reshape(n_variants, n_codes + 1)[:, :n_codes]
+
+
+def _counts_frame(column, labels, counts):
+    frame = pd.DataFrame({column: labels, "COUNT": counts.astype(int)})
+    frame = frame[frame["COUNT"] > 0]
+    return frame.sort_values("COUNT", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def compare_series(data, variants, granularity):
+    """report_series for every variant, computed in one grouped pass.
+
+    The rows spanned by all the variants' date ranges are decoded once
+    (category codes, periods, day x hour cells). Each variant only adds its
+    boolean filter mask, and every aggregate of every variant is then a single
+    bincount over (variant, group) keys.
+    """
+    from factors import grouped_factor_counts, loaded_index, top_factors
+
+    bounds = [date_bounds(data, f["start_date"], f["end_date"]) for _, f in variants]
+    lo = min(b[0] for b in bounds)
+    hi = max(b[1] for b in bounds)
+    scan = data.iloc[lo:hi]
+
+    # (row, variant) pairs of every row each variant selects
+    rows, variant_of = [], []
+    for i, ((_, filters), (vlo, vhi)) in enumerate(zip(variants, bounds)):
+        others = {k: v for k, v in filters.items() if k not in ("start_date", "end_date")}
+        selected = (vlo - lo) + np.flatnonzero(filter_mask(scan.iloc[vlo - lo:vhi - lo], **others))
+        rows.append(selected)
+        variant_of.append(np.full(len(selected), i, dtype=np.int64))
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+    variant_of = np.concatenate(variant_of) if variant_of else np.empty(0, dtype=np.int64)
+    n = len(variants)
+
+    injured = scan["NUMBER_OF_PERSONS_INJURED"].fillna(0).to_numpy(dtype=float)[rows] if "NUMBER_OF_PERSONS_INJURED" in scan.columns else np.zeros(len(rows))
+    killed = scan["NUMBER_OF_PERSONS_KILLED"].fillna(0).to_numpy(dtype=float)[rows] if "NUMBER_OF_PERSONS_KILLED" in scan.columns else np.zeros(len(rows))
+    crashes = np.bincount(variant_of, minlength=n)
+    injured_total = np.bincount(variant_of, weights=injured, minlength=n)
+    killed_total = np.bincount(variant_of, weights=killed, minlength=n)
+
+    borough_codes, boroughs = _codes(scan["BOROUGH"])
+    borough = _grouped(variant_of, borough_codes[rows], len(boroughs), n)
+    severity_codes, severities = _codes(scan["SEVERITY"])
+    severity = _grouped(variant_of, severity_codes[rows], len(severities), n)
+
+    period_codes, periods = pd.factorize(period_start(scan["CRASH_DATE"], granularity), sort=True)
+    period_codes = np.where(period_codes < 0, len(periods), period_codes)
+    over_time = _grouped(variant_of, period_codes[rows], len(periods), n, weights=injured)
+    period_seen = _grouped(variant_of, period_codes[rows], len(periods), n) > 0
+
+    heat = None
+    if "HOUR" in scan.columns:
+        day = pd.Categorical(scan["DAY_OF_WEEK"], categories=DAY_ORDER).codes.astype(np.int64)
+        hour = scan["HOUR"].to_numpy(dtype=float)
+        valid = (day >= 0) & ~np.isnan(hour)
+        cell = np.where(valid, day * 24 + np.nan_to_num(hour, nan=0).astype(np.int64), 7 * 24)
+        heat = _grouped(variant_of, cell[rows], 7 * 24, n)
+
+    factor_index = loaded_index()
+    factors = grouped_factor_counts(scan.index.to_numpy()[rows], variant_of, n, factor_index)
+
+    results = []
+    for i in range(n):
+        series = {
+            "summary": {"crashes": int(crashes[i]), "injured": int(round(injured_total[i])), "killed": int(round(killed_total[i]))},
+            "borough": _counts_frame("BOROUGH", boroughs, borough[i]),
+            "time": pd.DataFrame({
+                "PERIOD": periods[period_seen[i]],
+                "NUMBER_OF_PERSONS_INJURED": np.round(over_time[i][period_seen[i]]).astype(int),
+            }),
+            "severity": _counts_frame("SEVERITY", severities, severity[i]),
+            "heatmap": None,
+            "factors": top_factors(factor_index, factors[i]) if factors is not None else None,
+        }
+        if heat is not None:
+            cells = np.flatnonzero(heat[i])
+            series["heatmap"] = pd.DataFrame({
+                "DAY_OF_WEEK": pd.Categorical(np.array(DAY_ORDER)[cells // 24], categories=DAY_ORDER, ordered=True),
+                "HOUR": (cells % 24).astype(scan["HOUR"].dtype),
+                "COUNT": heat[i][cells].astype(int),
+            })
+        results.append(series)
+    return results
+
+
+def series_json(series):
+    """A report_series dict as plain JSON: each frame becomes a dict of column lists."""
+    out = {"summary": series["summary"]}
+    for key, frame in series.items():
+        if key == "summary":
+            continue
+        if frame is None:
+            out[key] = None
+            continue
+        frame = frame.copy()
+        for column in frame.columns:
+            if pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = frame[column].dt.strftime("%Y-%m-%d")
+            elif isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype(str)
+        out[key] = frame.to_dict(orient="list")
+    return out
+
+
+def comparison_charts(names, results, granularity):
+    """Borough, time and severity charts with one trace per variant."""
+    import plotly.express as px
+
+    def stacked(key):
+        frames = [r[key].assign(VARIANT=name) for name, r in zip(names, results) if r[key] is not None and len(r[key])]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    figures = {}
+    borough = stacked("borough")
+    if borough is not None:
+        figures["borough"] = px.bar(borough, x="BOROUGH", y="COUNT", color="VARIANT", barmode="group",
+                                    title="Crashes by Borough", labels={"COUNT": "Number of Crashes"})
+    over_time = stacked("time")
+    if over_time is not None:
+        figures["time"] = px.line(over_time, x="PERIOD", y="NUMBER_OF_PERSONS_INJURED", color="VARIANT", markers=True,
+                                  title="Injured Persons Over Time",
+                                  labels={"NUMBER_OF_PERSONS_INJURED": "Total Injured", "PERIOD": granularity.capitalize()})
+    severity = stacked("severity")
+    if severity is not None:
+        figures["severity"] = px.bar(severity, x="SEVERITY", y="COUNT", color="VARIANT", barmode="group",
+                                     title="Crash Severity Distribution", labels={"COUNT": "Number of Crashes"})
+    for fig in figures.values():
+        fig.update_layout(height=400)
+    return {name: json.loads(fig.to_json()) for name, fig in figures.items()}
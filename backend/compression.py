@@ -0,0 +1,71 @@
+"""Response compression: Accept-Encoding negotiation and pre-encoded bodies.
+
+Cached reports are stored as `Encoded` bodies, already serialized and
+compressed with every supported encoding, so sending one is a byte copy.
+Other JSON responses are compressed on the fly by `compress_response`.
+"""
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Preferred first
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# Bodies smaller than this are sent as they are
+MIN_SIZE = 1024
+
+# Levels for bodies compressed once and cached, and for per-request compression
+STORED_LEVELS = {"br": 9, "gzip": 9}
+DYNAMIC_LEVELS = {"br": 4, "gzip": 6}
+
+
+def compress(data, encoding, level):
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def negotiate(accept_encodings):
+    """The encoding to use for a request's Accept-Encoding (werkzeug's parsed header), or None."""
+    best = accept_encodings.best_match(ENCODINGS)
+    return best if best and accept_encodings[best] > 0 else None
+
+
+class Encoded:
+    """A JSON body serialized once and compressed with each of ENCODINGS."""
+
+    def __init__(self, body):
+        self.body = body
+        self.identity = json.dumps(body, separators=(",", ":")).encode()
+        self.encoded = {}
+        if len(self.identity) >= MIN_SIZE:
+            for encoding in ENCODINGS:
+                self.encoded[encoding] = compress(self.identity, encoding, STORED_LEVELS[encoding])
+
+    def pick(self, encoding):
+        """(bytes, Content-Encoding or None) to send for the negotiated `encoding`."""
+        if encoding in self.encoded:
+            return self.encoded[encoding], encoding
+        return self.identity, None
+
+    def sizes(self):
+        return {"identity": len(self.identity), **{e: len(b) for e, b in self.encoded.items()}}
+
+
+def compress_response(response, accept_encodings):
+    """Compress a JSON response in place when the client accepts it (after_request hook)."""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or "Content-Encoding" in response.headers or response.mimetype != "application/json"):
+        return response
+    data = response.get_data()
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(accept_encodings)
+    if encoding is None or len(data) < MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding, DYNAMIC_LEVELS[encoding]))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,214 @@
+"""Crash table loading and readiness state.
+
+Importing this module is cheap: pandas and the CSV are only touched by
+`load_data`, which `start_loading` runs on a background thread so the web
+server can answer health checks while the data is still being read.
+"""
+import importlib
+import os
+import threading
+import time
+
+CSV_NAME = "integrated_crashes_for_app.csv"
+
+# "pandas" loads the CSV into memory; "sqlite" queries the file built by
+# sqlite_store.py instead (see sqlite_store.py)
+QUERY_BACKENDS = ["pandas", "sqlite"]
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "pandas")
+
+# Secondary structures built right after the table is loaded, in order.
+# name -> "module:function"; the function takes the prepared frame.
+INDEX_BUILDERS = {
+    "factors": "factors:build_factor_index",
+    "daily": "rollups:build_daily_rollup",
+    "collisions": "persons:build_collision_index",
+    "sample": "sampling:build_stratified_sample",
+    "bundle": "bundle:load_bundle",
+    "vehicles": "vehicles:build_vehicle_index",
+    "hotspots": "hotspots:build_hotspot_index",
+    "anomalies": "anomalies:load_anomalies",
+}
+
+_lock = threading.Lock()
+_done = threading.Event()   # set once loading has finished, either way
+_state = {
+    "state": "idle",      # idle -> loading -> ready | failed
+    "backend": None,
+    "df": None,
+    "store": None,
+    "indexes": {},
+    "error": None,
+    "rows": 0,
+    "phases": {},         # phase name -> seconds
+    "started_at": None,
+    "ready_at": None,
+}
+
+
+def find_csv():
+    """Return the path of the integrated CSV, trying the usual locations."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    possible_paths = [
+        os.path.join(here, CSV_NAME),
+        os.path.join(here, "..", CSV_NAME),
+        CSV_NAME,
+    ]
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"CSV file not found. Tried: {possible_paths}")
+
+
+def _timed(phase, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    _state["phases"][phase] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _derive_columns(df):
+    """Fill in the columns the app needs when the CSV does not carry them."""
+    import numpy as np
+    import pandas as pd
+
+    if "BOROUGH" not in df.columns:
+        df["BOROUGH"] = "UNKNOWN"
+
+    if "YEAR" not in df.columns:
+        df["YEAR"] = df["CRASH_DATE"].dt.year
+
+    if "HOUR" not in df.columns and "CRASH_TIME" in df.columns:
+        df["HOUR"] = pd.to_datetime(df["CRASH_TIME"], format="%H:%M", errors="coerce").dt.hour
+
+    if "DAY_OF_WEEK" not in df.columns:
+        df["DAY_OF_WEEK"] = df["CRASH_DATE"].dt.day_name()
+
+    if "STREET_KEY" not in df.columns and {"ON STREET NAME", "CROSS STREET NAME"} <= set(df.columns):
+        from hotspots import location_keys
+
+        df["STREET_KEY"], df["INTERSECTION_KEY"] = location_keys(df["ON STREET NAME"], df["CROSS STREET NAME"])
+
+    if "SEVERITY" not in df.columns:
+        killed = df.get("NUMBER_OF_PERSONS_KILLED", pd.Series(0, index=df.index)).fillna(0)
+        injured = df.get("NUMBER_OF_PERSONS_INJURED", pd.Series(0, index=df.index)).fillna(0)
+        df["SEVERITY"] = np.select([killed > 0, injured > 0], ["Fatal", "Injury"], default="No Injury")
+
+    return df
+
+
+def load_data(path=None):
+    """Read and prepare the crash table. Records the time spent in each phase."""
+    import pandas as pd
+    from filters import encode_categories, sort_by_date
+    from vehicles import VEHICLE_DTYPES
+
+    path = path or _timed("find_csv", find_csv)
+    df = _timed("read_csv", lambda: pd.read_csv(path, parse_dates=["CRASH_DATE"], dtype=VEHICLE_DTYPES, low_memory=False))
+    print(f"✓ Loaded CSV from: {path} - {len(df)} rows")
+    df = _timed("derive_columns", _derive_columns, df)
+    # Keep rows in date order so date ranges are contiguous slices, and store
+    # the filterable text columns as categoricals
+    df = _timed("sort_by_date", sort_by_date, df)
+    df = _timed("encode_categories", encode_categories, df)
+    return df
+
+
+def _build_indexes(df):
+    """Build the INDEX_BUILDERS in order.
+
+    Each index is published as soon as it is built, so the later builders
+    can use the earlier ones through get_index (anomalies reads "daily").
+    """
+    for name, target in INDEX_BUILDERS.items():
+        module_name, func_name = target.split(":")
+        build = getattr(importlib.import_module(module_name), func_name)
+        index = _timed(f"index:{name}", build, df)
+        with _lock:
+            _state["indexes"][name] = index
+    return _state["indexes"]
+
+
+def _load():
+    df, store, indexes = None, None, {}
+    try:
+        if _state["backend"] == "sqlite":
+            from sqlite_store import SqliteStore
+            store = _timed("open_sqlite", SqliteStore)
+            rows = store.rows
+        else:
+            df = load_data()
+            indexes = _build_indexes(df)
+            rows = len(df)
+    except Exception as e:
+        print(f"✗ Error loading data: {e}")
+        with _lock:
+            _state.update(state="failed", error=str(e), indexes={})
+        _done.set()
+        return
+    with _lock:
+        _state.update(state="ready", df=df, store=store, indexes=indexes, rows=rows, ready_at=time.time())
+    _done.set()
+    total = _state["ready_at"] - _state["started_at"]
+    print(f"✓ Data ready in {total:.1f}s - phases: {_state['phases']}")
+
+
+def start_loading(background=True, backend=None):
+    """Start loading the data once. Later calls are no-ops.
+
+    `backend` is one of QUERY_BACKENDS, by default the QUERY_BACKEND setting.
+    """
+    backend = backend or QUERY_BACKEND
+    if backend not in QUERY_BACKENDS:
+        raise ValueError(f"Unknown query backend '{backend}'. Use one of: {', '.join(QUERY_BACKENDS)}")
+    with _lock:
+        if _state["state"] != "idle":
+            return
+        _state.update(state="loading", backend=backend, started_at=time.time())
+    if background:
+        threading.Thread(target=_load, name="crash-data-loader", daemon=True).start()
+    else:
+        _load()
+
+
+def is_ready():
+    return _state["state"] == "ready"
+
+
+def wait_ready(timeout=None):
+    """Block until loading has finished; True if the data is ready."""
+    _done.wait(timeout)
+    return is_ready()
+
+
+def get_data():
+    """The prepared crash table, or None while it is not loaded (or with the sqlite backend)."""
+    return _state["df"]
+
+
+def query_backend():
+    return _state["backend"]
+
+
+def get_store():
+    """The SqliteStore with QUERY_BACKEND=sqlite, else None."""
+    return _state["store"]
+
+
+def get_index(name):
+    return _state["indexes"].get(name)
+
+
+def status():
+    """Readiness details for the health endpoint."""
+    with _lock:
+        started = _state["started_at"]
+        return {
+            "state": _state["state"],
+            "backend": _state["backend"],
+            "rows": _state["rows"],
+            "indexes": sorted(_state["indexes"]),
+            "pending_indexes": sorted(set(INDEX_BUILDERS) - set(_state["indexes"])) if _state["backend"] == "pandas" else [],
+            "phases": dict(_state["phases"]),
+            "load_seconds": round((_state["ready_at"] or time.time()) - started, 3) if started else None,
+            "error": _state["error"],
+        }
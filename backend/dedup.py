@@ -0,0 +1,96 @@
+"""Streaming deduplication with 64-bit record fingerprints.
+
+A `SeenSet` remembers the key (COLLISION_ID, UNIQUE_ID) and a 64-bit
+fingerprint of every record it lets through, in two sorted NumPy arrays:
+16 bytes per record, however wide the table. Chunks are checked against it
+one at a time, and saving it next to the output carries it over to the next
+incremental run.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def fingerprint(chunk):
+    """64-bit hash of each row's values, as a uint64 array.
+
+    Read the chunks with dtype=str, so a record hashes the same in every
+    chunk and every run whatever types pandas would have inferred.
+    """
+    return pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+
+
+def _contains(sorted_values, values):
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    found = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[found] == values
+
+
+def _first(values):
+    """True at the first occurrence of each value."""
+    first = np.zeros(len(values), dtype=bool)
+    first[np.unique(values, return_index=True)[1]] = True
+    return first
+
+
+def _insert(sorted_values, new):
+    merged = np.concatenate([sorted_values, np.sort(new)])
+    # Two sorted runs: the stable sort (timsort) merges them in linear time
+    merged.sort(kind="stable")
+    return merged
+
+
+class SeenSet:
+    """Keys and fingerprints of the records kept so far, optionally saved to `path` (.npz)."""
+
+    def __init__(self, key, path=None):
+        self.key = key
+        self.path = path
+        self.keys = np.empty(0, dtype=np.int64)
+        self.fingerprints = np.empty(0, dtype=np.uint64)
+        # Rows dropped this run: repeated record, same key with different
+        # values (a revised record, the first one is kept), or no key
+        self.counts = {"rows": 0, "kept": 0, "duplicate_records": 0, "duplicate_keys": 0, "missing_keys": 0}
+        if path and os.path.exists(path):
+            with np.load(path) as saved:
+                self.keys, self.fingerprints = saved["keys"], saved["fingerprints"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def mask(self, chunk, fingerprints=None):
+        """Boolean mask of the rows of `chunk` not seen before (nor earlier in the chunk), and remember them."""
+        fingerprints = fingerprint(chunk) if fingerprints is None else fingerprints
+        keys = pd.to_numeric(chunk[self.key], errors="coerce")
+        missing = keys.isna().to_numpy()
+        keys = keys.fillna(-1).to_numpy(dtype=np.int64)
+
+        repeated = _contains(self.fingerprints, fingerprints) | ~_first(fingerprints)
+        duplicate_key = (_contains(self.keys, keys) | ~_first(keys)) & ~missing & ~repeated
+        keep = ~(missing | repeated | duplicate_key)
+
+        self.keys = _insert(self.keys, keys[keep])
+        self.fingerprints = _insert(self.fingerprints, fingerprints[keep])
+        self.counts["rows"] += len(chunk)
+        self.counts["kept"] += int(keep.sum())
+        self.counts["duplicate_records"] += int(repeated.sum())
+        self.counts["duplicate_keys"] += int(duplicate_key.sum())
+        self.counts["missing_keys"] += int((missing & ~repeated).sum())
+        return keep
+
+    def filter(self, chunk):
+        """`chunk` without the records already seen."""
+        return chunk[self.mask(chunk)]
+
+    def contains(self, keys):
+        """Whether each of `keys` has been kept, now or in an earlier run."""
+        return _contains(self.keys, np.asarray(keys, dtype=np.int64))
+
+    def save(self, path=None):
+        path = path or self.path
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, keys=self.keys, fingerprints=self.fingerprints)
+        os.replace(tmp, path)
@@ -0,0 +1,194 @@
+"""Cached, resumable downloads of the NYC Open Data exports.
+
+`open_source(source)` opens a local path, or an URL through the cache in
+DOWNLOAD_DIR:
+
+- a complete cached file is revalidated with If-None-Match /
+  If-Modified-Since, and read from disk when the server answers 304
+- an interrupted download (a .part file) is resumed with a Range request,
+  guarded by If-Range so a changed file starts over
+- otherwise the file is downloaded
+
+Downloads are not waited for: the returned file object reads the response
+as it arrives and appends it to the .part file on the way, so the chunked
+CSV parser starts on the first block. The .part file becomes the cached file
+once the response has been read to the end.
+
+    python downloads.py [URL ...]    # fetch into the cache (default: the exports)
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+
+CRASHES_URL = os.environ.get("CRASHES_URL", "https://data.cityofnewyork.us/api/views/h9gi-nx95/rows.csv?accessType=download")
+PERSONS_URL = os.environ.get("PERSONS_URL", "https://data.cityofnewyork.us/api/views/f55k-p6yu/rows.csv?accessType=download")
+VEHICLES_URL = os.environ.get("VEHICLES_URL", "https://data.cityofnewyork.us/api/views/bm4k-52h4/rows.csv?accessType=download")
+
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads"))
+TIMEOUT = 60
+BLOCK_SIZE = 1 << 20
+
+
+def is_url(source):
+    return isinstance(source, str) and source.startswith(("http://", "https://"))
+
+
+def cache_path(url, cache_dir=None):
+    """Where `url` is cached: its last path segments, prefixed with a hash of the whole URL."""
+    parsed = urllib.parse.urlparse(url)
+    name = "-".join(s for s in parsed.path.split("/")[-2:] if s) or "download"
+    digest = hashlib.sha1(url.encode()).hexdigest()[:10]
+    return os.path.join(cache_dir or DOWNLOAD_DIR, f"{digest}-{re.sub(r'[^A-Za-z0-9._-]', '_', name)}")
+
+
+def _load_meta(path):
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_meta(path, meta):
+    tmp = path + ".json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, path + ".json")
+
+
+def _total_size(response):
+    """Full size of the file from Content-Range (206) or Content-Length (200), or None."""
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    length = response.headers.get("Content-Length")
+    return int(length) if length else None
+
+
+class _Download(io.RawIOBase):
+    """The bytes already in the .part file, then the response, appended to the .part file as they are read."""
+
+    def __init__(self, path, meta, response, offset):
+        self.path = path
+        self.meta = meta
+        self.response = response
+        self.local = open(path + ".part", "rb") if offset else None
+        self.part = open(path + ".part", "ab")
+        self.finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.local is not None:
+            n = self.local.readinto(buffer)
+            if n:
+                return n
+            self.local.close()
+            self.local = None
+        data = self.response.read(len(buffer))
+        if not data:
+            self._finish()
+            return 0
+        self.part.write(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self.part.close()
+        self.response.close()
+        size = os.path.getsize(self.path + ".part")
+        if self.meta.get("size") is not None and size != self.meta["size"]:
+            # Connection closed early: keep the .part file to resume from
+            raise OSError(f"Download of {self.meta['url']} stopped at {size:,} of {self.meta['size']:,} bytes")
+        os.replace(self.path + ".part", self.path)
+        _save_meta(self.path, dict(self.meta, size=size, complete=True))
+        print(f"✓ Downloaded {self.meta['url']} -> {self.path} ({size / 1e6:.1f} MB)")
+
+    def close(self):
+        if not self.closed:
+            for f in (self.local, self.part, self.response):
+                if f is not None:
+                    f.close()
+        super().close()
+
+
+def open_url(url, cache_dir=None, revalidate=True):
+    """A binary file object for `url`, through the cache (see the module docstring)."""
+    path = cache_path(url, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = _load_meta(path)
+    validator = meta.get("etag") or meta.get("last_modified")
+    headers, offset = {}, 0
+    if meta.get("complete") and os.path.exists(path):
+        if not revalidate:
+            return open(path, "rb")
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    elif validator and os.path.exists(path + ".part"):
+        offset = os.path.getsize(path + ".part")
+        headers.update({"Range": f"bytes={offset}-", "If-Range": validator})
+
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            print(f"✓ Not modified, using {path}")
+            return open(path, "rb")
+        if e.code == 416 and offset:
+            # The .part file does not fit the server's file: start over
+            os.remove(path + ".part")
+            return open_url(url, cache_dir, revalidate)
+        raise
+
+    if response.status == 206 and response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+        print(f"✓ Resuming {url} at {offset:,} bytes")
+    else:
+        # Full body: the server ignored the range, or the file changed
+        offset = 0
+        open(path + ".part", "wb").close()
+    meta = {"url": url, "etag": response.headers.get("ETag") or (meta.get("etag") if offset else None),
+            "last_modified": response.headers.get("Last-Modified") or (meta.get("last_modified") if offset else None),
+            "size": _total_size(response), "complete": False}
+    _save_meta(path, meta)
+    return io.BufferedReader(_Download(path, meta, response, offset), BLOCK_SIZE)
+
+
+def open_source(source, cache_dir=None, revalidate=True):
+    """A binary file object for a local path or an URL."""
+    if is_url(source):
+        return open_url(source, cache_dir, revalidate)
+    return open(source, "rb")
+
+
+def fetch(url, cache_dir=None):
+    """Download `url` into the cache (or revalidate it) without parsing it; returns the cached path."""
+    with open_url(url, cache_dir) as f:
+        while f.read(BLOCK_SIZE):
+            pass
+    return cache_path(url, cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*", default=[CRASHES_URL, PERSONS_URL, VEHICLES_URL],
+                        help="URLs to fetch (default: crashes, persons and vehicles)")
+    parser.add_argument("--cache-dir", default=None, help=f"cache directory (default: {DOWNLOAD_DIR})")
+    args = parser.parse_args()
+    for url in args.urls:
+        print(fetch(url, args.cache_dir))
+
+
+if __name__ == "__main__":
+    main()
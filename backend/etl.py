@@ -0,0 +1,404 @@
+"""Chunked, parallel ETL from the NYC Open Data exports to the app's CSV files.
+
+    python etl.py [CRASHES] [PERSONS] [VEHICLES] [--out-dir DIR] [--workers N] [--chunksize N] [--incremental]
+
+CRASHES, PERSONS and VEHICLES are local CSV files or URLs, by default the NYC
+Open Data exports; URLs are cached and streamed into the parser (downloads.py).
+
+The cleaning and integration of Milestone1_DataProcessing.ipynb, in three
+phases:
+
+1. partition (streaming, one process): drop duplicate records (dedup.py) and
+   split the crashes by CRASH DATE year, and the persons and vehicles by the
+   year of their COLLISION_ID, into pickled pieces under a temporary directory
+2. process (process pool, one task per year): clean the crashes and derive
+   YEAR / MONTH / DAY_OF_WEEK / HOUR and the street / intersection keys
+   (hotspots.py), aggregate the persons and the vehicles
+   per COLLISION_ID (vehicles.py) and join them
+3. merge: concatenate the yearly outputs in year order into the integrated
+   CSV and persons_for_app.csv, then profile the integrated CSV (profiling.py)
+
+The output only depends on the input, not on the number of workers: rows
+come out by year, in input order within a year.
+
+With --incremental, the keys and fingerprints of the records kept by earlier
+runs are loaded from DIR/etl_state, and only new records are appended.
+Persons of a collision kept by an earlier run are exported, but do not
+update that collision's person columns; its late vehicles are dropped.
+An output written with other columns (by an older version) is not appended
+to: run once without --incremental.
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import pandas as pd
+
+from crash_data import CSV_NAME
+from dedup import SeenSet
+from hotspots import location_keys
+from downloads import CRASHES_URL, PERSONS_URL, VEHICLES_URL, open_source
+from persons import PERSON_COLUMNS, PERSONS_CSV_NAME
+from vehicles import RAW_COLUMNS as VEHICLE_RAW_COLUMNS
+from vehicles import VEHICLE_AGG_COLUMNS, aggregate_vehicles, join_vehicles, vehicles_from_crashes
+
+CHUNKSIZE = 200_000
+STATE_DIR = "etl_state"
+WORKERS = os.cpu_count() or 1
+
+# Raw export column -> integrated column
+CRASH_RENAMES = {
+    "CRASH DATE": "CRASH_DATE",
+    "CRASH TIME": "CRASH_TIME",
+    "NUMBER OF PERSONS INJURED": "NUMBER_OF_PERSONS_INJURED",
+    "NUMBER OF PERSONS KILLED": "NUMBER_OF_PERSONS_KILLED",
+}
+
+FACTOR_COLUMNS = [f"CONTRIBUTING FACTOR VEHICLE {i}" for i in range(1, 6)]
+VEHICLE_TYPE_COLUMNS = [f"VEHICLE TYPE CODE {i}" for i in range(1, 6)]
+COUNT_COLUMNS = ["NUMBER_OF_PERSONS_INJURED", "NUMBER_OF_PERSONS_KILLED"]
+
+# Columns of the integrated CSV, in order
+CRASH_COLUMNS = (
+    ["CRASH_DATE", "CRASH_TIME", "BOROUGH", "LATITUDE", "LONGITUDE", "ON STREET NAME", "CROSS STREET NAME"]
+    + COUNT_COLUMNS + FACTOR_COLUMNS + ["COLLISION_ID"] + VEHICLE_TYPE_COLUMNS
+    + ["YEAR", "MONTH", "DAY_OF_WEEK", "HOUR", "STREET_KEY", "INTERSECTION_KEY"]
+)
+PERSON_AGG_COLUMNS = ["PERSON_TYPES", "PERSON_INJURIES", "AVG_PERSON_AGE", "PERSON_COUNT"]
+INTEGRATED_COLUMNS = CRASH_COLUMNS + PERSON_AGG_COLUMNS + VEHICLE_AGG_COLUMNS
+
+# Borough spellings -> standard name, as in the notebook's standardize_borough
+BOROUGH_NAMES = {
+    "MN": "MANHATTAN", "BK": "BROOKLYN", "BX": "BRONX", "QN": "QUEENS",
+    "SI": "STATEN ISLAND", "RICHMOND": "STATEN ISLAND",
+}
+
+# Values joined into PERSON_TYPES / PERSON_INJURIES per collision
+MAX_JOINED = 5
+
+
+def read_chunks(source, chunksize=CHUNKSIZE):
+    """The raw CSV, a path or an URL, in chunks, every column as text (see dedup.fingerprint)."""
+    with open_source(source) as f:
+        yield from pd.read_csv(f, dtype=str, chunksize=chunksize)
+
+
+def parse_dates(values):
+    """Dates as exported (MM/DD/YYYY), falling back to ISO 8601."""
+    dates = pd.to_datetime(values, format="%m/%d/%Y", errors="coerce")
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], format="ISO8601", errors="coerce")
+    return dates
+
+
+def clean_crashes(chunk):
+    """Cleaned crash rows with the CRASH_COLUMNS, from a raw chunk."""
+    df = chunk.rename(columns=CRASH_RENAMES)
+    df["COLLISION_ID"] = pd.to_numeric(df["COLLISION_ID"], errors="coerce")
+    df["CRASH_DATE"] = parse_dates(df["CRASH_DATE"])
+    # Rows without these are unusable
+    df = df.dropna(subset=["COLLISION_ID", "CRASH_DATE"])
+    df = df.assign(COLLISION_ID=df["COLLISION_ID"].astype("int64"))
+
+    borough = df["BOROUGH"].str.strip().str.upper()
+    df["BOROUGH"] = borough.replace(BOROUGH_NAMES).fillna("UNKNOWN")
+    for column in ["LATITUDE", "LONGITUDE"]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in COUNT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0).astype("int64")
+
+    df["YEAR"] = df["CRASH_DATE"].dt.year
+    df["MONTH"] = df["CRASH_DATE"].dt.month
+    df["DAY_OF_WEEK"] = df["CRASH_DATE"].dt.day_name()
+    df["HOUR"] = pd.to_datetime(df["CRASH_TIME"], format="%H:%M", errors="coerce").dt.hour.astype("Int64")
+    df["STREET_KEY"], df["INTERSECTION_KEY"] = location_keys(df["ON STREET NAME"], df["CROSS STREET NAME"])
+    return df.reindex(columns=CRASH_COLUMNS)
+
+
+def clean_persons(chunk):
+    """The persons.py columns of a raw persons chunk, typed."""
+    df = chunk.reindex(columns=list(PERSON_COLUMNS))
+    for column, dtype in PERSON_COLUMNS.items():
+        if dtype == "category":
+            df[column] = df[column].astype("category")
+        else:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64" if dtype == "int64" else dtype)
+    df = df.dropna(subset=["COLLISION_ID"])
+    return df.astype({c: t for c, t in PERSON_COLUMNS.items() if t == "int64"})
+
+
+def clean_vehicles(chunk):
+    """The vehicles.py columns of a raw vehicles chunk, with an integer COLLISION_ID."""
+    df = chunk.reindex(columns=VEHICLE_RAW_COLUMNS[1:])
+    df["COLLISION_ID"] = pd.to_numeric(df["COLLISION_ID"], errors="coerce")
+    df = df.dropna(subset=["COLLISION_ID"])
+    return df.astype({"COLLISION_ID": "int64"})
+
+
+def concat_chunks(chunks, columns):
+    """pd.concat that keeps categorical columns categorical across chunks."""
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    frame = pd.concat(chunks, ignore_index=True)
+    for column in columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            frame[column] = pd.api.types.union_categoricals([c[column] for c in chunks])
+    return frame
+
+
+def _join_unique(persons, column):
+    """Up to MAX_JOINED distinct values per collision, in order, joined with ', '."""
+    values = persons[["COLLISION_ID", column]].dropna().drop_duplicates()
+    position = values.groupby("COLLISION_ID").cumcount()
+    values, position = values[position < MAX_JOINED], position[position < MAX_JOINED]
+    if values.empty:
+        return pd.Series(dtype=object)
+    # One column per position, concatenated column-wise instead of a join per group
+    wide = values[column].astype(str).set_axis(pd.MultiIndex.from_arrays([values["COLLISION_ID"], position])).unstack()
+    joined = wide[0]
+    for i in wide.columns[1:]:
+        joined = joined + (", " + wide[i]).fillna("")
+    return joined
+
+
+def aggregate_persons(persons):
+    """Person columns of the integrated CSV, indexed by COLLISION_ID."""
+    grouped = persons["PERSON_AGE"].astype("float64").groupby(persons["COLLISION_ID"])
+    return pd.DataFrame({
+        "PERSON_TYPES": _join_unique(persons, "PERSON_TYPE"),
+        "PERSON_INJURIES": _join_unique(persons, "PERSON_INJURY"),
+        "AVG_PERSON_AGE": grouped.mean(),
+        "PERSON_COUNT": grouped.size(),
+    })
+
+
+def join_persons(crashes, persons_agg):
+    """Crash rows with the person columns; collisions without persons get the notebook's defaults."""
+    joined = crashes.join(persons_agg, on="COLLISION_ID") if persons_agg is not None else crashes.reindex(columns=CRASH_COLUMNS + PERSON_AGG_COLUMNS)
+    return joined.fillna({"PERSON_TYPES": "UNKNOWN", "PERSON_INJURIES": "UNKNOWN", "AVG_PERSON_AGE": 0, "PERSON_COUNT": 0}).astype({"PERSON_COUNT": "int64"})
+
+
+def _timed(phases, phase, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    phases[phase] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _piece(part_dir, year, kind, n):
+    os.makedirs(os.path.join(part_dir, str(year)), exist_ok=True)
+    return os.path.join(part_dir, str(year), f"{kind}-{n:06d}.pkl")
+
+
+def partition_crashes(source, seen, part_dir, chunksize=CHUNKSIZE):
+    """Deduplicate the raw crashes and split them by year.
+
+    Returns the kept COLLISION_IDs, sorted, and the year of each, for routing
+    the persons.
+    """
+    ids, years = [], []
+    for n, chunk in enumerate(read_chunks(source, chunksize)):
+        chunk = seen.filter(chunk)
+        year = parse_dates(chunk["CRASH DATE"]).dt.year
+        # Rows without a date or an id are dropped by clean_crashes anyway
+        collision_id = pd.to_numeric(chunk["COLLISION_ID"], errors="coerce")
+        usable = (year.notna() & collision_id.notna()).to_numpy()
+        chunk, year = chunk[usable], year[usable].astype("int64")
+        for y, piece in chunk.groupby(year, sort=False):
+            piece.to_pickle(_piece(part_dir, y, "crashes", n))
+        ids.append(collision_id[usable].to_numpy(dtype=np.int64))
+        years.append(year.to_numpy())
+    ids, years = np.concatenate(ids or [np.empty(0, np.int64)]), np.concatenate(years or [np.empty(0, np.int64)])
+    order = np.argsort(ids, kind="stable")
+    return ids[order], years[order]
+
+
+def _lookup(sorted_ids, ids):
+    """Position of each of `ids` in `sorted_ids`, and whether it is there."""
+    if not len(sorted_ids):
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    found = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return found, sorted_ids[found] == ids
+
+
+def partition_persons(source, seen, part_dir, crash_ids, crash_years, earlier_ids, chunksize=CHUNKSIZE):
+    """Deduplicate the raw persons and route them to the year of their collision.
+
+    Persons of collisions kept by an earlier run (`earlier_ids`, sorted) are
+    returned cleaned, for export only; persons of unknown collisions are dropped.
+    """
+    previous = []
+    for n, chunk in enumerate(read_chunks(source, chunksize)):
+        chunk = seen.filter(chunk)
+        collision_id = pd.to_numeric(chunk["COLLISION_ID"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+        found, known = _lookup(crash_ids, collision_id)
+        for y, piece in chunk[known].groupby(crash_years[found[known]], sort=False):
+            piece.to_pickle(_piece(part_dir, y, "persons", n))
+        previous.append(clean_persons(chunk[~known & _lookup(earlier_ids, collision_id)[1]]))
+    return concat_chunks(previous, list(PERSON_COLUMNS))
+
+
+def partition_vehicles(source, seen, part_dir, crash_ids, crash_years, chunksize=CHUNKSIZE):
+    """Deduplicate the raw vehicles and route them to the year of their collision.
+
+    Only the vehicles.RAW_COLUMNS are kept. Vehicles of collisions not kept
+    by this run are dropped: the vehicles are not exported on their own.
+    """
+    for n, chunk in enumerate(read_chunks(source, chunksize)):
+        chunk = seen.filter(chunk).reindex(columns=VEHICLE_RAW_COLUMNS)
+        collision_id = pd.to_numeric(chunk["COLLISION_ID"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+        found, known = _lookup(crash_ids, collision_id)
+        for y, piece in chunk[known].groupby(crash_years[found[known]], sort=False):
+            piece.to_pickle(_piece(part_dir, y, "vehicles", n))
+
+
+def _read_pieces(year_dir, kind):
+    paths = sorted(glob.glob(os.path.join(year_dir, f"{kind}-*.pkl")))
+    return [pd.read_pickle(p) for p in paths]
+
+
+def process_partition(year_dir, with_persons, with_vehicles=False):
+    """Clean, aggregate and join one year; writes crashes.csv and persons.csv (no header) in `year_dir`.
+
+    Without the vehicles export, the vehicle columns come from the crashes'
+    VEHICLE TYPE CODE columns. Runs in a pool worker. Returns (crash rows, person rows).
+    """
+    persons, persons_agg = None, None
+    if with_persons:
+        pieces = _read_pieces(year_dir, "persons")
+        persons = clean_persons(pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=list(PERSON_COLUMNS)))
+        persons_agg = aggregate_persons(persons)
+        persons = persons.sort_values("COLLISION_ID", kind="stable")
+        persons.to_csv(os.path.join(year_dir, "persons.csv"), header=False, index=False)
+    crashes = join_persons(clean_crashes(pd.concat(_read_pieces(year_dir, "crashes"), ignore_index=True)), persons_agg)
+    if with_vehicles:
+        pieces = _read_pieces(year_dir, "vehicles")
+        vehicles = clean_vehicles(pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=VEHICLE_RAW_COLUMNS))
+    else:
+        vehicles = vehicles_from_crashes(crashes)
+    crashes = join_vehicles(crashes, aggregate_vehicles(vehicles))[INTEGRATED_COLUMNS]
+    crashes.to_csv(os.path.join(year_dir, "crashes.csv"), header=False, index=False, date_format="%Y-%m-%d")
+    return len(crashes), 0 if persons is None else len(persons)
+
+
+def _start_output(path, columns, incremental):
+    """A temporary file to write `path` into: a copy of it for incremental runs, else a header."""
+    tmp = path + ".tmp"
+    if incremental and os.path.exists(path):
+        header = pd.read_csv(path, nrows=0).columns.tolist()
+        if header != list(columns):
+            raise RuntimeError(f"{path} has other columns than this version writes: run once without --incremental")
+        shutil.copyfile(path, tmp)
+    else:
+        pd.DataFrame(columns=columns).to_csv(tmp, index=False)
+    return tmp
+
+
+def _merge(tmp, parts):
+    with open(tmp, "ab") as out:
+        for part in parts:
+            if os.path.exists(part):
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out)
+
+
+def run(crashes_path, persons_path=None, out_dir=".", workers=WORKERS, chunksize=CHUNKSIZE, incremental=False, thresholds=None,
+        vehicles_path=None):
+    """Run the ETL; returns the data-quality report of the integrated CSV, with the run's counts under "etl"."""
+    import profiling
+
+    out_path = os.path.join(out_dir, CSV_NAME)
+    persons_out = os.path.join(out_dir, PERSONS_CSV_NAME)
+    state_dir = os.path.join(out_dir, STATE_DIR)
+    os.makedirs(state_dir, exist_ok=True)
+    crash_state, person_state = os.path.join(state_dir, "crashes.npz"), os.path.join(state_dir, "persons.npz")
+    vehicle_state = os.path.join(state_dir, "vehicles.npz")
+    if incremental and os.path.exists(out_path) and not os.path.exists(crash_state):
+        raise RuntimeError(f"No ETL state in {state_dir} for {out_path}: run once without --incremental")
+    crash_seen = SeenSet("COLLISION_ID", crash_state if incremental else None)
+    person_seen = SeenSet("UNIQUE_ID", person_state if incremental else None)
+    vehicle_seen = SeenSet("UNIQUE_ID", vehicle_state if incremental else None)
+    # Collisions kept by earlier runs, for their late persons (SeenSet
+    # replaces its arrays rather than growing them in place)
+    earlier_ids = crash_seen.keys
+
+    phases = {}
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix=".etl-") as part_dir:
+        crash_ids, crash_years = _timed(phases, "partition_crashes", partition_crashes, crashes_path, crash_seen, part_dir, chunksize)
+        print(f"✓ Crashes: {len(crash_ids):,} kept of {crash_seen.counts['rows']:,} - {crash_seen.counts}")
+        previous = None
+        if persons_path:
+            previous = _timed(phases, "partition_persons", partition_persons,
+                              persons_path, person_seen, part_dir, crash_ids, crash_years, earlier_ids, chunksize)
+            print(f"✓ Persons: {person_seen.counts['kept']:,} kept of {person_seen.counts['rows']:,} - {person_seen.counts}")
+        if vehicles_path:
+            _timed(phases, "partition_vehicles", partition_vehicles, vehicles_path, vehicle_seen, part_dir, crash_ids, crash_years, chunksize)
+            print(f"✓ Vehicles: {vehicle_seen.counts['kept']:,} kept of {vehicle_seen.counts['rows']:,} - {vehicle_seen.counts}")
+
+        year_dirs = [os.path.join(part_dir, str(y)) for y in np.unique(crash_years)]
+        flags = [bool(persons_path)] * len(year_dirs), [bool(vehicles_path)] * len(year_dirs)
+        start = time.perf_counter()
+        if workers > 1 and len(year_dirs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                counts = list(pool.map(process_partition, year_dirs, *flags))
+        else:
+            counts = list(map(process_partition, year_dirs, *flags))
+        phases["process"] = round(time.perf_counter() - start, 3)
+        print(f"✓ Processed {len(year_dirs)} yearly partitions on {workers} worker(s) in {phases['process']}s")
+
+        start = time.perf_counter()
+        tmp = _start_output(out_path, INTEGRATED_COLUMNS, incremental)
+        _merge(tmp, [os.path.join(d, "crashes.csv") for d in year_dirs])
+        if persons_path:
+            persons_tmp = _start_output(persons_out, list(PERSON_COLUMNS), incremental)
+            _merge(persons_tmp, [os.path.join(d, "persons.csv") for d in year_dirs])
+            previous.to_csv(persons_tmp, mode="a", header=False, index=False)
+            os.replace(persons_tmp, persons_out)
+            print(f"✓ Wrote {sum(p for _, p in counts) + len(previous):,} persons to {persons_out}")
+        os.replace(tmp, out_path)
+        phases["merge"] = round(time.perf_counter() - start, 3)
+    crash_seen.save(crash_state)
+    person_seen.save(person_state)
+    vehicle_seen.save(vehicle_state)
+    print(f"✓ Wrote {sum(c for c, _ in counts):,} crashes to {out_path} - phases: {phases}")
+
+    report = profiling.profile_csv(out_path, chunksize)
+    report["failures"] = profiling.check_thresholds(report, thresholds or profiling.THRESHOLDS)
+    report["etl"] = {"workers": workers, "partitions": len(year_dirs), "phases": phases,
+                     "crashes": crash_seen.counts, "persons": person_seen.counts, "vehicles": vehicle_seen.counts}
+    profiling.write_report(report, profiling.report_path(out_path))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("crashes", nargs="?", default=CRASHES_URL, help="raw crashes CSV, path or URL (default: the h9gi-nx95 export)")
+    parser.add_argument("persons", nargs="?", default=PERSONS_URL, help="raw persons CSV, path or URL (default: the f55k-p6yu export)")
+    parser.add_argument("vehicles", nargs="?", default=VEHICLES_URL, help="raw vehicles CSV, path or URL (default: the bm4k-52h4 export)")
+    parser.add_argument("--out-dir", default=".", help="where to write the CSVs (default: current directory)")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"processes for the yearly partitions (default: {WORKERS})")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk")
+    parser.add_argument("--incremental", action="store_true", help="append only records not seen by earlier runs")
+    parser.add_argument("--thresholds", help="JSON file overriding profiling.THRESHOLDS")
+    args = parser.parse_args()
+
+    import profiling
+
+    report = run(args.crashes, args.persons, args.out_dir, args.workers, args.chunksize, args.incremental,
+                 profiling.load_thresholds(args.thresholds), args.vehicles)
+    for failure in report["failures"]:
+        print(f"✗ {failure}")
+    if report["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
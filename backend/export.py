@@ -0,0 +1,98 @@
+import io
+
+import pandas as pd
+
+from filters import iter_filtered_chunks
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+DEFAULT_CHUNK_SIZE = 50_000
+MAX_CHUNK_SIZE = 500_000
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+def resolve_columns(available, columns):
+    """Validate a column projection against the `available` columns. Returns the list of columns to export."""
+    if not columns:
+        return list(available)
+    if isinstance(columns, str):
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in available]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return list(columns)
+
+
+def _csv_chunks(chunks, columns):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+    if header:
+        # Nothing matched: still send the header row
+        yield pd.DataFrame(columns=columns).to_csv(index=False)
+
+
+def _ndjson_chunks(chunks):
+    for chunk in chunks:
+        if len(chunk):
+            # to_json ends the last record with a newline already (pandas >= 1.5)
+            lines = chunk.to_json(orient="records", lines=True, date_format="iso")
+            yield lines if lines.endswith("\n") else lines + "\n"
+
+
+def _arrow_chunks(chunks):
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for chunk in chunks:
+        if writer is None:
+            # The first block fixes the schema; later blocks are cast to it.
+            # All-null object columns would infer as null, so type them as strings.
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            schema = pa.schema([
+                f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in schema
+            ])
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
+
+def stream_export(data, fmt, columns=None, chunk_size=DEFAULT_CHUNK_SIZE, **filters):
+    """Generator of encoded export chunks for the rows of `data` (the crash table or a SqliteStore) matching `filters`.
+
+    Only one block of `chunk_size` source rows is held in memory at a time.
+    Raises ValueError for an unknown format or column before anything is yielded.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == "arrow" and pa is None:
+        raise ValueError("Arrow export requires pyarrow to be installed")
+    chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+    if isinstance(data, pd.DataFrame):
+        columns = resolve_columns(data.columns, columns)
+        blocks = iter_filtered_chunks(data, chunk_size, **filters)
+    else:
+        # A SqliteStore: the query returns the rows chunk by chunk, without
+        # the columns only kept for filtering
+        columns = resolve_columns(data.table_columns, columns)
+        blocks = data.iter_filtered_chunks(chunk_size, **filters)
+    chunks = (chunk[columns] for chunk in blocks)
+    if fmt == "csv":
+        return _csv_chunks(chunks, columns)
+    if fmt == "ndjson":
+        return _ndjson_chunks(chunks)
+    return _arrow_chunks(chunks)
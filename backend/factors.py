@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+FACTOR_COLUMNS = [f"CONTRIBUTING FACTOR VEHICLE {i}" for i in range(1, 6)]
+
+# How the factor filter reads the factor columns: only vehicle 1 (the
+# original behaviour) or any of the vehicles in the crash
+FACTOR_SCOPES = ["vehicle_1", "any_vehicle"]
+DEFAULT_FACTOR_SCOPE = "vehicle_1"
+
+TOP_FACTORS = 10
+
+
+def check_factor_scope(factor_scope):
+    """Raise ValueError unless `factor_scope` is one of FACTOR_SCOPES."""
+    if factor_scope not in FACTOR_SCOPES:
+        raise ValueError(f"Unknown factor_scope '{factor_scope}'. Use one of: {', '.join(FACTOR_SCOPES)}")
+
+
+def _factor_codes(column, factors):
+    """Position of each row's value in `factors`, -1 where missing."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        lookup = np.append(factors.get_indexer(column.cat.categories.astype(str)), -1)
+        return lookup[column.cat.codes.to_numpy()]
+    return factors.get_indexer(column)
+
+
+def build_factor_index(df):
+    """factor -> rows index over all CONTRIBUTING FACTOR VEHICLE columns, CSR style.
+
+    The rows of the crash table where any vehicle had `factors[i]` are
+    `rows[offsets[i]:offsets[i + 1]]`, in ascending order and each listed once
+    even when several vehicles share the factor. Row numbers are positions in
+    the date-sorted table, which are also its index labels. The same entries
+    are also kept by row: the factors of row `r` are
+    `row_factors[row_offsets[r]:row_offsets[r + 1]]`.
+    """
+    columns = [c for c in FACTOR_COLUMNS if c in df.columns]
+    factors = pd.Index(sorted(set().union(*(df[c].dropna().astype(str).unique() for c in columns))))
+    n_rows = len(df)
+
+    codes = np.stack([_factor_codes(df[c], factors) for c in columns], axis=1) if columns else np.empty((n_rows, 0), dtype=np.int64)
+    row_numbers = np.repeat(np.arange(n_rows, dtype=np.int64), codes.shape[1])
+    codes = codes.ravel().astype(np.int64)
+    present = codes >= 0
+    # One sort of (factor, row) keys groups the rows by factor and drops repeats
+    keys = np.unique(codes[present] * n_rows + row_numbers[present])
+    entry_factor = keys // max(n_rows, 1)
+    entry_row = keys % max(n_rows, 1)
+    by_row = np.argsort(entry_row, kind="stable")
+
+    return {
+        "factors": factors,
+        "offsets": np.searchsorted(entry_factor, np.arange(len(factors) + 1)),
+        "rows": entry_row.astype(np.int32 if n_rows < 2**31 else np.int64),
+        "row_offsets": np.searchsorted(entry_row[by_row], np.arange(n_rows + 1)),
+        "row_factors": entry_factor[by_row].astype(np.int32),
+        "n_rows": n_rows,
+    }
+
+
+def loaded_index():
+    """The factor index of the loaded table, or None before it is built."""
+    import crash_data
+
+    return crash_data.get_index("factors")
+
+
+def any_vehicle_mask(data, factors, index=None):
+    """Boolean array: did any vehicle in each row of `data` have one of `factors`.
+
+    `data` is the loaded table or a subset of its rows that kept the index
+    labels (slices, filtered frames, the sample). The rows come from the
+    factor index; without one the factor columns are scanned instead.
+    """
+    index = index if index is not None else loaded_index()
+    if index is None:
+        found = np.zeros(len(data), dtype=bool)
+        for col in FACTOR_COLUMNS:
+            if col in data.columns:
+                found |= data[col].isin(factors).to_numpy()
+        return found
+
+    wanted = index["factors"].get_indexer(factors)
+    table_mask = np.zeros(index["n_rows"], dtype=bool)
+    for i in wanted[wanted >= 0]:
+        table_mask[index["rows"][index["offsets"][i]:index["offsets"][i + 1]]] = True
+    return table_mask[data.index.to_numpy()]
+
+
+def factor_counts(d, weight=None, top=TOP_FACTORS, index=None):
+    """Crashes per contributing factor across all vehicles, largest first.
+
+    A crash counts once for each distinct factor any of its vehicles had, so
+    the counts add up to more than the number of crashes. Returns the `top`
+    factors as a frame with FACTOR and COUNT, or None without a factor index.
+    """
+    index = index if index is not None else loaded_index()
+    if index is None:
+        return None
+    per_row = np.zeros(index["n_rows"])
+    per_row[d.index.to_numpy()] = d[weight].to_numpy() if weight is not None else 1.0
+    # Counts per factor are differences of a running sum over the CSR rows
+    running = np.concatenate(([0.0], np.cumsum(per_row[index["rows"]])))
+    counts = running[index["offsets"][1:]] - running[index["offsets"][:-1]]
+    return top_factors(index, counts, top)
+
+
+def top_factors(index, counts, top=TOP_FACTORS):
+    """The `top` largest of per-factor `counts` as a frame with FACTOR and COUNT."""
+    counts = pd.DataFrame({"FACTOR": index["factors"], "COUNT": np.round(counts).astype(int)})
+    counts = counts[counts["COUNT"] > 0]
+    return counts.sort_values(["COUNT", "FACTOR"], ascending=[False, True]).head(top).reset_index(drop=True)
+
+
+def grouped_factor_counts(rows, groups, n_groups, index=None):
+    """(n_groups x factors) crash counts for (row, group) pairs, in one bincount.
+
+    `rows` are row labels of the loaded table and `groups` the group of each
+    pair; a row may appear in several groups. Returns None without a factor index.
+    """
+    index = index if index is not None else loaded_index()
+    if index is None:
+        return None
+    # Expand each pair into one entry per factor of its row, via the by-row CSR
+    starts = index["row_offsets"][rows]
+    sizes = index["row_offsets"][rows + 1] - starts
+    pair = np.repeat(np.arange(len(rows)), sizes)
+    within = np.arange(len(pair)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    factor = index["row_factors"][starts[pair] + within]
+    n_factors = len(index["factors"])
+    table = np.bincount(groups[pair] * n_factors + factor, minlength=n_groups * n_factors)
+    return table.reshape(n_groups, n_factors)
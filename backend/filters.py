@@ -0,0 +1,207 @@
+import numpy as np
+import pandas as pd
+
+from factors import DEFAULT_FACTOR_SCOPE, any_vehicle_mask, check_factor_scope
+from vehicles import vehicle_type_mask
+
+FACTOR_COLUMN = "CONTRIBUTING FACTOR VEHICLE 1"
+
+# Low-cardinality text columns stored as pandas categoricals, so filters and
+# search work on the small integer codes instead of comparing strings per row
+CATEGORICAL_COLUMNS = ["BOROUGH", "SEVERITY", FACTOR_COLUMN, "PERSON_TYPES", "PERSON_INJURIES",
+                       "TOP_VEHICLE_TYPE", "TOP_VEHICLE_MAKE", "TOP_PRE_CRASH", "STREET_KEY", "INTERSECTION_KEY"]
+
+# Filter dimensions that accept a list of values (any of them matches)
+MULTI_FILTERS = ["borough", "year", "factor", "severity", "vehicle_type"]
+
+FILTER_DEFAULTS = {
+    "borough": None,
+    "year": None,
+    "factor": None,
+    "severity": None,
+    "vehicle_type": None,
+    "factor_scope": DEFAULT_FACTOR_SCOPE,
+    "search_query": "",
+    "start_date": None,
+    "end_date": None,
+}
+
+
+def as_value_list(value):
+    """Normalize a filter value to a sorted list of selected values, or None for "All".
+
+    Accepts a single value or a list. An empty selection, or one containing
+    "All", means no filtering on that dimension.
+    """
+    if value is None:
+        return None
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    values = [str(v) for v in values if v is not None and str(v) != ""]
+    if not values or "All" in values:
+        return None
+    return sorted(set(values))
+
+
+def parse_filters(payload):
+    """Pick the filter arguments for apply_filters out of a request body or query string.
+
+    Multi-value dimensions come back as sorted lists (or None), and dates are
+    validated here so a bad value fails the request up front.
+    """
+    filters = {key: payload.get(key) or default for key, default in FILTER_DEFAULTS.items()}
+    for key in MULTI_FILTERS:
+        filters[key] = as_value_list(filters[key])
+    if filters["year"]:
+        filters["year"] = [str(int(y)) for y in filters["year"]]
+    check_factor_scope(filters["factor_scope"])
+    for key in ("start_date", "end_date"):
+        if filters[key]:
+            filters[key] = pd.Timestamp(filters[key]).strftime("%Y-%m-%d")
+    return filters
+
+
+def encode_categories(data):
+    """Store the CATEGORICAL_COLUMNS present in `data` as categoricals, in place."""
+    for col in CATEGORICAL_COLUMNS:
+        if col in data.columns and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            data[col] = data[col].astype("category")
+    return data
+
+
+def sort_by_date(data):
+    """Order the table by CRASH_DATE so date ranges resolve to contiguous slices.
+
+    Every function here that takes `start_date`/`end_date` expects data that
+    went through this once at load time.
+    """
+    return data.sort_values("CRASH_DATE", kind="stable").reset_index(drop=True)
+
+
+def date_bounds(data, start_date=None, end_date=None):
+    """Positions [lo, hi) of the rows of date-sorted `data` inside the date range.
+
+    Both bounds are inclusive calendar days and either may be omitted. They
+    are found by binary search, so no per-row comparison happens.
+    """
+    lo = 0
+    hi = len(data)
+    if not start_date and not end_date:
+        return lo, hi
+    dates = data["CRASH_DATE"].values
+    if start_date:
+        lo = dates.searchsorted(pd.Timestamp(start_date).normalize().to_datetime64(), side="left")
+    if end_date:
+        end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        hi = dates.searchsorted(end.to_datetime64(), side="left")
+    return int(lo), int(max(lo, hi))
+
+
+def date_slice(data, start_date=None, end_date=None):
+    """Rows of date-sorted `data` with start_date <= CRASH_DATE <= end_date, as a slice (view)."""
+    if not start_date and not end_date:
+        return data
+    lo, hi = date_bounds(data, start_date, end_date)
+    return data.iloc[lo:hi]
+
+
+def _isin(column, values):
+    """Boolean array: does each row of `column` equal one of `values`."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # OR the selected categories into a lookup table indexed by code. The
+        # extra last slot stays False and catches the -1 code of missing values.
+        wanted = column.cat.categories.get_indexer(values)
+        lookup = np.zeros(len(column.cat.categories) + 1, dtype=bool)
+        lookup[wanted[wanted >= 0]] = True
+        return lookup[column.cat.codes.to_numpy()]
+    return column.isin(values).to_numpy()
+
+
+def _contains(column, q):
+    """Boolean array: does each row of `column` contain the lowercase text `q`."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Only the distinct values are searched, then mapped back by code
+        matched = column.cat.categories[column.cat.categories.astype(str).str.lower().str.contains(q, regex=False)]
+        return _isin(column, matched)
+    if pd.api.types.is_integer_dtype(column.dtype):
+        distinct = column.unique()
+        return _isin(column, distinct[pd.Index(distinct.astype(str)).str.contains(q, regex=False)])
+    return column.fillna("").astype(str).str.lower().str.contains(q, regex=False).to_numpy()
+
+
+def filter_mask(data, borough=None, year=None, factor=None, severity=None, search_query=None,
+                factor_scope=DEFAULT_FACTOR_SCOPE, vehicle_type=None):
+    """Boolean array of the rows of `data` matching the filters and search query.
+
+    Each dimension takes one value or a list of values; a row matches a
+    dimension when it equals any of them. With `factor_scope="any_vehicle"`
+    the factor matches when any vehicle in the crash had it, not only vehicle 1.
+    A vehicle type (vehicles.VEHICLE_TYPES) matches when any vehicle was of it.
+    """
+    check_factor_scope(factor_scope)
+    mask = np.ones(len(data), dtype=bool)
+
+    boroughs = as_value_list(borough)
+    if boroughs:
+        mask &= _isin(data["BOROUGH"], boroughs)
+
+    years = as_value_list(year)
+    if years:
+        mask &= _isin(data["YEAR"], [int(y) for y in years])
+
+    factors = as_value_list(factor)
+    if factors and factor_scope == "any_vehicle":
+        mask &= any_vehicle_mask(data, factors)
+    elif factors and FACTOR_COLUMN in data.columns:
+        mask &= _isin(data[FACTOR_COLUMN], factors)
+
+    severities = as_value_list(severity)
+    if severities and "SEVERITY" in data.columns:
+        mask &= _isin(data["SEVERITY"], severities)
+
+    vehicle_types = as_value_list(vehicle_type)
+    if vehicle_types:
+        mask &= vehicle_type_mask(data, vehicle_types)
+
+    # Simple search mode: look in BOROUGH, PERSON_TYPES, PERSON_INJURIES, factor, YEAR
+    if search_query and search_query.strip():
+        q = search_query.strip().lower()
+        found = np.zeros(len(data), dtype=bool)
+        for col in ["BOROUGH", "PERSON_TYPES", "PERSON_INJURIES", FACTOR_COLUMN, "YEAR"]:
+            if col in data.columns:
+                found |= _contains(data[col], q)
+        mask &= found
+
+    return mask
+
+
+def apply_filters(data, borough=None, year=None, factor=None, severity=None, search_query=None,
+                  start_date=None, end_date=None, factor_scope=DEFAULT_FACTOR_SCOPE, vehicle_type=None):
+    """Rows of `data` matching the filters. Returns a new frame, `data` is untouched.
+
+    The date range is resolved first as a slice of the date-sorted table, the
+    remaining filters only scan the rows inside it.
+    """
+    d = date_slice(data, start_date, end_date)
+    return d[filter_mask(d, borough, year, factor, severity, search_query, factor_scope, vehicle_type)]
+
+
+def filter_positions(data, borough=None, year=None, factor=None, severity=None, search_query=None,
+                     start_date=None, end_date=None, factor_scope=DEFAULT_FACTOR_SCOPE, vehicle_type=None):
+    """Row positions in `data` of the rows matching the filters, as an int array."""
+    lo, hi = date_bounds(data, start_date, end_date)
+    mask = filter_mask(data.iloc[lo:hi], borough, year, factor, severity, search_query, factor_scope, vehicle_type)
+    return lo + np.flatnonzero(mask)
+
+
+def iter_filtered_chunks(data, chunk_size, start_date=None, end_date=None, **filters):
+    """Yield the filtered rows of `data` block by block.
+
+    The table is scanned in fixed-size row blocks and the filters are applied
+    to each block on its own, so at most `chunk_size` rows are materialized at
+    a time regardless of how many rows match overall.
+    """
+    data = date_slice(data, start_date, end_date)
+    for start in range(0, len(data), chunk_size):
+        block = apply_filters(data.iloc[start:start + chunk_size], **filters)
+        if not block.empty:
+            yield block
@@ -0,0 +1,287 @@
+"""Top-K streets and intersections by crashes, injured or killed.
+
+STREET_KEY and INTERSECTION_KEY are ON STREET NAME / CROSS STREET NAME with
+spelling variants folded together ("3RD AVE." and "3 AVENUE"), written by the
+ETL (or derived at load from an older CSV). An intersection is the two
+street keys in alphabetical order, so "A & B" and "B & A" are one location.
+
+At load the counts per location are pre-aggregated in each partition, a
+(year, borough, severity) cell, and sorted by count within it. A top-K query
+on those dimensions merges the selected partitions with the threshold
+algorithm: it reads the partitions' lists from the top, keeps the best K
+exact totals in a heap, and stops once no unread location can beat the K-th.
+Other filters (factor, vehicle type, search, dates) are answered from the
+matching rows instead.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from rollups import METRICS
+
+KINDS = {"street": "STREET_KEY", "intersection": "INTERSECTION_KEY"}
+DEFAULT_KIND = "intersection"
+DEFAULT_K = 10
+MAX_K = 100
+
+# Partition dimensions -> column; YEAR is the third
+PARTITION_COLUMNS = {"borough": "BOROUGH", "severity": "SEVERITY"}
+# Filters the partitions cannot answer
+ROW_FILTERS = ["factor", "vehicle_type", "search_query", "start_date", "end_date"]
+
+# Abbreviation -> word, anywhere in the name
+WORDS = {
+    "AVE": "AVENUE", "AV": "AVENUE", "AVENU": "AVENUE", "BLVD": "BOULEVARD", "BLVRD": "BOULEVARD",
+    "RD": "ROAD", "PKWY": "PARKWAY", "PKY": "PARKWAY", "EXPY": "EXPRESSWAY", "EXPWY": "EXPRESSWAY",
+    "EXWY": "EXPRESSWAY", "HWY": "HIGHWAY", "PL": "PLACE", "DR": "DRIVE", "LN": "LANE", "CT": "COURT",
+    "TER": "TERRACE", "TERR": "TERRACE", "SQ": "SQUARE", "BRG": "BRIDGE", "TPKE": "TURNPIKE", "STR": "STREET",
+}
+# Only as the first word: "E 14 ST", not "AVENUE E"
+DIRECTIONS = {"E": "EAST", "W": "WEST", "N": "NORTH", "S": "SOUTH"}
+
+
+def normalize_streets(values):
+    """Street key of each street name, NaN where missing.
+
+    Upper case without punctuation, ordinal suffixes dropped ("3RD" -> "3"),
+    common abbreviations spelled out, and ST read as STREET at the end (ST
+    MARKS PLACE keeps its ST). Only the distinct names are normalized.
+    """
+    values = pd.Series(values)
+    distinct = pd.Index(values.dropna().unique()).astype(str)
+    names = (distinct.str.upper().str.replace(r"[.,'`]", "", regex=True)
+             .str.replace(r"\s+", " ", regex=True).str.strip())
+    names = names.str.replace(r"\b(\d+)(?:ST|ND|RD|TH)\b", r"\1", regex=True)
+    names = names.str.replace(r"\b(" + "|".join(WORDS) + r")\b", lambda m: WORDS[m[1]], regex=True)
+    names = names.str.replace(r"^([ENSW]) ", lambda m: DIRECTIONS[m[1]] + " ", regex=True)
+    names = names.str.replace(r" ST$", " STREET", regex=True)
+    keys = pd.Series(names.where(names != ""), index=distinct)
+    return values.map(keys)
+
+
+def location_keys(on_street, cross_street):
+    """(STREET_KEY, INTERSECTION_KEY) of crashes from their ON and CROSS STREET NAME.
+
+    The intersection is missing when either street is, or both are the same.
+    """
+    on, cross = normalize_streets(on_street), normalize_streets(cross_street)
+    first = on.where(on <= cross, cross)
+    second = cross.where(on <= cross, on)
+    intersection = (first + " & " + second).where(on.notna() & cross.notna() & (on != cross))
+    return on, intersection
+
+
+def parse_hotspots(payload):
+    """Kind, metric and k of a hotspots request. Raises ValueError."""
+    kind = payload.get("kind") or DEFAULT_KIND
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind '{kind}'. Use one of: {', '.join(KINDS)}")
+    metric = payload.get("metric") or "crashes"
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}")
+    k = int(payload.get("k", DEFAULT_K))
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f"k must be between 1 and {MAX_K}")
+    return {"kind": kind, "metric": metric, "k": k}
+
+
+def _codes(column):
+    """Category codes (-1 where missing) and categories of a column, categorical or not."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    codes, categories = pd.factorize(column, sort=True)
+    return codes.astype(np.int64), categories
+
+
+def _weights(df, positions=None):
+    """Per-row value of each metric, for all rows or those at `positions`."""
+    positions = np.arange(len(df)) if positions is None else positions
+    weights = {"crashes": np.ones(len(positions), dtype=np.int64)}
+    for metric, column in [("injured", "NUMBER_OF_PERSONS_INJURED"), ("killed", "NUMBER_OF_PERSONS_KILLED")]:
+        values = df[column].fillna(0).to_numpy(dtype=np.int64)[positions] if column in df.columns else None
+        weights[metric] = values if values is not None else np.zeros(len(positions), dtype=np.int64)
+    return weights
+
+
+def build_hotspot_index(df):
+    """Per-partition location counts for each of KINDS, sorted by count.
+
+    Partitions are (year, borough, severity) cells; each dimension has an
+    extra last code for missing values. For a kind, the entries of cell `c`
+    are `offsets[c]:offsets[c + 1]`, one per location with a crash there;
+    `keys` (cell * locations + location code) sorts them by cell, then
+    location. `order[metric]` lists the same entries sorted by count, largest
+    first, within each cell.
+    """
+    dimensions, cell = {}, np.zeros(len(df), dtype=np.int64)
+    year = df["YEAR"].to_numpy(dtype=float) if "YEAR" in df.columns else np.full(len(df), np.nan)
+    years = np.unique(year[~np.isnan(year)]).astype(np.int64)
+    codes = np.where(np.isnan(year), len(years), np.searchsorted(years, np.nan_to_num(year)))
+    dimensions["year"] = pd.Index(years)
+    cell = codes
+    for name, column in PARTITION_COLUMNS.items():
+        if column in df.columns:
+            codes, categories = _codes(df[column])
+        else:
+            codes, categories = np.full(len(df), -1, dtype=np.int64), pd.Index([])
+        dimensions[name] = categories
+        cell = cell * (len(categories) + 1) + np.where(codes < 0, len(categories), codes)
+    n_cells = int(np.prod([len(c) + 1 for c in dimensions.values()]))
+
+    weights = _weights(df)
+    index = {"dimensions": dimensions, "kinds": {}}
+    for kind, column in KINDS.items():
+        if column not in df.columns:
+            continue
+        locations, names = _codes(df[column])
+        present = locations >= 0
+        keys, inverse = np.unique(cell[present] * max(len(names), 1) + locations[present], return_inverse=True)
+        entry_cell = keys // max(len(names), 1)
+        counts = {m: np.bincount(inverse, weights=weights[m][present], minlength=len(keys)).astype(np.int64) for m in METRICS}
+        index["kinds"][kind] = {
+            "names": names,
+            "keys": keys,
+            "offsets": np.searchsorted(entry_cell, np.arange(n_cells + 1)),
+            "counts": counts,
+            # Stable: equal counts stay in location (= name) order
+            "order": {m: np.lexsort((-counts[m], entry_cell)).astype(np.int32) for m in METRICS},
+        }
+    return index
+
+
+def loaded_index():
+    """The hotspot index of the loaded table, or None before it is built."""
+    import crash_data
+
+    return crash_data.get_index("hotspots")
+
+
+def is_partitioned(filters):
+    """Can these parsed filters be answered from the partitions alone."""
+    return not any(filters.get(name) for name in ROW_FILTERS)
+
+
+def partition_cells(index, borough=None, year=None, severity=None):
+    """Cells of the index selected by the borough / year / severity filters."""
+    from filters import as_value_list
+
+    selected = np.ones(1, dtype=bool)
+    for name, values in [("year", year), ("borough", borough), ("severity", severity)]:
+        categories = index["dimensions"][name]
+        values = as_value_list(values)
+        wanted = np.ones(len(categories) + 1, dtype=bool)
+        if values:
+            wanted[:] = False
+            found = categories.get_indexer([int(v) for v in values] if name == "year" else values)
+            wanted[found[found >= 0]] = True
+        selected = np.outer(selected, wanted).ravel()
+    return np.flatnonzero(selected)
+
+
+# (cell, location) pairs looked up at once by _totals
+LOOKUP_BLOCK = 1 << 20
+
+
+def _totals(entries, cells, codes, metric):
+    """Total `metric` of each location code over the cells, by binary search of the (cell, location) keys."""
+    keys, counts = entries["keys"], entries["counts"][metric]
+    totals = np.zeros(len(codes), dtype=np.int64)
+    if not len(keys) or not len(cells):
+        return totals
+    step = max(LOOKUP_BLOCK // max(len(cells), 1), 1)
+    for lo in range(0, len(codes), step):
+        block = codes[lo:lo + step].astype(np.int64)
+        wanted = (cells[:, None].astype(np.int64) * len(entries["names"]) + block[None, :]).ravel()
+        at = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        found = keys[at] == wanted
+        totals[lo:lo + step] = np.where(found, counts[at], 0).reshape(len(cells), len(block)).sum(axis=0)
+    return totals
+
+
+def top_k(entries, cells, metric, k):
+    """The k locations with the largest total `metric` over the cells, as (code, total) pairs.
+
+    Threshold algorithm over the cells' lists sorted by count: read the next
+    block of each list, total the new locations exactly, and keep the best k
+    in a min-heap. An unread location has at most the next count of each
+    list, so once the heap's smallest total beats their sum the answer is
+    final. Locations with a total of 0 are left out; ties go to the name
+    that sorts first.
+    """
+    starts, ends = entries["offsets"][cells], entries["offsets"][cells + 1]
+    nonempty = ends > starts
+    cells, starts, ends = cells[nonempty], starts[nonempty], ends[nonempty]
+    order, counts = entries["order"][metric], entries["counts"][metric]
+
+    heap, seen = [], np.empty(0, dtype=np.int64)
+    depth, block = 0, k
+    while len(cells):
+        positions = starts[:, None] + depth + np.arange(block)
+        read = order[positions[positions < ends[:, None]]]
+        new = np.setdiff1d(entries["keys"][read] % max(len(entries["names"]), 1), seen)
+        seen = np.union1d(seen, new)
+        totals = _totals(entries, cells, new, metric)
+        # Only the k best of the new locations can enter the heap
+        if len(new) > k:
+            keep = totals >= np.partition(totals, len(totals) - k)[len(totals) - k]
+            new, totals = new[keep], totals[keep]
+        for code, total in zip(new.tolist(), totals.tolist()):
+            # (total, -code): the smallest total, then the last name, is dropped first
+            if total > 0 and (len(heap) < k or (total, -code) > heap[0]):
+                if len(heap) < k:
+                    heapq.heappush(heap, (total, -code))
+                else:
+                    heapq.heapreplace(heap, (total, -code))
+        depth += block
+        unread = starts + depth < ends
+        threshold = int(counts[order[(starts + depth)[unread]]].sum())
+        if threshold == 0 or (len(heap) == k and heap[0][0] > threshold):
+            break
+        block *= 2
+    return [(-code, total) for total, code in sorted(heap, reverse=True)]
+
+
+def _row_totals(data, positions, column, n_locations):
+    """Per-location totals of every metric over the rows at `positions`, and the location codes."""
+    codes = _codes(data[column])[0][positions]
+    present = codes >= 0
+    weights = _weights(data, positions)
+    return {m: np.bincount(codes[present], weights=weights[m][present], minlength=n_locations).astype(np.int64) for m in METRICS}
+
+
+def hotspots(data, kind=DEFAULT_KIND, metric="crashes", k=DEFAULT_K, index=None, **filters):
+    """The top `k` locations of `kind` by `metric` among the crashes matching the filters.
+
+    Returns the locations with their crashes, injured and killed, and
+    `source`: "partitions" when answered from the index, "rows" when the
+    filters needed the matching rows.
+    """
+    from filters import filter_positions
+
+    index = index if index is not None else loaded_index()
+    if index is None or kind not in index["kinds"]:
+        raise ValueError(f"No {kind} keys in the data: rebuild it with etl.py")
+    entries = index["kinds"][kind]
+    partitioned = is_partitioned(filters)
+    if partitioned:
+        cells = partition_cells(index, filters.get("borough"), filters.get("year"), filters.get("severity"))
+        best = top_k(entries, cells, metric, k)
+        codes = np.array([code for code, _ in best], dtype=np.int32)
+        totals = {m: _totals(entries, cells, codes, m) for m in METRICS}
+    else:
+        positions = filter_positions(data, **filters)
+        per_location = _row_totals(data, positions, KINDS[kind], len(entries["names"]))
+        ranked = np.lexsort((np.arange(len(entries["names"])), -per_location[metric]))
+        codes = ranked[per_location[metric][ranked] > 0][:k]
+        totals = {m: per_location[m][codes] for m in METRICS}
+    return {
+        "kind": kind,
+        "metric": metric,
+        "k": k,
+        "source": "partitions" if partitioned else "rows",
+        "locations": [
+            {"rank": i + 1, "location": str(entries["names"][code]), **{m: int(totals[m][i]) for m in METRICS}}
+            for i, code in enumerate(codes)
+        ],
+    }
@@ -0,0 +1,116 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+PERSONS_CSV_NAME = "persons_for_app.csv"
+
+# Columns kept from the NYC persons dataset and their in-memory types: text
+# columns with few distinct values as categoricals, ages as float32 and ids as
+# integers (the string PERSON_ID is left out)
+PERSON_COLUMNS = {
+    "COLLISION_ID": "int64",
+    "UNIQUE_ID": "int64",
+    "VEHICLE_ID": "Int64",
+    "PERSON_TYPE": "category",
+    "PERSON_INJURY": "category",
+    "PERSON_AGE": "float32",
+    "PERSON_SEX": "category",
+    "POSITION_IN_VEHICLE": "category",
+    "SAFETY_EQUIPMENT": "category",
+    "EJECTION": "category",
+    "BODILY_INJURY": "category",
+    "PED_ROLE": "category",
+}
+
+# Crash attributes returned by /api/collision/<id>
+CRASH_COLUMNS = [
+    "COLLISION_ID", "CRASH_DATE", "CRASH_TIME", "BOROUGH", "LATITUDE", "LONGITUDE",
+    "ON STREET NAME", "CROSS STREET NAME", "NUMBER_OF_PERSONS_INJURED", "NUMBER_OF_PERSONS_KILLED",
+    "SEVERITY",
+] + [f"CONTRIBUTING FACTOR VEHICLE {i}" for i in range(1, 6)] + [f"VEHICLE TYPE CODE {i}" for i in range(1, 6)]
+
+
+def find_persons_csv():
+    """Path of the persons CSV next to the crash CSV, or None when there is none."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in [os.path.join(here, PERSONS_CSV_NAME), os.path.join(here, "..", PERSONS_CSV_NAME), PERSONS_CSV_NAME]:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def load_persons(path):
+    """Read the persons CSV into a compact, typed table sorted by COLLISION_ID.
+
+    Returns (persons, ids, offsets): the persons of collision `ids[i]` are the
+    rows offsets[i]:offsets[i + 1] of `persons`.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    dtypes = {c: t for c, t in PERSON_COLUMNS.items() if c in header}
+    persons = pd.read_csv(path, usecols=list(dtypes), dtype=dtypes)
+    persons = persons.sort_values("COLLISION_ID", kind="stable").reset_index(drop=True)
+
+    collision_ids = persons["COLLISION_ID"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, collision_ids[1:] != collision_ids[:-1]]) if len(persons) else np.empty(0, dtype=np.int64)
+    offsets = np.append(starts, len(persons))
+    return persons, pd.Index(collision_ids[starts]), offsets
+
+
+def build_collision_index(df):
+    """Lookups behind /api/collision/<id>.
+
+    `crash_ids` is a hashed pandas Index of the COLLISION_IDs in the crash
+    table, `crash_rows` the row of each. `persons` / `person_ids` /
+    `person_offsets` hold the persons table when persons_for_app.csv is
+    available, else None.
+    """
+    index = {"crash_ids": None, "crash_rows": None, "persons": None, "person_ids": None, "person_offsets": None}
+    if "COLLISION_ID" in df.columns:
+        # First row of each id, in case the crash table repeats one
+        first = ~df["COLLISION_ID"].duplicated().to_numpy()
+        index["crash_ids"] = pd.Index(df["COLLISION_ID"].to_numpy()[first])
+        index["crash_rows"] = np.flatnonzero(first)
+    path = find_persons_csv()
+    if path:
+        index["persons"], index["person_ids"], index["person_offsets"] = load_persons(path)
+        print(f"✓ Loaded persons from: {path} - {len(index['persons'])} rows")
+    return index
+
+
+def _records(frame):
+    # to_json turns NaN/NaT into null and dates into ISO strings
+    return json.loads(frame.to_json(orient="records", date_format="iso"))
+
+
+def _row_record(df, row, columns):
+    """One row of `df` as a JSON-ready dict, read column by column (no frame copy)."""
+    record = {}
+    for column in columns:
+        value = df[column].iloc[row]
+        if pd.isna(value):
+            value = None
+        elif isinstance(value, pd.Timestamp):
+            value = value.strftime("%Y-%m-%d")
+        elif isinstance(value, np.generic):
+            value = value.item()
+        record[column] = value
+    return record
+
+
+def collision_detail(df, index, collision_id):
+    """Crash attributes and persons of one collision, or None if the id is unknown."""
+    if index["crash_ids"] is None:
+        return None
+    found = index["crash_ids"].get_indexer([collision_id])[0]
+    if found < 0:
+        return None
+    crash = _row_record(df, index["crash_rows"][found], [c for c in CRASH_COLUMNS if c in df.columns])
+
+    persons = None
+    if index["persons"] is not None:
+        i = index["person_ids"].get_indexer([collision_id])[0]
+        # A contiguous slice of the sorted persons table
+        persons = [] if i < 0 else _records(index["persons"].iloc[index["person_offsets"][i]:index["person_offsets"][i + 1]])
+    return {"crash": crash, "persons": persons}
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from filters import FACTOR_COLUMN, filter_positions
+from reports import DAY_ORDER
+
+# Dimensions a pivot can group by -> column of the crash table
+DIMENSIONS = {
+    "borough": "BOROUGH",
+    "year": "YEAR",
+    "month": "CRASH_DATE",
+    "day_of_week": "DAY_OF_WEEK",
+    "hour": "HOUR",
+    "severity": "SEVERITY",
+    "factor": FACTOR_COLUMN,
+    "person_types": "PERSON_TYPES",
+    "person_injuries": "PERSON_INJURIES",
+}
+MEASURES = ["count", "injured", "killed", "avg_age"]
+MAX_DIMENSIONS = 3
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10_000
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    return list(value)
+
+
+def parse_pivot(payload):
+    """Dimensions, measures, sort and limit of a pivot request. Raises ValueError."""
+    dimensions = _as_list(payload.get("dimensions"))
+    measures = _as_list(payload.get("measures")) or ["count"]
+    if not 1 <= len(dimensions) <= MAX_DIMENSIONS:
+        raise ValueError(f"Give 1 to {MAX_DIMENSIONS} dimensions out of: {', '.join(DIMENSIONS)}")
+    unknown = [d for d in dimensions if d not in DIMENSIONS] + [m for m in measures if m not in MEASURES]
+    if unknown:
+        raise ValueError(f"Unknown dimension or measure: {', '.join(unknown)}. "
+                         f"Dimensions: {', '.join(DIMENSIONS)}; measures: {', '.join(MEASURES)}")
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError("Each dimension can only be used once")
+    sort = payload.get("sort")
+    if sort is not None and sort not in measures:
+        raise ValueError("sort must be one of the requested measures")
+    limit = int(payload.get("limit", DEFAULT_LIMIT))
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return {"dimensions": dimensions, "measures": measures, "sort": sort, "limit": limit}
+
+
+def _dimension_codes(data, positions, name):
+    """Codes of dimension `name` for the rows at `positions`, and the label of each code.
+
+    Missing values get the last code, labelled None.
+    """
+    column = data[DIMENSIONS[name]]
+    if name == "month":
+        values = column.to_numpy()[positions].astype("datetime64[M]").astype(np.int64)
+        codes, labels = np.where(values < 0, 12, values % 12), list(range(1, 13))
+        return codes, labels + [None]
+    if name == "hour":
+        values = column.to_numpy()[positions].astype(float)
+        return np.where(np.isnan(values), 24, np.nan_to_num(values, nan=0)).astype(np.int64), list(range(24)) + [None]
+    if name == "day_of_week":
+        codes = pd.Categorical(column.to_numpy()[positions], categories=DAY_ORDER).codes.astype(np.int64)
+        return np.where(codes < 0, 7, codes), DAY_ORDER + [None]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()[positions].astype(np.int64)
+        labels = column.cat.categories.tolist()
+    else:
+        codes, labels = pd.factorize(column.to_numpy()[positions], sort=True)
+        labels = labels.tolist()
+    return np.where(codes < 0, len(labels), codes), labels + [None]
+
+
+def pivot(data, dimensions, measures, sort=None, limit=DEFAULT_LIMIT, **filters):
+    """Group the filtered rows by up to three dimensions and aggregate the measures.
+
+    Works on integer codes: each row's dimension codes are combined into one
+    key, then every measure is a bincount over the keys. Cells are ordered by
+    the dimension values, or by `sort` (a measure, largest first), and cut to
+    `limit` rows.
+    """
+    import admission
+
+    positions = filter_positions(data, **filters)
+    admission.checkpoint()
+    codes, labels = zip(*[_dimension_codes(data, positions, name) for name in dimensions])
+
+    keys = np.zeros(len(positions), dtype=np.int64)
+    space = 1
+    for c, l in zip(codes, labels):
+        keys = keys * len(l) + c
+        space *= len(l)
+    if space > 4 * len(positions) + 1_000_000:
+        # Sparse key space: number the keys that occur instead
+        cells, keys = np.unique(keys, return_inverse=True)
+    else:
+        cells = None
+    size = len(cells) if cells is not None else space
+    count = np.bincount(keys, minlength=size)
+    present = np.flatnonzero(count)
+    cell_keys = cells[present] if cells is not None else present
+
+    result = {}
+    remaining = cell_keys
+    for name, l in reversed(list(zip(dimensions, labels))):
+        result[name] = [l[i] for i in remaining % len(l)]
+        remaining = remaining // len(l)
+    result = {name: result[name] for name in dimensions}
+
+    def total(column):
+        if column not in data.columns:
+            return np.zeros(len(present))
+        values = data[column].to_numpy()[positions].astype(float)
+        return np.bincount(keys, weights=np.nan_to_num(values), minlength=size)[present]
+
+    for measure in measures:
+        if measure == "count":
+            result["count"] = count[present]
+        elif measure == "injured":
+            result["injured"] = total("NUMBER_OF_PERSONS_INJURED").round().astype(int)
+        elif measure == "killed":
+            result["killed"] = total("NUMBER_OF_PERSONS_KILLED").round().astype(int)
+        elif measure == "avg_age":
+            # The integration step fills unknown ages with 0, so only positive ages count
+            ages = data["AVG_PERSON_AGE"].to_numpy()[positions].astype(float) if "AVG_PERSON_AGE" in data.columns else np.zeros(len(positions))
+            known = ages > 0
+            n_known = np.bincount(keys, weights=known, minlength=size)[present]
+            age_sum = np.bincount(keys, weights=np.where(known, ages, 0), minlength=size)[present]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result["avg_age"] = np.where(n_known > 0, np.round(age_sum / n_known, 1), np.nan)
+
+    order = np.argsort(-result[sort], kind="stable") if sort else np.arange(len(present))
+    order = order[:limit]
+    cells_out = {name: [result[name][i] for i in order] for name in dimensions}
+    for measure in measures:
+        values = result[measure][order]
+        if measure == "avg_age":
+            cells_out[measure] = [None if np.isnan(v) else float(v) for v in values]
+        else:
+            cells_out[measure] = values.astype(int).tolist()
+    return {
+        "dimensions": dimensions,
+        "measures": measures,
+        "rows": int(len(positions)),
+        "total_cells": int(len(present)),
+        "truncated": bool(len(present) > limit),
+        "cells": cells_out,
+    }
@@ -0,0 +1,378 @@
+"""Data-quality profile of the integrated crash table, in one chunked pass.
+
+    python profiling.py [CSV] [--chunksize 200000] [--thresholds FILE] [--report FILE]
+
+Reads the CSV chunk by chunk and accumulates, for every column, null counts,
+domain violations and value counts that merge across chunks: exact up to
+MAX_DISTINCT values, then a fixed-size histogram (numeric) or the most
+frequent values (text). Quantiles and IQR outliers are derived from those at
+the end, so memory does not grow with the table. The report is written as
+JSON next to the CSV (integrated_crashes_for_app.quality.json) and the
+command exits with status 1 when a threshold is exceeded, which fails the
+build (see build.sh).
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+CHUNKSIZE = 200_000
+
+# Numeric values are counted at this many decimals: exact for the count
+# columns, about 10 m for coordinates
+VALUE_DECIMALS = 4
+
+# Past this many distinct values a column stops counting each one (see Profile)
+MAX_DISTINCT = 10_000
+HISTOGRAM_BINS = 2048
+
+QUANTILES = [0.01, 0.25, 0.5, 0.75, 0.99]
+IQR_MULTIPLIER = 1.5
+TOP_VALUES = 5
+
+DATE_COLUMN = "CRASH_DATE"
+KEY_COLUMN = "COLLISION_ID"
+
+# NYC bounding box, as in the notebook's validate_coordinates
+NYC_BOUNDS = {"LATITUDE": (40.4, 40.9), "LONGITUDE": (-74.3, -73.7)}
+
+# column -> allowed values (categorical) or (min, max) with None for open ends
+DOMAINS = {
+    "BOROUGH": {"BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND", "UNKNOWN"},
+    "DAY_OF_WEEK": {"Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"},
+    "YEAR": (2012, None),
+    "MONTH": (1, 12),
+    "HOUR": (0, 23),
+    "NUMBER_OF_PERSONS_INJURED": (0, None),
+    "NUMBER_OF_PERSONS_KILLED": (0, None),
+    "PERSON_COUNT": (0, None),
+    "AVG_PERSON_AGE": (0, 120),
+    "VEHICLE_COUNT": (0, None),
+    "TOP_VEHICLE_TYPE": {"Sedan", "SUV", "Taxi", "Pickup", "Van", "Truck", "Bus", "Motorcycle", "Bicycle",
+                         "E-Bike/Scooter", "Emergency", "Other", "UNKNOWN"},
+}
+
+# Build fails when exceeded. Rates are shares of all rows; per-column limits
+# fall back to the "*" entry, columns without either are not checked.
+THRESHOLDS = {
+    "null_rate": {KEY_COLUMN: 0.0, DATE_COLUMN: 0.0},
+    "invalid_rate": {DATE_COLUMN: 0.0},
+    "outlier_rate": {},
+    "domain_violation_rate": {"*": 0.01},
+    "out_of_bounds_rate": 0.05,
+    "duplicate_ids": 0,
+}
+
+
+def _merge_counts(total, counts):
+    return counts if total is None else total.add(counts, fill_value=0)
+
+
+def _quantile(values, cumulative, q):
+    """The q-quantile of a sorted value-count table (lower value at ties)."""
+    return float(values[np.searchsorted(cumulative, q * cumulative[-1], side="left")])
+
+
+class _Histogram:
+    """HISTOGRAM_BINS equal-width bins whose range doubles to take in new values.
+
+    Doubling merges neighbouring bins, so the memory is fixed however many
+    distinct values the column has, and quantiles are off by at most a bin.
+    """
+
+    def __init__(self, low, high, bins=HISTOGRAM_BINS):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = float(low)
+        self.width = max(float(high) - self.low, 1e-9) * (1 + 1e-9) / bins
+
+    def _cover(self, low, high):
+        bins = len(self.counts)
+        while low < self.low or high >= self.low + self.width * bins:
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            empty = np.zeros(bins // 2, dtype=np.int64)
+            if low < self.low:
+                # The current range becomes the upper half
+                self.counts = np.concatenate([empty, merged])
+                self.low -= self.width * bins
+            else:
+                self.counts = np.concatenate([merged, empty])
+            self.width *= 2
+
+    def add(self, values, weights=None):
+        if not len(values):
+            return
+        self._cover(values.min(), values.max())
+        bins = np.minimum(((values - self.low) // self.width).astype(np.int64), len(self.counts) - 1)
+        self.counts += np.bincount(bins, weights=weights, minlength=len(self.counts)).astype(np.int64)
+
+    def value_counts(self):
+        """(bin middles, counts) of the bins that hold values."""
+        used = np.flatnonzero(self.counts)
+        return self.low + (used + 0.5) * self.width, self.counts[used]
+
+
+class Profile:
+    """Per-column statistics of a table fed in chunks with `update`.
+
+    Memory is bounded whatever the number of rows: a column keeps exact
+    value counts up to MAX_DISTINCT values, then numeric columns switch to a
+    _Histogram and categorical ones keep their MAX_DISTINCT most frequent
+    values. Duplicate KEY_COLUMN values are found in a sorted array of the
+    distinct keys, 8 bytes each.
+    """
+
+    def __init__(self, domains=DOMAINS, bounds=NYC_BOUNDS):
+        self.domains = domains
+        self.bounds = bounds
+        self.rows = 0
+        self.kinds = {}       # column -> "numeric" | "categorical" | "date"
+        self.nulls = {}
+        self.invalid = {}     # present but not parseable as the column's kind
+        self.counts = {}      # column -> merged value counts, or a _Histogram
+        self.truncated = set()  # categorical columns that dropped rare values
+        self.totals = {}      # numeric column -> [min, max, sum, count]
+        self.violations = {}  # column -> values outside its domain
+        self.keys = np.empty(0, dtype=np.int64)  # distinct KEY_COLUMN values, sorted
+        self.duplicate_ids = 0
+        self.coordinates = {"missing": 0, "out_of_bounds": 0}
+
+    def _kind(self, name, series):
+        if name not in self.kinds:
+            if name == DATE_COLUMN:
+                self.kinds[name] = "date"
+            elif pd.api.types.is_numeric_dtype(series):
+                self.kinds[name] = "numeric"
+            else:
+                self.kinds[name] = "categorical"
+        return self.kinds[name]
+
+    def _update_keys(self, keys):
+        distinct = np.unique(keys)
+        seen = np.zeros(len(distinct), dtype=bool)
+        if len(self.keys):
+            found = np.minimum(np.searchsorted(self.keys, distinct), len(self.keys) - 1)
+            seen = self.keys[found] == distinct
+        self.duplicate_ids += int(len(keys) - len(distinct) + seen.sum())
+        merged = np.concatenate([self.keys, distinct[~seen]])
+        # Two sorted runs: the stable sort (timsort) merges them in linear time
+        merged.sort(kind="stable")
+        self.keys = merged
+
+    def _update_numeric(self, name, values):
+        values = values.to_numpy(dtype=float)
+        if not len(values):
+            return
+        low, high = values.min(), values.max()
+        totals = self.totals.setdefault(name, [low, high, 0.0, 0])
+        totals[0], totals[1] = min(totals[0], low), max(totals[1], high)
+        totals[2] += float(values.sum())
+        totals[3] += len(values)
+        domain = self.domains.get(name)
+        if isinstance(domain, tuple):
+            lo, hi = domain
+            outside = np.zeros(len(values), dtype=bool)
+            if lo is not None:
+                outside |= values < lo
+            if hi is not None:
+                outside |= values > hi
+            self.violations[name] = self.violations.get(name, 0) + int(outside.sum())
+
+        counts = self.counts.get(name)
+        if isinstance(counts, _Histogram):
+            counts.add(values)
+            return
+        counts = _merge_counts(counts, pd.Series(values).round(VALUE_DECIMALS).value_counts())
+        if len(counts) > MAX_DISTINCT:
+            histogram = _Histogram(totals[0], totals[1])
+            histogram.add(counts.index.to_numpy(dtype=float), counts.to_numpy(dtype=float))
+            counts = histogram
+        self.counts[name] = counts
+
+    def _update_categorical(self, name, series):
+        counts = _merge_counts(self.counts.get(name), series.value_counts(dropna=True))
+        domain = self.domains.get(name)
+        if isinstance(domain, set):
+            self.violations[name] = self.violations.get(name, 0) + int((series.notna() & ~series.isin(domain)).sum())
+        if len(counts) > 2 * MAX_DISTINCT:
+            # Trimmed at twice the limit, so the sort only runs every so often
+            counts = counts.nlargest(MAX_DISTINCT)
+            self.truncated.add(name)
+        self.counts[name] = counts
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for name, series in chunk.items():
+            kind = self._kind(name, series)
+            present = series.notna()
+            self.nulls[name] = self.nulls.get(name, 0) + int(len(series) - present.sum())
+            if kind == "categorical":
+                self._update_categorical(name, series)
+                continue
+            if kind == "date":
+                parsed = pd.to_datetime(series, errors="coerce").dt.normalize()
+            else:
+                # A chunk can read a numeric column as text when it holds junk
+                parsed = pd.to_numeric(series, errors="coerce")
+            self.invalid[name] = self.invalid.get(name, 0) + int((present & parsed.isna()).sum())
+            if kind == "date":
+                self.counts[name] = _merge_counts(self.counts.get(name), parsed.value_counts(dropna=True))
+            else:
+                self._update_numeric(name, parsed.dropna())
+
+        if KEY_COLUMN in chunk:
+            self._update_keys(pd.to_numeric(chunk[KEY_COLUMN], errors="coerce").dropna().to_numpy(dtype=np.int64))
+
+        if all(c in chunk for c in self.bounds):
+            coords = {c: pd.to_numeric(chunk[c], errors="coerce") for c in self.bounds}
+            missing = np.logical_or.reduce([s.isna().to_numpy() for s in coords.values()])
+            inside = np.logical_and.reduce([s.between(lo, hi).to_numpy() for s, (lo, hi) in
+                                            ((coords[c], self.bounds[c]) for c in self.bounds)])
+            self.coordinates["missing"] += int(missing.sum())
+            self.coordinates["out_of_bounds"] += int((~missing & ~inside).sum())
+
+    def _numeric(self, name):
+        low, high, total, n = self.totals[name]
+        stats = {"min": float(low), "max": float(high), "mean": round(total / n, 4)}
+        counts = self.counts.get(name)
+        if counts is None:
+            return stats
+        if isinstance(counts, _Histogram):
+            values, weights = counts.value_counts()
+            stats["approximate"] = True
+        else:
+            counts = counts.sort_index()
+            values, weights = counts.index.to_numpy(dtype=float), counts.to_numpy()
+        cumulative = np.cumsum(weights)
+        quantile = lambda q: min(max(_quantile(values, cumulative, q), low), high)
+        stats["quantiles"] = {str(q): quantile(q) for q in QUANTILES}
+        q1, q3 = quantile(0.25), quantile(0.75)
+        low, high = q1 - IQR_MULTIPLIER * (q3 - q1), q3 + IQR_MULTIPLIER * (q3 - q1)
+        stats["iqr_bounds"] = [low, high]
+        stats["outliers"] = int(weights[(values < low) | (values > high)].sum())
+        return stats
+
+    def _categorical(self, name, counts):
+        counts = counts.sort_values(ascending=False, kind="stable")
+        stats = {"distinct": int(len(counts)),
+                 "top": {str(k): int(v) for k, v in counts.head(TOP_VALUES).items()}}
+        if name in self.truncated:
+            # Only the most frequent values were kept: more distinct values, approximate counts
+            stats["approximate"] = True
+        if isinstance(self.domains.get(name), set):
+            stats["unexpected_values"] = [str(v) for v in counts.index[~counts.index.isin(self.domains[name])][:TOP_VALUES]]
+        return stats
+
+    def report(self):
+        columns = {}
+        for name, kind in self.kinds.items():
+            stats = {"kind": kind, "nulls": self.nulls[name],
+                     "null_rate": round(self.nulls[name] / self.rows, 6) if self.rows else 0.0}
+            if name in self.invalid:
+                stats["invalid"] = self.invalid[name]
+            if kind == "numeric":
+                if name in self.totals:
+                    stats.update(self._numeric(name))
+            elif len(self.counts[name]):
+                if kind == "date":
+                    days = self.counts[name].sort_index().index
+                    stats.update({"min": days[0].date().isoformat(), "max": days[-1].date().isoformat(),
+                                  "distinct_days": int(len(days))})
+                else:
+                    stats.update(self._categorical(name, self.counts[name]))
+            if name in self.violations:
+                stats["domain_violations"] = self.violations[name]
+            columns[name] = stats
+
+        return {"rows": self.rows, "duplicate_ids": self.duplicate_ids,
+                "coordinates": dict(self.coordinates, bounds=self.bounds), "columns": columns}
+
+
+def profile_chunks(chunks, **kwargs):
+    profile = Profile(**kwargs)
+    for chunk in chunks:
+        profile.update(chunk)
+    return profile.report()
+
+
+def profile_csv(path, chunksize=CHUNKSIZE):
+    return profile_chunks(pd.read_csv(path, chunksize=chunksize, low_memory=False))
+
+
+def _limit(limits, name):
+    return limits.get(name, limits.get("*"))
+
+
+def check_thresholds(report, thresholds=THRESHOLDS):
+    """The list of threshold failures (empty when the table passes)."""
+    failures = []
+    rows = report["rows"] or 1
+    for name, stats in report["columns"].items():
+        checks = [("null_rate", stats["null_rate"]),
+                  ("invalid_rate", stats.get("invalid", 0) / rows),
+                  ("outlier_rate", stats.get("outliers", 0) / rows),
+                  ("domain_violation_rate", stats.get("domain_violations", 0) / rows)]
+        for check, value in checks:
+            limit = _limit(thresholds.get(check, {}), name)
+            if limit is not None and value > limit:
+                failures.append(f"{name}: {check} {value:.4%} > {limit:.4%}")
+    out_of_bounds = report["coordinates"]["out_of_bounds"] / rows
+    limit = thresholds.get("out_of_bounds_rate")
+    if limit is not None and out_of_bounds > limit:
+        failures.append(f"coordinates: out_of_bounds_rate {out_of_bounds:.4%} > {limit:.4%}")
+    limit = thresholds.get("duplicate_ids")
+    if limit is not None and report["duplicate_ids"] > limit:
+        failures.append(f"{KEY_COLUMN}: {report['duplicate_ids']} duplicate ids > {limit}")
+    return failures
+
+
+def load_thresholds(path=None):
+    """THRESHOLDS, updated from a JSON file with the same layout."""
+    thresholds = {k: dict(v) if isinstance(v, dict) else v for k, v in THRESHOLDS.items()}
+    if path:
+        with open(path) as f:
+            for key, value in json.load(f).items():
+                if isinstance(value, dict):
+                    thresholds.setdefault(key, {}).update(value)
+                else:
+                    thresholds[key] = value
+    return thresholds
+
+
+def report_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".quality.json"
+
+
+def write_report(report, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv", nargs="?", help="the integrated CSV (default: found like the app does)")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="rows per chunk")
+    parser.add_argument("--thresholds", help="JSON file overriding THRESHOLDS")
+    parser.add_argument("--report", help="where to write the report (default: next to the CSV)")
+    args = parser.parse_args()
+
+    import crash_data
+
+    path = args.csv or crash_data.find_csv()
+    report = profile_csv(path, args.chunksize)
+    report["failures"] = check_thresholds(report, load_thresholds(args.thresholds))
+    out = args.report or report_path(path)
+    write_report(report, out)
+    print(f"✓ Profiled {report['rows']:,} rows from {path} -> {out}")
+    for failure in report["failures"]:
+        print(f"✗ {failure}")
+    if report["failures"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
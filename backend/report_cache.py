@@ -0,0 +1,137 @@
+"""In-memory cache of exact reports, with usage tracking and warm-up.
+
+Every report served is counted by its normalized filters + granularity. The
+most requested combinations are saved to a small JSON file now and then and
+at exit; on the next start `warm_up` computes them once the data is loaded,
+so the first users after a deploy hit a hot cache.
+
+Entries are stored as the app hands them over. The API stores
+compression.Encoded bodies, so a hit is sent without re-encoding.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+REPORT_CACHE_SIZE = 64
+WARMUP_TOP_K = 20
+SAVE_EVERY = 50   # requests between saves of the usage file
+USAGE_FILE = os.environ.get(
+    "REPORT_USAGE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "popular_reports.json"),
+)
+
+_cache = OrderedDict()
+_usage = Counter()
+_lock = threading.Lock()
+_unsaved = 0
+_warmup = {"state": "idle", "total": 0, "done": 0, "seconds": None, "error": None}
+_stats = {"hits": 0, "misses": 0}
+
+
+def report_key(filters, granularity):
+    """Normalized key of a report: the parsed filters (sorted lists) and granularity."""
+    return json.dumps({"filters": filters, "granularity": granularity}, sort_keys=True)
+
+
+def get_or_compute(key, compute):
+    """The cached report for `key`, computing and storing it on a miss."""
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _cache[key]
+        _stats["misses"] += 1
+    value = compute()
+    with _lock:
+        _cache[key] = value
+        while len(_cache) > REPORT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def peek(key):
+    """The cached report for `key`, or None. Does not count as a hit or miss."""
+    with _lock:
+        return _cache.get(key)
+
+
+def record(key):
+    """Count one request for `key`; saves the usage file every SAVE_EVERY requests."""
+    global _unsaved
+    with _lock:
+        _usage[key] += 1
+        _unsaved += 1
+        due = _unsaved >= SAVE_EVERY
+    if due:
+        save_usage()
+
+
+def save_usage(path=USAGE_FILE, top_k=WARMUP_TOP_K):
+    """Write the top-K report keys and their counts, atomically."""
+    global _unsaved
+    with _lock:
+        top = _usage.most_common(top_k)
+        _unsaved = 0
+    if not top:
+        return
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump([{"key": key, "count": count} for key, count in top], f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"✗ Could not save report usage: {e}")
+
+
+def load_usage(path=USAGE_FILE):
+    """Report keys saved by a previous run, most requested first.
+
+    Their counts seed this run's usage at half weight, so combinations that
+    stop being requested drop out of the top-K after a few restarts.
+    """
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return []
+    with _lock:
+        for entry in saved:
+            _usage[entry["key"]] += max(entry["count"] // 2, 1)
+    return [entry["key"] for entry in saved]
+
+
+def warm_up(compute, path=USAGE_FILE):
+    """Compute the saved popular reports into the cache. `compute(filters, granularity)` builds an entry."""
+    keys = load_usage(path)
+    _warmup.update(state="warming", total=len(keys), done=0)
+    start = time.perf_counter()
+    try:
+        for key in keys:
+            spec = json.loads(key)
+            get_or_compute(key, lambda: compute(spec["filters"], spec["granularity"]))
+            _warmup["done"] += 1
+    except Exception as e:
+        print(f"✗ Report cache warm-up stopped: {e}")
+        _warmup.update(state="failed", error=str(e))
+    else:
+        _warmup["state"] = "done"
+    _warmup["seconds"] = round(time.perf_counter() - start, 3)
+    if keys:
+        print(f"✓ Warmed {_warmup['done']}/{len(keys)} popular reports in {_warmup['seconds']}s")
+
+
+def warmup_finished():
+    return _warmup["state"] in ("done", "failed")
+
+
+def status():
+    with _lock:
+        sizes = [entry.sizes() for entry in _cache.values() if hasattr(entry, "sizes")]
+        stored = {encoding: sum(s.get(encoding, 0) for s in sizes) for encoding in {e for s in sizes for e in s}}
+        return {"entries": len(_cache), **_stats, "stored_bytes": stored, "warmup": dict(_warmup)}
+
+
+atexit.register(save_usage)
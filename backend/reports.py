@@ -0,0 +1,232 @@
+import json
+
+GRANULARITIES = ["day", "week", "month", "quarter"]
+DEFAULT_GRANULARITY = "month"
+
+
+def period_start(dates, granularity):
+    """First day of the period each date falls in, as datetime64 values.
+
+    Works on the raw datetime64 array (no Period objects or strings), weeks
+    start on Monday.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. Use one of: {', '.join(GRANULARITIES)}")
+    values = dates.values
+    if granularity == "day":
+        return values.astype("datetime64[D]")
+    if granularity == "week":
+        days = values.astype("datetime64[D]")
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays
+        return days - ((days.view("int64") + 3) % 7).astype("timedelta64[D]")
+    months = values.astype("datetime64[M]")
+    if granularity == "quarter":
+        months = months - (months.view("int64") % 3).astype("timedelta64[M]")
+    return months.astype("datetime64[D]")
+
+
+def injured_over_time(d, granularity=DEFAULT_GRANULARITY, weight=None):
+    """Total injured persons per period, as a frame with PERIOD and NUMBER_OF_PERSONS_INJURED.
+
+    With `weight` (a column name) each row counts that many times, which is how
+    sampled rows are scaled back up to the full table.
+    """
+    injured = d["NUMBER_OF_PERSONS_INJURED"]
+    if weight is not None:
+        injured = injured * d[weight]
+    over_time = (
+        injured.to_frame("NUMBER_OF_PERSONS_INJURED")
+        .assign(PERIOD=period_start(d["CRASH_DATE"], granularity))
+        .groupby("PERIOD")["NUMBER_OF_PERSONS_INJURED"]
+        .sum()
+        .reset_index()
+    )
+    if weight is not None:
+        over_time["NUMBER_OF_PERSONS_INJURED"] = over_time["NUMBER_OF_PERSONS_INJURED"].round().astype(int)
+    return over_time
+
+
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _value_counts(d, column, weight=None):
+    # Largest first, ties in value order, so every path that builds these
+    # frames (reports, comparisons, the bundle) orders them the same way
+    if weight is None:
+        counts = d[column].value_counts(sort=False).sort_index().sort_values(ascending=False, kind="stable")
+    else:
+        counts = d.groupby(column, observed=True)[weight].sum().round().astype(int).sort_values(ascending=False, kind="stable")
+    counts = counts[counts > 0].reset_index()
+    counts.columns = [column, "COUNT"]
+    return counts
+
+
+def borough_counts(d, weight=None):
+    """Crash counts per BOROUGH (boroughs with no crashes left out)."""
+    return _value_counts(d, "BOROUGH", weight)
+
+
+def severity_counts(d, weight=None):
+    """Crash counts per SEVERITY (severities with no crashes left out)."""
+    return _value_counts(d, "SEVERITY", weight)
+
+
+def day_hour_counts(d, weight=None):
+    """Crash counts per DAY_OF_WEEK and HOUR in week order, or None without HOUR."""
+    import pandas as pd
+
+    if "HOUR" not in d.columns:
+        return None
+    groups = d.groupby(["DAY_OF_WEEK", "HOUR"], observed=True)
+    if weight is None:
+        heat = groups.size().reset_index(name="COUNT")
+    else:
+        heat = groups[weight].sum().round().astype(int).reset_index(name="COUNT")
+    heat["DAY_OF_WEEK"] = pd.Categorical(heat["DAY_OF_WEEK"], categories=DAY_ORDER, ordered=True)
+    return heat.sort_values(["DAY_OF_WEEK", "HOUR"])
+
+
+def summarize(d, weight=None):
+    """Total crashes, injured and killed."""
+    w = d[weight] if weight is not None else 1
+    return {
+        "crashes": len(d) if weight is None else int(round(d[weight].sum())),
+        "injured": int(round((d["NUMBER_OF_PERSONS_INJURED"] * w).sum())) if "NUMBER_OF_PERSONS_INJURED" in d.columns else 0,
+        "killed": int(round((d["NUMBER_OF_PERSONS_KILLED"] * w).sum())) if "NUMBER_OF_PERSONS_KILLED" in d.columns else 0,
+    }
+
+
+def iter_series(d, granularity=DEFAULT_GRANULARITY, weight=None):
+    """(name, aggregate) pairs of report_series, computed one at a time."""
+    from factors import factor_counts
+
+    yield "summary", summarize(d, weight)
+    yield "borough", borough_counts(d, weight)
+    yield "time", injured_over_time(d, granularity, weight)
+    yield "severity", severity_counts(d, weight)
+    yield "heatmap", day_hour_counts(d, weight)
+    yield "factors", factor_counts(d, weight)
+
+
+def report_series(d, granularity=DEFAULT_GRANULARITY, weight=None):
+    """All aggregates behind a report, computed from the filtered rows."""
+    return dict(iter_series(d, granularity, weight))
+
+
+# Figures. plotly is imported on first use so that importing this module
+# (and the app) stays fast.
+
+def borough_figure(borough_count):
+    import plotly.express as px
+
+    fig = px.bar(
+        borough_count,
+        x="BOROUGH",
+        y="COUNT",
+        title="Crashes by Borough",
+        color="COUNT",
+        color_continuous_scale="Viridis",
+        labels={"COUNT": "Number of Crashes"}
+    )
+    fig.update_layout(hovermode="x unified", showlegend=False, height=400)
+    return fig
+
+
+def time_figure(over_time, granularity=DEFAULT_GRANULARITY):
+    import plotly.express as px
+
+    fig = px.line(
+        over_time,
+        x="PERIOD",
+        y="NUMBER_OF_PERSONS_INJURED",
+        title="Injured Persons Over Time",
+        markers=True,
+        labels={"NUMBER_OF_PERSONS_INJURED": "Total Injured", "PERIOD": granularity.capitalize()}
+    )
+    fig.update_traces(line=dict(color="#667eea", width=3), marker=dict(size=8))
+    fig.update_layout(hovermode="x unified", height=400)
+    return fig
+
+
+def severity_figure(sev_count):
+    import plotly.express as px
+
+    fig = px.pie(
+        sev_count,
+        values="COUNT",
+        names="SEVERITY",
+        title="Crash Severity Distribution",
+        color_discrete_map={
+            "Fatal": "#d62728",
+            "Injury": "#ff7f0e",
+            "No Injury": "#2ca02c"
+        }
+    )
+    fig.update_layout(height=400)
+    return fig
+
+
+def heatmap_figure(heat):
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    if heat is None:
+        fig = go.Figure()
+        fig.update_layout(title="No HOUR information available")
+        return fig
+    fig = px.density_heatmap(
+        heat,
+        x="HOUR",
+        y="DAY_OF_WEEK",
+        z="COUNT",
+        title="Crash Density by Hour and Day",
+        nbinsx=24,
+        color_continuous_scale="RdYlBu_r",
+        labels={"COUNT": "Crash Count"}
+    )
+    fig.update_layout(height=400)
+    return fig
+
+
+def factor_figure(factor_count):
+    import plotly.express as px
+
+    fig = px.bar(
+        factor_count.iloc[::-1],
+        x="COUNT",
+        y="FACTOR",
+        orientation="h",
+        title=f"Top {len(factor_count)} Contributing Factors (all vehicles)",
+        labels={"COUNT": "Number of Crashes", "FACTOR": "Factor"}
+    )
+    fig.update_traces(marker_color="#667eea")
+    fig.update_layout(height=400)
+    return fig
+
+
+CHART_NAMES = ["borough", "time", "severity", "heatmap", "factors"]
+
+
+def chart_json(name, aggregate, granularity=DEFAULT_GRANULARITY):
+    """The figure of chart `name` from its aggregate, as a JSON-ready dict.
+
+    None for the factors chart without a factor index.
+    """
+    if name == "factors" and aggregate is None:
+        return None
+    if name == "time":
+        fig = time_figure(aggregate, granularity)
+    else:
+        fig = {
+            "borough": borough_figure,
+            "severity": severity_figure,
+            "heatmap": heatmap_figure,
+            "factors": factor_figure,
+        }[name](aggregate)
+    return json.loads(fig.to_json())
+
+
+def build_charts(series, granularity=DEFAULT_GRANULARITY):
+    """Plotly figures for a report, as JSON-ready dicts keyed by chart name."""
+    charts = {name: chart_json(name, series.get(name), granularity) for name in CHART_NAMES}
+    return {name: chart for name, chart in charts.items() if chart is not None}
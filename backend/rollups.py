@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+from filters import FACTOR_COLUMN, as_value_list
+
+# Rollup dimensions: filter name -> column of the crash table
+DIMENSIONS = {"borough": "BOROUGH", "severity": "SEVERITY", "factor": FACTOR_COLUMN}
+METRICS = ["crashes", "injured", "killed"]
+DEFAULT_WINDOW = 7
+MAX_WINDOW = 365
+
+DAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def _codes(column):
+    """Category codes and categories of a column, categorical or not."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    codes, categories = pd.factorize(column)
+    return codes, categories
+
+
+def build_daily_rollup(df):
+    """Daily crashes/injured/killed per BOROUGH x SEVERITY x factor (vehicle 1).
+
+    Returns a dict of numpy arrays, one entry per (day, borough, severity,
+    factor) with at least one crash, sorted by day. `day` counts days since
+    1970-01-01; the dimension columns hold codes into `categories`. Its size
+    depends on the number of days and combinations, not on the number of crashes.
+    """
+    keys = {"day": df["CRASH_DATE"].values.astype("datetime64[D]").astype(np.int64)}
+    categories = {}
+    for name, column in DIMENSIONS.items():
+        if column in df.columns:
+            keys[name], categories[name] = _codes(df[column])
+        else:
+            keys[name], categories[name] = np.zeros(len(df), dtype=np.int64), pd.Index(["UNKNOWN"])
+
+    frame = pd.DataFrame(keys)
+    frame["crashes"] = 1
+    frame["injured"] = df["NUMBER_OF_PERSONS_INJURED"].fillna(0).to_numpy() if "NUMBER_OF_PERSONS_INJURED" in df.columns else 0
+    frame["killed"] = df["NUMBER_OF_PERSONS_KILLED"].fillna(0).to_numpy() if "NUMBER_OF_PERSONS_KILLED" in df.columns else 0
+    frame = frame[frame["day"] > np.iinfo(np.int64).min]   # rows without a date
+    rolled = frame.groupby(list(keys), sort=True)[METRICS].sum().reset_index()
+
+    rollup = {"day": rolled["day"].to_numpy(dtype=np.int32)}
+    rollup["year"] = rolled["day"].to_numpy().astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+    for name in DIMENSIONS:
+        rollup[name] = rolled[name].to_numpy(dtype=np.int32)
+    for metric in METRICS:
+        rollup[metric] = rolled[metric].to_numpy(dtype=np.int64)
+    rollup["categories"] = categories
+    return rollup
+
+
+def _day_number(date):
+    return int(pd.Timestamp(date).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+def _lookup(categories, values):
+    # Same code lookup table as filters._isin: the extra slot catches code -1
+    wanted = categories.get_indexer(values)
+    lookup = np.zeros(len(categories) + 1, dtype=bool)
+    lookup[wanted[wanted >= 0]] = True
+    return lookup
+
+
+def select(rollup, borough=None, year=None, factor=None, severity=None, search_query=None,
+           start_date=None, end_date=None, factor_scope="vehicle_1", vehicle_type=None):
+    """Positions [lo, hi) and boolean mask of the rollup entries matching the filters.
+
+    Takes the same filters as filters.apply_filters. The free-text search,
+    the any-vehicle factor scope and the vehicle type need the individual
+    crashes, so they are rejected with a ValueError.
+    """
+    if search_query and search_query.strip():
+        raise ValueError("search_query is not available for trends, use the borough/year/factor/severity filters")
+    if factor_scope != "vehicle_1" and as_value_list(factor):
+        raise ValueError("Trends filter factors on vehicle 1 only, factor_scope must be 'vehicle_1'")
+    if as_value_list(vehicle_type):
+        raise ValueError("vehicle_type is not available for trends, use the borough/year/factor/severity filters")
+
+    days = rollup["day"]
+    lo = days.searchsorted(_day_number(start_date), side="left") if start_date else 0
+    hi = days.searchsorted(_day_number(end_date), side="right") if end_date else len(days)
+    hi = max(lo, hi)
+
+    mask = np.ones(hi - lo, dtype=bool)
+    for name, values in [("borough", borough), ("factor", factor), ("severity", severity)]:
+        values = as_value_list(values)
+        if values:
+            mask &= _lookup(rollup["categories"][name], values)[rollup[name][lo:hi]]
+    years = as_value_list(year)
+    if years:
+        mask &= np.isin(rollup["year"][lo:hi], [int(y) for y in years])
+    return int(lo), int(hi), mask
+
+
+def daily_totals(rollup, metric="crashes", **filters):
+    """Dense daily series of `metric` over the filtered date range.
+
+    Returns (first day as datetime64[D], values array); days without crashes
+    are 0. The range is the requested start/end, or the span of the data.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}")
+    lo, hi, mask = select(rollup, **filters)
+    all_days = rollup["day"]
+    first = _day_number(filters["start_date"]) if filters.get("start_date") else (int(all_days[0]) if len(all_days) else 0)
+    last = _day_number(filters["end_date"]) if filters.get("end_date") else (int(all_days[-1]) if len(all_days) else -1)
+    years = as_value_list(filters.get("year"))
+    if years:
+        # No need to pad the series with the zeros of unselected years
+        first = max(first, _day_number(f"{min(int(y) for y in years)}-01-01"))
+        last = min(last, _day_number(f"{max(int(y) for y in years)}-12-31"))
+    days = all_days[lo:hi][mask] - first
+    values = np.bincount(days, weights=rollup[metric][lo:hi][mask], minlength=max(last - first + 1, 0))
+    return np.datetime64(first, "D"), values.astype(np.int64)
+
+
+def rolling_mean(values, window):
+    """Trailing mean over `window` days. The first days average what is available."""
+    running = np.concatenate(([0], np.cumsum(values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (running[ends] - running[starts]) / (ends - starts)
+
+
+def rolling_series(rollup, metric="crashes", window=DEFAULT_WINDOW, **filters):
+    first, values = daily_totals(rollup, metric, **filters)
+    dates = first + np.arange(len(values))
+    return {
+        "metric": metric,
+        "window": window,
+        "dates": np.datetime_as_string(dates).tolist(),
+        "values": values.tolist(),
+        "rolling": np.round(rolling_mean(values, window), 2).tolist(),
+    }
+
+
+def year_over_year(rollup, metric="crashes", **filters):
+    """Monthly totals per year, and each year's change against the year before.
+
+    A year is compared with the previous one over the months both cover, so
+    the first and last (partial) years of the data compare like with like.
+    """
+    first, values = daily_totals(rollup, metric, **filters)
+    if len(values) == 0:
+        return {"metric": metric, "years": [], "monthly": {}, "change": []}
+    months = (first + np.arange(len(values))).astype("datetime64[M]").astype(np.int64)
+    month0 = months[0] - months[0] % 12
+    monthly = np.bincount(months - month0, weights=values, minlength=months[-1] - month0 + 1).astype(np.int64)
+    covered = np.zeros(len(monthly), dtype=bool)
+    covered[months - month0] = True
+    pad = -len(monthly) % 12
+    monthly = np.pad(monthly, (0, pad)).reshape(-1, 12)
+    covered = np.pad(covered, (0, pad)).reshape(-1, 12)
+    years = (month0 // 12 + 1970 + np.arange(len(monthly))).tolist()
+
+    change = []
+    for i in range(1, len(years)):
+        both = covered[i] & covered[i - 1]
+        current, previous = int(monthly[i][both].sum()), int(monthly[i - 1][both].sum())
+        change.append({
+            "year": years[i],
+            "months": int(both.sum()),
+            "total": current,
+            "previous": previous,
+            "change_pct": round((current - previous) / previous * 100, 1) if previous else None,
+        })
+    return {
+        "metric": metric,
+        "years": years,
+        "monthly": {str(y): [int(v) if c else None for v, c in zip(row, cov)] for y, row, cov in zip(years, monthly, covered)},
+        "change": change,
+    }
+
+
+def weekday_profile(rollup, metric="crashes", **filters):
+    """Average daily `metric` per weekday, and its ratio to the overall daily average."""
+    first, values = daily_totals(rollup, metric, **filters)
+    # 1970-01-01 was a Thursday, so (days + 3) % 7 is 0 on Mondays
+    weekday = (first.astype(np.int64) + np.arange(len(values)) + 3) % 7
+    totals = np.bincount(weekday, weights=values, minlength=7)
+    n_days = np.bincount(weekday, minlength=7)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average = np.where(n_days > 0, totals / n_days, 0.0)
+    overall = values.mean() if len(values) else 0.0
+    return {
+        "metric": metric,
+        "days": [
+            {
+                "day": DAY_ORDER[i],
+                "total": int(totals[i]),
+                "days": int(n_days[i]),
+                "average": round(float(average[i]), 2),
+                "index": round(float(average[i] / overall), 3) if overall else None,
+            }
+            for i in range(7)
+        ],
+    }
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from filters import date_bounds, filter_mask
+from reports import report_series
+
+# Share of each BOROUGH x YEAR stratum kept in the sample, and the minimum
+# number of rows kept per stratum so small strata still get usable estimates
+SAMPLE_FRACTION = 0.02
+MIN_PER_STRATUM = 200
+SAMPLE_SEED = 42
+
+# Two-sided 95% normal quantile for the error bounds
+Z_95 = 1.96
+
+
+def build_stratified_sample(df, fraction=SAMPLE_FRACTION, min_per_stratum=MIN_PER_STRATUM, seed=SAMPLE_SEED):
+    """Stratified random sample of the crash table by BOROUGH x YEAR.
+
+    Returns a dict with the sampled rows (still sorted by CRASH_DATE, with a
+    WEIGHT column = stratum size / sampled rows and a STRATUM code) and the
+    population and sample size of each stratum for the variance estimates.
+    """
+    borough_codes, _ = pd.factorize(df["BOROUGH"], use_na_sentinel=False)
+    year_codes, years = pd.factorize(df["YEAR"], use_na_sentinel=False)
+    strata = borough_codes.astype(np.int64) * len(years) + year_codes
+    strata, _ = pd.factorize(strata)
+
+    population = np.bincount(strata)
+    sample_sizes = np.minimum(population, np.maximum(min_per_stratum, np.ceil(population * fraction))).astype(np.int64)
+
+    # Random rank of each row within its stratum; keep the first n_h
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(df)), strata))
+    starts = np.concatenate(([0], np.cumsum(population)[:-1]))
+    rank = np.empty(len(df), dtype=np.int64)
+    rank[order] = np.arange(len(df)) - starts[strata[order]]
+    positions = np.flatnonzero(rank < sample_sizes[strata])
+
+    # Rows keep their labels (= positions in the full table) so the row
+    # indexes built over the table still apply to them
+    rows = df.iloc[positions].copy()
+    rows["STRATUM"] = strata[positions]
+    rows["WEIGHT"] = population[rows["STRATUM"]] / sample_sizes[rows["STRATUM"]]
+    return {"rows": rows, "population": population, "sample_sizes": sample_sizes, "fraction": fraction}
+
+
+def _total_error(sample, matched, values):
+    """95% error bound of the stratified estimate of sum(values) over matched rows."""
+    rows = sample["rows"]
+    n = sample["sample_sizes"]
+    N = sample["population"]
+    y = np.where(matched, values, 0.0)
+    s1 = np.bincount(rows["STRATUM"], weights=y, minlength=len(n))
+    s2 = np.bincount(rows["STRATUM"], weights=y * y, minlength=len(n))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var_h = np.where(n > 1, (s2 - s1 * s1 / n) / (n - 1), 0.0)
+        variance = np.sum(N * N * (1 - n / N) * np.maximum(var_h, 0.0) / n)
+    return int(round(Z_95 * np.sqrt(variance)))
+
+
+def approximate_series(sample, granularity, **filters):
+    """report_series estimated from the sample, plus 95% error bounds on the summary."""
+    rows = sample["rows"]
+    start_date = filters.pop("start_date", None)
+    end_date = filters.pop("end_date", None)
+    lo, hi = date_bounds(rows, start_date, end_date)
+    matched = np.zeros(len(rows), dtype=bool)
+    matched[lo:hi] = filter_mask(rows.iloc[lo:hi], **filters)
+
+    series = report_series(rows[matched], granularity, weight="WEIGHT")
+    error_bounds = {"crashes": _total_error(sample, matched, np.ones(len(rows)))}
+    for key, column in [("injured", "NUMBER_OF_PERSONS_INJURED"), ("killed", "NUMBER_OF_PERSONS_KILLED")]:
+        if column in rows.columns:
+            error_bounds[key] = _total_error(sample, matched, rows[column].fillna(0).to_numpy(dtype=float))
+    return series, error_bounds, int(matched.sum())
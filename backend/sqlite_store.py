@@ -0,0 +1,286 @@
+"""SQLite query backend, an alternative to holding the crash table in pandas.
+
+`python sqlite_store.py` ingests the integrated CSV into an indexed SQLite
+file: b-tree indexes on the filter columns, and an FTS5 trigram index over the
+search fields. With QUERY_BACKEND=sqlite the API opens that file instead of
+loading the CSV. `SqliteStore` runs the filters and the report aggregations as
+SQL, so a worker only keeps SQLite's page cache in memory. The file itself is
+memory-mapped and shared by every worker through the OS page cache.
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from factors import DEFAULT_FACTOR_SCOPE, FACTOR_COLUMNS, TOP_FACTORS, check_factor_scope
+from filters import FACTOR_COLUMN, as_value_list
+from reports import DAY_ORDER, DEFAULT_GRANULARITY, GRANULARITIES
+from vehicles import type_bits, types_in, wanted_bits
+
+SQLITE_PATH = os.environ.get(
+    "SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "crashes.sqlite"),
+)
+
+INDEXED_COLUMNS = ["YEAR", "BOROUGH", FACTOR_COLUMN, "SEVERITY", "CRASH_DATE"]
+SEARCH_COLUMNS = ["BOROUGH", "PERSON_TYPES", "PERSON_INJURIES", FACTOR_COLUMN, "YEAR"]
+# The trigram tokenizer only indexes substrings of 3+ characters; shorter
+# queries are matched with LIKE instead
+MIN_FTS_QUERY = 3
+# vehicles.type_bits of each row, written at build time for the vehicle_type filter
+VEHICLE_BITS_COLUMN = "VEHICLE_TYPE_BITS"
+
+CACHE_KIB = 16 * 1024       # page cache per connection
+MMAP_BYTES = 1 << 30        # shared, read-only mapping of the file
+
+# First day of the period of CRASH_DATE (an ISO date string), per granularity
+PERIOD_SQL = {
+    "day": "CRASH_DATE",
+    "week": "date(CRASH_DATE, '-' || ((CAST(strftime('%w', CRASH_DATE) AS INTEGER) + 6) % 7) || ' days')",
+    "month": "substr(CRASH_DATE, 1, 7) || '-01'",
+    "quarter": "printf('%s-%02d-01', substr(CRASH_DATE, 1, 4), (CAST(substr(CRASH_DATE, 6, 2) AS INTEGER) - 1) / 3 * 3 + 1)",
+}
+
+
+def _q(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def build_database(df, path=SQLITE_PATH, chunk_size=100_000):
+    """Write the prepared crash table (see crash_data.load_data) to a new SQLite file at `path`.
+
+    Rows keep their date order, so rowid order is date order.
+    """
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size].copy()
+            for column in chunk.columns:
+                if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    chunk[column] = chunk[column].astype(object)
+            chunk["CRASH_DATE"] = chunk["CRASH_DATE"].dt.strftime("%Y-%m-%d")
+            chunk[VEHICLE_BITS_COLUMN] = type_bits(chunk).astype("int64")
+            chunk.to_sql("crashes", conn, if_exists="append", index=False)
+        for column in INDEXED_COLUMNS:
+            if column in df.columns:
+                conn.execute(f"CREATE INDEX {_q('idx_' + column.lower().replace(' ', '_'))} ON crashes ({_q(column)})")
+        search = [c for c in SEARCH_COLUMNS if c in df.columns]
+        conn.execute(f"CREATE VIRTUAL TABLE crash_search USING fts5({', '.join(_q(c) for c in search)}, "
+                     "content='', tokenize='trigram')")
+        conn.execute(f"INSERT INTO crash_search (rowid, {', '.join(_q(c) for c in search)}) "
+                     f"SELECT rowid, {', '.join('CAST(' + _q(c) + ' AS TEXT)' for c in search)} FROM crashes")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+
+class SqliteStore:
+    """Read-only queries on a database written by build_database.
+
+    Each thread gets its own connection. The filter arguments are the ones
+    of filters.apply_filters.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"SQLite database not found: {path}. Build it with `python sqlite_store.py`.")
+        self.path = path
+        self._local = threading.local()
+        conn = self.connection()
+        self.columns = [row[1] for row in conn.execute("PRAGMA table_info(crashes)")]
+        self.rows = conn.execute("SELECT MAX(rowid) FROM crashes").fetchone()[0] or 0
+        # The table's columns as loaded, without the ones only kept for filtering
+        self.table_columns = [c for c in self.columns if c != VEHICLE_BITS_COLUMN]
+        self._select = ", ".join(_q(c) for c in self.table_columns)
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA cache_size = -{CACHE_KIB}")
+            conn.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def where(self, borough=None, year=None, factor=None, severity=None, search_query=None,
+              start_date=None, end_date=None, factor_scope=DEFAULT_FACTOR_SCOPE, vehicle_type=None):
+        """SQL condition and parameters selecting the rows that match the filters."""
+        check_factor_scope(factor_scope)
+        clauses, params = [], []
+
+        def isin(column, values):
+            clauses.append(f"{_q(column)} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+        boroughs = as_value_list(borough)
+        if boroughs:
+            isin("BOROUGH", boroughs)
+        years = as_value_list(year)
+        if years:
+            isin("YEAR", [int(y) for y in years])
+        factors = as_value_list(factor)
+        if factors and factor_scope == "any_vehicle":
+            columns = [c for c in FACTOR_COLUMNS if c in self.columns]
+            marks = ", ".join("?" * len(factors))
+            clauses.append("(" + " OR ".join(f"{_q(c)} IN ({marks})" for c in columns) + ")")
+            params.extend(factors * len(columns))
+        elif factors:
+            isin(FACTOR_COLUMN, factors)
+        severities = as_value_list(severity)
+        if severities:
+            isin("SEVERITY", severities)
+        vehicle_types = as_value_list(vehicle_type)
+        if vehicle_types:
+            if VEHICLE_BITS_COLUMN not in self.columns:
+                raise ValueError(f"{self.path} has no vehicle types, rebuild it with `python sqlite_store.py`")
+            clauses.append(f"({VEHICLE_BITS_COLUMN} & ?) != 0")
+            params.append(wanted_bits(vehicle_types))
+        if start_date:
+            clauses.append("CRASH_DATE >= ?")
+            params.append(pd.Timestamp(start_date).strftime("%Y-%m-%d"))
+        if end_date:
+            clauses.append("CRASH_DATE < ?")
+            params.append((pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+
+        if search_query and search_query.strip():
+            q = search_query.strip().lower()
+            if len(q) >= MIN_FTS_QUERY:
+                clauses.append("rowid IN (SELECT rowid FROM crash_search WHERE crash_search MATCH ?)")
+                params.append('"' + q.replace('"', '""') + '"')
+            else:
+                pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                columns = [c for c in SEARCH_COLUMNS if c in self.columns]
+                clauses.append("(" + " OR ".join(f"lower(CAST({_q(c)} AS TEXT)) LIKE ? ESCAPE '\\'" for c in columns) + ")")
+                params.extend([pattern] * len(columns))
+
+        return (" AND ".join(clauses) or "1"), params
+
+    def date_bounds(self, start_date=None, end_date=None):
+        """Positions [lo, hi) of the rows inside the date range, like filters.date_bounds.
+
+        Rows are stored in date order, so both ends are one index seek.
+        """
+        def first_row_from(day):
+            found = self._query("SELECT rowid FROM crashes WHERE CRASH_DATE >= ? ORDER BY CRASH_DATE LIMIT 1", (day,))
+            return found[0][0] - 1 if found else self.rows
+
+        lo = first_row_from(pd.Timestamp(start_date).strftime("%Y-%m-%d")) if start_date else 0
+        hi = self.rows
+        if end_date:
+            hi = first_row_from((pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+        return lo, max(lo, hi)
+
+    def _frame(self, sql, params, chunksize=None):
+        return pd.read_sql_query(sql, self.connection(), params=params, parse_dates=["CRASH_DATE"], chunksize=chunksize)
+
+    def apply_filters(self, **filters):
+        """Rows matching the filters, in date order, as a DataFrame."""
+        where, params = self.where(**filters)
+        return self._frame(f"SELECT {self._select} FROM crashes WHERE {where} ORDER BY rowid", params)
+
+    def iter_filtered_chunks(self, chunk_size, **filters):
+        """Yield the rows matching the filters in DataFrames of up to `chunk_size` rows."""
+        where, params = self.where(**filters)
+        yield from self._frame(f"SELECT {self._select} FROM crashes WHERE {where} ORDER BY rowid", params, chunksize=chunk_size)
+
+    def _counts(self, column, where, params):
+        rows = self._query(f"SELECT {_q(column)}, COUNT(*) AS n FROM crashes WHERE {where} AND {_q(column)} IS NOT NULL "
+                           f"GROUP BY 1 ORDER BY n DESC, 1", params)
+        return pd.DataFrame(rows, columns=[column, "COUNT"])
+
+    def iter_series(self, granularity=DEFAULT_GRANULARITY, **filters):
+        """(name, aggregate) pairs of reports.report_series for the matching rows, one GROUP BY each."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity '{granularity}'. Use one of: {', '.join(GRANULARITIES)}")
+        where, params = self.where(**filters)
+        injured = "NUMBER_OF_PERSONS_INJURED" if "NUMBER_OF_PERSONS_INJURED" in self.columns else "0"
+        killed = "NUMBER_OF_PERSONS_KILLED" if "NUMBER_OF_PERSONS_KILLED" in self.columns else "0"
+
+        crashes, injured_total, killed_total = self._query(
+            f"SELECT COUNT(*), COALESCE(SUM({injured}), 0), COALESCE(SUM({killed}), 0) FROM crashes WHERE {where}", params)[0]
+        yield "summary", {"crashes": int(crashes), "injured": int(round(injured_total)), "killed": int(round(killed_total))}
+        yield "borough", self._counts("BOROUGH", where, params)
+
+        over_time = self._query(
+            f"SELECT {PERIOD_SQL[granularity]} AS period, COALESCE(SUM({injured}), 0) FROM crashes "
+            f"WHERE {where} AND CRASH_DATE IS NOT NULL GROUP BY period ORDER BY period", params)
+        over_time = pd.DataFrame(over_time, columns=["PERIOD", "NUMBER_OF_PERSONS_INJURED"])
+        over_time["PERIOD"] = pd.to_datetime(over_time["PERIOD"])
+        yield "time", over_time
+        yield "severity", self._counts("SEVERITY", where, params)
+
+        heatmap = None
+        if "HOUR" in self.columns:
+            heatmap = pd.DataFrame(self._query(
+                f"SELECT DAY_OF_WEEK, HOUR, COUNT(*) FROM crashes WHERE {where} "
+                f"AND DAY_OF_WEEK IS NOT NULL AND HOUR IS NOT NULL GROUP BY 1, 2", params),
+                columns=["DAY_OF_WEEK", "HOUR", "COUNT"])
+            heatmap["DAY_OF_WEEK"] = pd.Categorical(heatmap["DAY_OF_WEEK"], categories=DAY_ORDER, ordered=True)
+            heatmap = heatmap.sort_values(["DAY_OF_WEEK", "HOUR"])
+        yield "heatmap", heatmap
+
+        # A crash counts once per distinct factor over all its vehicles: UNION
+        # drops the repeats of (row, factor)
+        columns = [c for c in FACTOR_COLUMNS if c in self.columns]
+        factors = None
+        if columns:
+            union = " UNION ".join(f"SELECT r, {_q(c)} AS f FROM selected" for c in columns)
+            factors = pd.DataFrame(self._query(
+                f"WITH selected AS MATERIALIZED (SELECT rowid AS r, {', '.join(_q(c) for c in columns)} "
+                f"FROM crashes WHERE {where}) "
+                f"SELECT f, COUNT(*) AS n FROM ({union}) WHERE f IS NOT NULL GROUP BY f ORDER BY n DESC, f LIMIT ?",
+                [*params, TOP_FACTORS]), columns=["FACTOR", "COUNT"])
+        yield "factors", factors
+
+    def report_series(self, granularity=DEFAULT_GRANULARITY, **filters):
+        """reports.report_series of the matching rows."""
+        return dict(self.iter_series(granularity, **filters))
+
+    def filter_options(self):
+        """Distinct values behind /api/filters."""
+        def distinct(column):
+            return [row[0] for row in self._query(f"SELECT DISTINCT {_q(column)} FROM crashes WHERE {_q(column)} IS NOT NULL ORDER BY 1")]
+
+        union = " UNION ".join(f"SELECT {_q(c)} AS f FROM crashes" for c in FACTOR_COLUMNS if c in self.columns)
+        factors = [row[0] for row in self._query(f"SELECT f FROM ({union}) WHERE f IS NOT NULL ORDER BY 1")] if union else []
+        min_date, max_date = self._query("SELECT MIN(CRASH_DATE), MAX(CRASH_DATE) FROM crashes")[0]
+        bits = [row[0] for row in self._query(f"SELECT DISTINCT {VEHICLE_BITS_COLUMN} FROM crashes")] if VEHICLE_BITS_COLUMN in self.columns else []
+        return {
+            "boroughs": [b for b in distinct("BOROUGH") if b != "UNKNOWN"],
+            "years": [int(y) for y in distinct("YEAR")],
+            "factors": factors,
+            "severities": distinct("SEVERITY"),
+            "vehicle_types": types_in(bits),
+            "date_range": {"min": min_date, "max": max_date},
+        }
+
+
+def main():
+    import crash_data
+
+    parser = argparse.ArgumentParser(description="Ingest the integrated crash CSV into an indexed SQLite file.")
+    parser.add_argument("--out", default=SQLITE_PATH, help="database path (default: %(default)s)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = crash_data.load_data()
+    build_database(df, args.out)
+    print(f"✓ Wrote {len(df)} rows to {args.out} ({os.path.getsize(args.out) / 1e6:.1f} MB) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Shared fixtures: a small synthetic integrated CSV, loaded the way the app loads it."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOROUGHS = ["BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND", "UNKNOWN"]
+FACTORS = ["Unspecified", "Driver Inattention/Distraction", "Unsafe Speed", "Backing Unsafely", None]
+VEHICLE_TYPES = ["Sedan", "Station Wagon/Sport Utility Vehicle", "Taxi", "Bike", "Box Truck", "E-Bike", None]
+STREETS = ["ATLANTIC AVENUE", "3 AVENUE", "3rd Ave.", "BROADWAY", "FLATBUSH AVENUE", "GRAND CONCOURSE", None]
+
+
+def make_integrated(n=3000, seed=0):
+    """Crash rows with the columns of the integrated CSV (etl.CRASH_COLUMNS + persons)."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(rng.integers(0, 4 * 365, n), unit="D")
+    injured = rng.choice([0, 0, 0, 1, 2], n)
+    killed = (rng.random(n) < 0.02).astype(int)
+    df = pd.DataFrame({
+        "CRASH_DATE": dates.strftime("%Y-%m-%d"),
+        "CRASH_TIME": [f"{h}:{m:02d}" for h, m in zip(rng.integers(0, 24, n), rng.integers(0, 60, n))],
+        "BOROUGH": rng.choice(BOROUGHS, n),
+        "LATITUDE": 40.5 + rng.random(n) * 0.4,
+        "LONGITUDE": -74.2 + rng.random(n) * 0.5,
+        "ON STREET NAME": rng.choice(STREETS, n),
+        "CROSS STREET NAME": rng.choice(STREETS, n),
+        "NUMBER_OF_PERSONS_INJURED": injured,
+        "NUMBER_OF_PERSONS_KILLED": killed,
+        **{f"CONTRIBUTING FACTOR VEHICLE {i}": rng.choice(FACTORS, n) for i in range(1, 6)},
+        "COLLISION_ID": np.arange(n) + 4_000_000,
+        **{f"VEHICLE TYPE CODE {i}": rng.choice(VEHICLE_TYPES, n) for i in range(1, 6)},
+        "PERSON_TYPES": rng.choice(["Driver", "Pedestrian", "Occupant, Pedestrian"], n),
+        "PERSON_INJURIES": rng.choice(["Unspecified", "Injured", "Unspecified, Injured"], n),
+    })
+    df["YEAR"] = dates.year
+    df["MONTH"] = dates.month
+    df["DAY_OF_WEEK"] = dates.day_name()
+    df["HOUR"] = pd.to_datetime(df["CRASH_TIME"], format="%H:%M").dt.hour
+    return df
+
+
+@pytest.fixture(scope="session")
+def integrated_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp("data") / "integrated_crashes_for_app.csv"
+    make_integrated().to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def crashes(integrated_csv):
+    """The prepared crash table (crash_data.load_data)."""
+    import crash_data
+
+    return crash_data.load_data(integrated_csv)
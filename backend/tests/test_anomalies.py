@@ -0,0 +1,126 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomalies
+from anomalies import detect, load_anomalies, rolling_zscores, weekly_counts
+from bundle import data_signature
+from rollups import build_daily_rollup
+
+
+def test_zscores_match_a_rolling_window_per_series():
+    rng = np.random.default_rng(0)
+    counts = rng.poisson(rng.uniform(0.2, 20, (40, 1)), (40, 90))
+    baseline, std, z = rolling_zscores(counts, window=8)
+    for row in range(len(counts)):
+        series = pd.Series(counts[row], dtype=float)
+        expected_mean = series.rolling(8).mean().shift(1)
+        expected_std = series.rolling(8).std(ddof=0).shift(1)
+        np.testing.assert_allclose(baseline[row], expected_mean, equal_nan=True)
+        np.testing.assert_allclose(std[row], expected_std, atol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(z[row], (series - expected_mean) / expected_std.clip(lower=1.0),
+                                   atol=1e-9, equal_nan=True)
+    assert np.isnan(z[:, :8]).all()
+
+
+def test_flat_baseline_uses_the_std_floor():
+    counts = np.array([[2] * 12 + [6]])
+    baseline, std, z = rolling_zscores(counts, window=12)
+    assert baseline[0, -1] == 2 and std[0, -1] == 0
+    assert z[0, -1] == 4.0
+
+
+def _rollup(rows):
+    """Daily rollup of (date, borough, factor, severity, crashes) rows."""
+    df = pd.DataFrame(rows, columns=["CRASH_DATE", "BOROUGH", "CONTRIBUTING FACTOR VEHICLE 1", "SEVERITY", "n"])
+    df = df.loc[df.index.repeat(df.pop("n"))].reset_index(drop=True)
+    df["CRASH_DATE"] = pd.to_datetime(df["CRASH_DATE"])
+    df["YEAR"] = df["CRASH_DATE"].dt.year
+    df["NUMBER_OF_PERSONS_INJURED"] = 0
+    df["NUMBER_OF_PERSONS_KILLED"] = 0
+    return build_daily_rollup(df.astype({"BOROUGH": "category", "SEVERITY": "category",
+                                         "CONTRIBUTING FACTOR VEHICLE 1": "category"}))
+
+
+def test_detects_an_injected_spike():
+    mondays = pd.date_range("2021-01-04", periods=30, freq="7D")
+    rows = [(d, "QUEENS", "Unsafe Speed", "Injury", 2 + i % 2) for i, d in enumerate(mondays)]
+    # On Sundays: the data runs to the end of its last week
+    rows += [(d + pd.Timedelta(days=6), "BRONX", None, "No Injury", 5) for d in mondays]
+    rows.append((mondays[20] + pd.Timedelta(days=3), "QUEENS", "Unsafe Speed", "Injury", 9))
+    rollup = _rollup(rows)
+
+    counts, series, first_week = weekly_counts(rollup)
+    assert str(first_week) == "2021-01-04"
+    assert counts.sum() == sum(r[4] for r in rows)
+    assert sorted(map(tuple, series.to_numpy().tolist())) == [
+        ("BRONX", "UNKNOWN", "No Injury"), ("QUEENS", "Unsafe Speed", "Injury")]
+
+    result = detect(rollup)
+    assert [(a["week"], a["borough"], a["factor"], a["crashes"]) for a in result["anomalies"]] == [
+        ("2021-05-24", "QUEENS", "Unsafe Speed", 11)]
+    assert result["window"] == anomalies.WINDOW and result["weeks"] == 30
+
+
+def test_incomplete_last_week_is_not_flagged():
+    mondays = pd.date_range("2021-01-04", periods=20, freq="7D")
+    rows = [(d, "QUEENS", "Unsafe Speed", "Injury", 2) for d in mondays[:-1]]
+    rows.append((mondays[-1], "QUEENS", "Unsafe Speed", "Injury", 20))
+    assert detect(_rollup(rows))["anomalies"] == []
+
+
+@pytest.fixture
+def stored(crashes, tmp_path):
+    path = str(tmp_path / "anomalies.json")
+    result = dict(detect(build_daily_rollup(crashes)), data=data_signature(crashes))
+    anomalies.write_anomalies(dict(result, anomalies=[{"week": "stored"}]), path)
+    return path
+
+
+def test_stored_result_is_used_when_it_matches(crashes, stored):
+    assert load_anomalies(crashes, stored)["result"]["anomalies"] == [{"week": "stored"}]
+
+
+def test_stored_result_with_other_parameters_is_recomputed(crashes, stored):
+    result = load_anomalies(crashes, stored, window=8)["result"]
+    assert result["window"] == 8
+    assert result["anomalies"] != [{"week": "stored"}]
+
+    with open(stored) as f:
+        saved = json.load(f)
+    saved["z_threshold"] = 2.0
+    anomalies.write_anomalies(saved, stored)
+    result = load_anomalies(crashes, stored)["result"]
+    assert result["z_threshold"] == anomalies.Z_THRESHOLD
+    assert result["anomalies"] != [{"week": "stored"}]
+
+
+def test_stored_result_from_other_data_is_recomputed(crashes, stored):
+    corrected = crashes.copy()
+    corrected.loc[5, "SEVERITY"] = "Fatal" if corrected.loc[5, "SEVERITY"] != "Fatal" else "Injury"
+    assert load_anomalies(corrected, stored)["result"]["anomalies"] != [{"week": "stored"}]
+
+
+def test_load_reuses_the_daily_rollup_built_before_it(crashes, tmp_path, monkeypatch):
+    import crash_data
+    import rollups
+
+    calls = []
+
+    def build_daily_rollup(df):
+        calls.append(len(df))
+        return original(df)
+
+    original = rollups.build_daily_rollup
+    monkeypatch.setattr(rollups, "build_daily_rollup", build_daily_rollup)
+    load = anomalies.load_anomalies
+    monkeypatch.setattr(anomalies, "load_anomalies", lambda df: load(df, str(tmp_path / "anomalies.json")))
+    monkeypatch.setattr(crash_data, "INDEX_BUILDERS", {"daily": "rollups:build_daily_rollup",
+                                                       "anomalies": "anomalies:load_anomalies"})
+    monkeypatch.setattr(crash_data, "_state", dict(crash_data._state, indexes={}, phases={}))
+
+    indexes = crash_data._build_indexes(crashes)
+    assert calls == [len(crashes)]
+    assert indexes["anomalies"]["result"] == dict(detect(indexes["daily"]), data=data_signature(crashes))
@@ -0,0 +1,35 @@
+import json
+
+from bundle import MANIFEST_NAME, data_signature, load_bundle
+
+
+def test_signature_is_stable(crashes):
+    assert data_signature(crashes) == data_signature(crashes.copy())
+
+
+def test_signature_sees_corrected_values(crashes):
+    corrected = crashes.copy()
+    corrected.loc[10, "NUMBER_OF_PERSONS_INJURED"] += 1
+    assert data_signature(corrected)["rows"] == data_signature(crashes)["rows"]
+    assert data_signature(corrected) != data_signature(crashes)
+
+    relabelled = crashes.copy()
+    relabelled["CONTRIBUTING FACTOR VEHICLE 3"] = relabelled["CONTRIBUTING FACTOR VEHICLE 3"].shift(1)
+    assert data_signature(relabelled) != data_signature(crashes)
+
+
+def test_signature_follows_row_order(crashes):
+    shuffled = crashes.sample(frac=1, random_state=0).sort_values("CRASH_DATE", kind="stable")
+    assert not shuffled.index.equals(crashes.index)
+    assert data_signature(shuffled) != data_signature(crashes)
+
+
+def test_bundle_from_other_data_is_ignored(crashes, tmp_path):
+    manifest = {"data": data_signature(crashes), "reports": [
+        {"granularity": "month", "borough": None, "year": None, "severity": None, "file": "month/all_all_all.json.gz"}]}
+    (tmp_path / MANIFEST_NAME).write_text(json.dumps(manifest))
+    assert len(load_bundle(crashes, str(tmp_path))["files"]) == 1
+
+    corrected = crashes.copy()
+    corrected.loc[0, "BOROUGH"] = "QUEENS" if corrected.loc[0, "BOROUGH"] != "QUEENS" else "BRONX"
+    assert load_bundle(corrected, str(tmp_path)) is None
@@ -0,0 +1,162 @@
+"""downloads.py against a local stand-in for the Open Data export server."""
+import email.utils
+import hashlib
+import http.client
+import http.server
+import os
+import random
+import threading
+import time
+
+import pytest
+
+import downloads
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    """Serves `files` (name -> bytes) with ETag / Last-Modified, conditional GETs and Range / If-Range.
+
+    `drop_after[name] = n` closes the connection after n bytes of the next body.
+    Every request is logged as (name, status, request headers).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.files, self.modified, self.drop_after, self.log = {}, {}, {}, []
+
+    def put(self, name, data):
+        self.files[name] = data
+        self.modified[name] = email.utils.formatdate(time.time(), usegmt=True)
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+    def statuses(self):
+        return [status for _, status, _ in self.log]
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers, body=b""):
+        self.server.log.append((self.path.lstrip("/"), status, dict(self.headers)))
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        drop = self.server.drop_after.pop(self.path.lstrip("/"), None)
+        if drop is not None:
+            self.wfile.write(body[:drop])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        data = self.server.files[name]
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        validators = {"ETag": etag, "Last-Modified": self.server.modified[name]}
+        if self.headers.get("If-None-Match") == etag:
+            return self._reply(304, {"ETag": etag})
+        range_ = self.headers.get("Range")
+        if range_ and self.headers.get("If-Range") in (None, etag, validators["Last-Modified"]):
+            start = int(range_.split("=")[1].split("-")[0])
+            if start >= len(data):
+                return self._reply(416, {"Content-Range": f"bytes */{len(data)}"})
+            return self._reply(206, {**validators, "Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"},
+                               data[start:])
+        self._reply(200, validators, data)
+
+
+@pytest.fixture
+def server():
+    server = StandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _payload(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+def _read(url, cache_dir):
+    with downloads.open_url(url, cache_dir) as f:
+        return f.read()
+
+
+def _interrupt(server, name, cache_dir, after):
+    """Start a download that the server cuts off after `after` bytes."""
+    server.drop_after[name] = after
+    with pytest.raises((OSError, http.client.HTTPException)):
+        _read(server.url(name), cache_dir)
+
+
+def test_downloads_into_the_cache(server, tmp_path):
+    data = _payload(300_000)
+    server.put("crashes.csv", data)
+    assert _read(server.url("crashes.csv"), tmp_path) == data
+    path = downloads.cache_path(server.url("crashes.csv"), tmp_path)
+    with open(path, "rb") as f:
+        assert f.read() == data
+    assert not os.path.exists(path + ".part")
+
+
+def test_resumes_a_partial_download(server, tmp_path):
+    data = _payload(3_000_000)
+    server.put("crashes.csv", data)
+    _interrupt(server, "crashes.csv", tmp_path, after=1_200_000)
+    path = downloads.cache_path(server.url("crashes.csv"), tmp_path)
+    offset = os.path.getsize(path + ".part")
+    assert 0 < offset < len(data)
+
+    assert _read(server.url("crashes.csv"), tmp_path) == data
+    name, status, headers = server.log[-1]
+    assert status == 206
+    assert headers["Range"] == f"bytes={offset}-"
+    assert headers["If-Range"] == '"' + hashlib.md5(data).hexdigest() + '"'
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_revalidates_with_304_and_keeps_the_cached_file(server, tmp_path):
+    data = _payload(200_000)
+    server.put("persons.csv", data)
+    _read(server.url("persons.csv"), tmp_path)
+    path = downloads.cache_path(server.url("persons.csv"), tmp_path)
+    mtime = os.stat(path).st_mtime_ns
+
+    assert _read(server.url("persons.csv"), tmp_path) == data
+    assert server.statuses() == [200, 304]
+    assert "If-None-Match" in server.log[-1][2]
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_changed_file_restarts_the_partial_download(server, tmp_path):
+    server.put("vehicles.csv", _payload(2_000_000))
+    _interrupt(server, "vehicles.csv", tmp_path, after=700_000)
+
+    changed = _payload(1_500_000, seed=7)
+    server.put("vehicles.csv", changed)
+    assert _read(server.url("vehicles.csv"), tmp_path) == changed
+    name, status, headers = server.log[-1]
+    assert "Range" in headers and status == 200
+    with open(downloads.cache_path(server.url("vehicles.csv"), tmp_path), "rb") as f:
+        assert f.read() == changed
+
+
+def test_changed_file_replaces_the_cached_copy(server, tmp_path):
+    server.put("crashes.csv", _payload(100_000))
+    _read(server.url("crashes.csv"), tmp_path)
+    changed = _payload(120_000, seed=3)
+    server.put("crashes.csv", changed)
+    assert _read(server.url("crashes.csv"), tmp_path) == changed
+    assert server.statuses() == [200, 200]
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import etl
+from conftest import make_integrated
+from persons import PERSONS_CSV_NAME
+
+
+@pytest.fixture(scope="module")
+def raw(tmp_path_factory):
+    """Raw crashes, persons and vehicles exports, shuffled, with repeated and revised records."""
+    rng = np.random.default_rng(1)
+    src = make_integrated(n=2000, seed=1)
+    directory = tmp_path_factory.mktemp("raw")
+
+    crashes = src.drop(columns=["PERSON_TYPES", "PERSON_INJURIES", "YEAR", "MONTH", "DAY_OF_WEEK", "HOUR"]).rename(
+        columns={v: k for k, v in etl.CRASH_RENAMES.items()})
+    crashes["CRASH DATE"] = pd.to_datetime(crashes["CRASH DATE"]).dt.strftime("%m/%d/%Y")
+    crashes["BOROUGH"] = crashes["BOROUGH"].replace({"UNKNOWN": None, "STATEN ISLAND": "Richmond"})
+    revised = crashes.sample(50, random_state=2).assign(**{"NUMBER OF PERSONS INJURED": 9})
+    crashes = pd.concat([crashes, crashes.sample(100, random_state=1), revised]).sample(frac=1, random_state=3)
+
+    ids = np.repeat(src["COLLISION_ID"].to_numpy(), rng.integers(0, 4, len(src)))
+    persons = pd.DataFrame({
+        "UNIQUE_ID": np.arange(len(ids)) + 10_000_000,
+        "COLLISION_ID": ids,
+        "VEHICLE_ID": rng.integers(1, 10**6, len(ids)),
+        "PERSON_TYPE": rng.choice(["Driver", "Pedestrian", "Occupant", "Bicyclist"], len(ids)),
+        "PERSON_INJURY": rng.choice(["Unspecified", "Injured", "Killed"], len(ids), p=[0.8, 0.19, 0.01]),
+        "PERSON_AGE": rng.integers(1, 90, len(ids)),
+        "PERSON_SEX": rng.choice(["M", "F", "U"], len(ids)),
+    })
+    persons = pd.concat([persons, persons.sample(80, random_state=4)]).sample(frac=1, random_state=5)
+
+    ids = np.repeat(src["COLLISION_ID"].to_numpy(), rng.integers(1, 3, len(src)))
+    vehicles = pd.DataFrame({
+        "UNIQUE_ID": np.arange(len(ids)) + 20_000_000,
+        "COLLISION_ID": ids,
+        "VEHICLE_TYPE": rng.choice(["Sedan", "4 dr sedan", "E-Bike", "Box Truck", "Taxi", None], len(ids)),
+        "VEHICLE_MAKE": rng.choice(["TOYOTA", "Honda ", "FORD", None], len(ids)),
+        "PRE_CRASH": rng.choice(["Going Straight Ahead", "Parked", "Making Left Turn"], len(ids)),
+    }).sample(frac=1, random_state=6)
+
+    paths = {}
+    for name, frame in [("crashes", crashes), ("persons", persons), ("vehicles", vehicles)]:
+        paths[name] = str(directory / f"{name}.csv")
+        frame.to_csv(paths[name], index=False)
+    return paths
+
+
+def _run(raw, out_dir, workers):
+    os.makedirs(out_dir)
+    report = etl.run(raw["crashes"], raw["persons"], out_dir=str(out_dir), workers=workers, chunksize=700,
+                     vehicles_path=raw["vehicles"])
+    outputs = {}
+    for name in [etl.CSV_NAME, PERSONS_CSV_NAME]:
+        with open(os.path.join(out_dir, name), "rb") as f:
+            outputs[name] = f.read()
+    return report, outputs
+
+
+def test_output_does_not_depend_on_the_worker_count(raw, tmp_path):
+    report, expected = _run(raw, tmp_path / "workers-1", workers=1)
+    assert report["etl"]["partitions"] == 4
+    for workers in [2, 4]:
+        other, outputs = _run(raw, tmp_path / f"workers-{workers}", workers=workers)
+        assert outputs == expected
+        assert other["etl"]["crashes"] == report["etl"]["crashes"]
+        assert other["etl"]["persons"] == report["etl"]["persons"]
+
+
+def test_output_is_deduplicated_and_ordered_by_year(raw, tmp_path):
+    _run(raw, tmp_path / "out", workers=2)
+    df = pd.read_csv(tmp_path / "out" / etl.CSV_NAME, low_memory=False)
+    assert list(df.columns) == etl.INTEGRATED_COLUMNS
+    assert df["COLLISION_ID"].is_unique and len(df) == 2000
+    assert df["YEAR"].is_monotonic_increasing
+    assert set(df["BOROUGH"]) <= {"BRONX", "BROOKLYN", "MANHATTAN", "QUEENS", "STATEN ISLAND", "UNKNOWN"}
+    persons = pd.read_csv(tmp_path / "out" / PERSONS_CSV_NAME)
+    assert persons["UNIQUE_ID"].is_unique
+    assert df["PERSON_COUNT"].sum() == len(persons)
@@ -0,0 +1,52 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from export import stream_export
+from filters import apply_filters
+
+COLUMNS = ["COLLISION_ID", "CRASH_DATE", "BOROUGH", "NUMBER_OF_PERSONS_INJURED"]
+
+
+def test_csv_has_one_header(crashes):
+    body = "".join(stream_export(crashes, "csv", columns=COLUMNS, chunk_size=100))
+    exported = pd.read_csv(io.StringIO(body))
+    assert list(exported.columns) == COLUMNS
+    assert exported["COLLISION_ID"].tolist() == crashes["COLLISION_ID"].tolist()
+
+
+def test_csv_without_matches_sends_the_header(crashes):
+    body = "".join(stream_export(crashes, "csv", columns=COLUMNS, borough="NOWHERE"))
+    assert body.strip() == ",".join(COLUMNS)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 100_000])
+def test_ndjson_is_one_record_per_line(crashes, chunk_size):
+    body = "".join(stream_export(crashes, "ndjson", columns=COLUMNS, chunk_size=chunk_size, borough="QUEENS"))
+    expected = apply_filters(crashes, borough="QUEENS")
+    lines = body.split("\n")
+    # Every record ends with a newline and there are no blank lines in between
+    assert lines[-1] == ""
+    assert len(lines) - 1 == len(expected)
+    records = [json.loads(line) for line in lines[:-1]]
+    assert [r["COLLISION_ID"] for r in records] == expected["COLLISION_ID"].tolist()
+
+
+def test_ndjson_without_matches_is_empty(crashes):
+    assert "".join(stream_export(crashes, "ndjson", columns=COLUMNS, borough="NOWHERE")) == ""
+
+
+def test_arrow_round_trip(crashes):
+    pa = pytest.importorskip("pyarrow")
+    body = b"".join(stream_export(crashes, "arrow", columns=COLUMNS, chunk_size=250, year="2021"))
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column_names == COLUMNS
+    assert table.column("COLLISION_ID").to_pylist() == apply_filters(crashes, year="2021")["COLLISION_ID"].tolist()
+
+
+@pytest.mark.parametrize("fmt, columns", [("xml", None), ("csv", ["NOPE"])])
+def test_rejects_bad_requests(crashes, fmt, columns):
+    with pytest.raises(ValueError):
+        stream_export(crashes, fmt, columns=columns)
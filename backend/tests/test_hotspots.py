@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filters import apply_filters
+from hotspots import KINDS, METRICS, build_hotspot_index, hotspots, location_keys, normalize_streets
+
+
+@pytest.fixture(scope="module")
+def skewed():
+    """Crashes over 500 streets with Zipf-distributed counts, and uniform intersections."""
+    rng = np.random.default_rng(0)
+    n = 30_000
+    streets = np.array([f"{i} STREET" for i in range(500)])
+    df = pd.DataFrame({
+        "YEAR": rng.integers(2015, 2022, n),
+        "BOROUGH": pd.Categorical(rng.choice(["BRONX", "BROOKLYN", "QUEENS", "UNKNOWN"], n)),
+        "SEVERITY": pd.Categorical(rng.choice(["Fatal", "Injury", "No Injury"], n, p=[0.02, 0.3, 0.68])),
+        "NUMBER_OF_PERSONS_INJURED": rng.poisson(0.4, n),
+        "NUMBER_OF_PERSONS_KILLED": (rng.random(n) < 0.02).astype(int),
+    })
+    df["STREET_KEY"] = pd.Categorical(np.where(rng.random(n) < 0.1, None, streets[rng.zipf(1.3, n) % 500]))
+    df["INTERSECTION_KEY"] = pd.Categorical(streets[rng.integers(0, 500, n)])
+    return df, build_hotspot_index(df)
+
+
+def _expected(df, kind, metric, k):
+    """Top k of a groupby: largest total first, then by name."""
+    weights = pd.Series(1, index=df.index) if metric == "crashes" else df[{
+        "injured": "NUMBER_OF_PERSONS_INJURED", "killed": "NUMBER_OF_PERSONS_KILLED"}[metric]]
+    totals = weights.groupby(df[KINDS[kind]].astype(object)).sum()
+    totals = totals[totals > 0].rename_axis("location").reset_index(name="total")
+    totals = totals.sort_values(["total", "location"], ascending=[False, True]).head(k)
+    return list(zip(totals["location"], totals["total"]))
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"borough": "QUEENS"},
+    {"year": ["2016", "2017"], "severity": "Injury"},
+    {"borough": "BRONX", "year": "2020", "severity": "Fatal"},
+    {"borough": "BRONX", "year": "2030"},
+])
+@pytest.mark.parametrize("kind", list(KINDS))
+@pytest.mark.parametrize("metric", METRICS)
+def test_partition_top_k_matches_groupby(skewed, filters, kind, metric):
+    df, index = skewed
+    result = hotspots(df, kind, metric, 10, index=index, **filters)
+    assert result["source"] == "partitions"
+    got = [(loc["location"], loc[metric]) for loc in result["locations"]]
+    assert got == _expected(apply_filters(df, **filters), kind, metric, 10)
+    assert [loc["rank"] for loc in result["locations"]] == list(range(1, len(got) + 1))
+
+
+@pytest.mark.parametrize("k", [1, 25, 100])
+def test_partition_and_row_paths_agree(crashes, k):
+    index = build_hotspot_index(crashes)
+    by_partition = hotspots(crashes, "street", "injured", k, index=index, borough="BROOKLYN")
+    by_row = hotspots(crashes, "street", "injured", k, index=index, borough="BROOKLYN", start_date="2000-01-01")
+    assert by_row["source"] == "rows"
+    assert by_partition["locations"] == by_row["locations"]
+
+
+def test_row_filters_match_groupby(crashes):
+    index = build_hotspot_index(crashes)
+    filters = {"factor": "Unsafe Speed", "start_date": "2020-01-01", "end_date": "2021-06-30"}
+    result = hotspots(crashes, "intersection", "crashes", 5, index=index, **filters)
+    got = [(loc["location"], loc["crashes"]) for loc in result["locations"]]
+    assert got == _expected(apply_filters(crashes, **filters), "intersection", "crashes", 5)
+
+
+def test_street_spellings_are_folded():
+    keys = normalize_streets(["3rd Ave.", "3 AVENUE", "E 14 St", "st marks pl", None]).tolist()
+    assert keys[:4] == ["3 AVENUE", "3 AVENUE", "EAST 14 STREET", "ST MARKS PLACE"]
+    assert pd.isna(keys[4])
+
+    street, intersection = location_keys(pd.Series(["BROADWAY", "3rd Ave.", "BROADWAY"]),
+                                         pd.Series(["3 AVENUE", "BROADWAY", "BROADWAY"]))
+    assert intersection.tolist()[:2] == ["3 AVENUE & BROADWAY"] * 2
+    assert pd.isna(intersection.iloc[2])
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+import profiling
+from profiling import Profile, check_thresholds, profile_chunks
+
+
+def _chunks(df, size):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+def test_report_does_not_depend_on_chunking(crashes):
+    df = pd.DataFrame(crashes).astype({c: object for c in crashes.select_dtypes("category").columns})
+    whole = profile_chunks([df])
+    assert profile_chunks(_chunks(df, 333)) == whole
+    assert whole["rows"] == len(df)
+    assert whole["duplicate_ids"] == 0
+    assert check_thresholds(whole) == []
+
+
+def test_counts_duplicate_ids_across_chunks():
+    ids = pd.DataFrame({"COLLISION_ID": [1, 2, 3, 2, 4, 1, 1, None]})
+    report = profile_chunks(_chunks(ids, 3))
+    assert report["duplicate_ids"] == 3
+    assert check_thresholds(report) == ["COLLISION_ID: null_rate 12.5000% > 0.0000%", "COLLISION_ID: 3 duplicate ids > 0"]
+
+
+def test_domain_violations_are_exact():
+    chunk = pd.DataFrame({"HOUR": [0, 5, 23, 24, -1, None], "BOROUGH": ["QUEENS", "queens", "BRONX", None, "X", "X"]})
+    columns = profile_chunks(_chunks(chunk, 4))["columns"]
+    assert columns["HOUR"]["domain_violations"] == 2
+    assert columns["BOROUGH"]["domain_violations"] == 3
+    assert columns["BOROUGH"]["unexpected_values"] == ["X", "queens"]
+
+
+def test_high_cardinality_columns_keep_bounded_state(monkeypatch):
+    monkeypatch.setattr(profiling, "MAX_DISTINCT", 500)
+    rng = np.random.default_rng(0)
+    profile = Profile()
+    values = []
+    for i in range(10):
+        chunk = pd.DataFrame({
+            "COLLISION_ID": np.arange(i * 2000, (i + 1) * 2000),
+            "AMOUNT": rng.normal(100, 15, 2000),
+            "NAME": pd.Series(rng.integers(0, 50_000, 2000)).astype(str),
+        })
+        values.append(chunk["AMOUNT"].to_numpy())
+        profile.update(chunk)
+    assert isinstance(profile.counts["AMOUNT"], profiling._Histogram)
+    assert len(profile.counts["AMOUNT"].counts) == profiling.HISTOGRAM_BINS
+    assert len(profile.counts["NAME"]) <= 2 * 500
+
+    report = profile.report()
+    amount = report["columns"]["AMOUNT"]
+    values = np.concatenate(values)
+    assert amount["approximate"] and report["columns"]["NAME"]["approximate"]
+    assert amount["min"] == values.min() and amount["max"] == values.max()
+    assert abs(amount["mean"] - values.mean()) < 1e-3
+    width = profile.counts["AMOUNT"].width
+    for q, value in amount["quantiles"].items():
+        assert abs(value - np.quantile(values, float(q))) <= width
+    assert report["duplicate_ids"] == 0
+
+
+def test_histogram_widens_to_new_values():
+    histogram = profiling._Histogram(0, 10, bins=8)
+    histogram.add(np.array([0.0, 5.0, 9.9]))
+    histogram.add(np.array([-30.0, 100.0]))
+    middles, counts = histogram.value_counts()
+    assert counts.sum() == 5
+    assert histogram.low <= -30 and histogram.low + histogram.width * 8 > 100
@@ -0,0 +1,55 @@
+"""/api/report/stream on the synthetic table, with the stratified sample loaded."""
+import json
+from collections import Counter, OrderedDict
+
+import pytest
+
+import crash_data
+import report_cache
+from sampling import build_stratified_sample
+
+
+@pytest.fixture
+def client(crashes, monkeypatch):
+    state = dict(crash_data._state, state="ready", backend="pandas", df=crashes, rows=len(crashes),
+                 indexes={"sample": build_stratified_sample(crashes)})
+    monkeypatch.setattr(crash_data, "_state", state)
+    monkeypatch.setattr(report_cache, "_cache", OrderedDict())
+    monkeypatch.setattr(report_cache, "_usage", Counter())
+    import app
+
+    return app.app.test_client()
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_estimate_comes_before_the_exact_parts(client, crashes):
+    events = _events(client.post("/api/report/stream", json={"borough": ["QUEENS"]}))
+    names = [name for name, _ in events]
+    assert names[:2] == ["approximate", "summary"] and names[-1] == "done"
+    assert set(names[2:-1]) == {"chart"}
+
+    estimate, summary = events[0][1], events[1][1]
+    assert estimate["approximate"] and estimate["sample"]["rows"] > 0
+    assert set(estimate["charts"]) == set(events[-1][1]["charts"])
+    assert summary["crashes"] == (crashes["BOROUGH"] == "QUEENS").sum()
+    assert abs(estimate["summary"]["crashes"] - summary["crashes"]) <= 3 * estimate["error_bounds"]["crashes"]
+
+
+def test_cached_report_is_sent_without_an_estimate(client):
+    _events(client.post("/api/report/stream", json={"year": ["2020"]}))
+    events = _events(client.post("/api/report/stream", json={"year": ["2020"]}))
+    assert events[0][0] == "summary"
+    assert events[-1][0] == "done" and events[-1][1]["cached"]
+
+
+def test_no_estimate_without_a_sample(client):
+    crash_data._state["indexes"] = {}
+    events = _events(client.post("/api/report/stream", json={"borough": ["BRONX"]}))
+    assert "approximate" not in [name for name, _ in events]
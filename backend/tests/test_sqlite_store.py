@@ -0,0 +1,60 @@
+import io
+
+import pandas as pd
+import pytest
+
+from export import stream_export
+from filters import apply_filters
+from sqlite_store import VEHICLE_BITS_COLUMN, SqliteStore, build_database
+
+
+@pytest.fixture(scope="module")
+def store(crashes, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("sqlite") / "crashes.sqlite")
+    build_database(crashes, path)
+    return SqliteStore(path)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"borough": "QUEENS"},
+    {"borough": ["BRONX", "BROOKLYN"], "year": "2020", "severity": "Injury"},
+    {"factor": "Unsafe Speed", "factor_scope": "any_vehicle"},
+    {"vehicle_type": ["Taxi", "E-Bike/Scooter"]},
+    {"start_date": "2020-03-01", "end_date": "2020-06-30"},
+    {"search_query": "pedestrian"},
+])
+def test_filters_match_pandas(crashes, store, filters):
+    expected = apply_filters(crashes, **filters)
+    assert len(store.apply_filters(**filters)) == len(expected)
+
+
+def test_bits_column_is_not_a_table_column(store):
+    assert VEHICLE_BITS_COLUMN in store.columns
+    assert VEHICLE_BITS_COLUMN not in store.table_columns
+
+
+def test_export_without_column_list(crashes, store):
+    body = "".join(stream_export(store, "csv", chunk_size=500, borough="QUEENS"))
+    exported = pd.read_csv(io.StringIO(body))
+    assert list(exported.columns) == store.table_columns
+    assert len(exported) == len(apply_filters(crashes, borough="QUEENS"))
+
+
+def test_export_rejects_bits_column(store):
+    with pytest.raises(ValueError, match=VEHICLE_BITS_COLUMN):
+        stream_export(store, "csv", columns=["COLLISION_ID", VEHICLE_BITS_COLUMN])
+
+
+def test_any_vehicle_scope_reads_every_factor_column(crashes, store):
+    any_vehicle = store.apply_filters(factor="Unsafe Speed", factor_scope="any_vehicle")
+    assert len(any_vehicle) > len(store.apply_filters(factor="Unsafe Speed"))
+
+
+@pytest.mark.parametrize("backend", ["pandas", "sqlite"])
+def test_unknown_factor_scope_is_rejected(crashes, store, backend):
+    with pytest.raises(ValueError, match="Unknown factor_scope 'any'"):
+        if backend == "pandas":
+            apply_filters(crashes, factor="Unsafe Speed", factor_scope="any")
+        else:
+            store.apply_filters(factor="Unsafe Speed", factor_scope="any")
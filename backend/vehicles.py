@@ -0,0 +1,175 @@
+"""Vehicle types: per-collision aggregation of the vehicles export and the vehicle-type filter.
+
+The raw VEHICLE_TYPE values are free text ("Sedan", "4 dr sedan", "Station
+Wagon/Sport Utility Vehicle", "E-Bike", ...), so they are folded into the
+VEHICLE_TYPES groups by keyword. Each collision gets VEHICLE_COUNT, the count
+of each group (VEHICLES_SEDAN, ...), TOP_VEHICLE_TYPE and the most frequent
+make and pre-crash action. Without those columns the groups are taken from
+the crash table's VEHICLE TYPE CODE 1-5.
+"""
+import numpy as np
+import pandas as pd
+
+VEHICLE_TYPES = ["Sedan", "SUV", "Taxi", "Pickup", "Van", "Truck", "Bus",
+                 "Motorcycle", "Bicycle", "E-Bike/Scooter", "Emergency", "Other"]
+
+# First matching pattern wins, on the lowercased raw value. Values matching
+# none are "Other"; missing values have no type.
+TYPE_PATTERNS = [
+    ("Emergency", r"ambul|fire|fdny|police|nypd|\bems\b"),
+    ("E-Bike/Scooter", r"e-?bike|scoot|moped|minibike|motorized"),
+    ("Motorcycle", r"motorcycle|motorbike|dirt ?bike"),
+    ("Bicycle", r"bike|bicycle|cyclist"),
+    ("Bus", r"\bbus"),
+    ("Pickup", r"pick-? ?up"),
+    ("Truck", r"truck|tractor|dump|flat ?bed|garbage|refuse|tanker|tow|mixer|chassis|semi|trailer|box|carry ?all|armored"),
+    ("Taxi", r"taxi|livery|\bcab\b|limo"),
+    ("Van", r"\bvan"),
+    ("SUV", r"sport utility|\bsuv\b|station wagon|wagon"),
+    ("Sedan", r"sedan|passenger|convertible|coupe|\d ?dr\b|hatchback"),
+]
+
+VEHICLE_TYPE_CODE_COLUMNS = [f"VEHICLE TYPE CODE {i}" for i in range(1, 6)]
+
+# Group -> count column of the integrated CSV
+TYPE_COUNT_COLUMNS = {t: "VEHICLES_" + t.upper().replace("-", "_").replace("/", "_") for t in VEHICLE_TYPES}
+
+# Vehicle columns of the integrated CSV, in order
+VEHICLE_AGG_COLUMNS = (["VEHICLE_COUNT", "TOP_VEHICLE_TYPE", "TOP_VEHICLE_MAKE", "TOP_PRE_CRASH"]
+                       + list(TYPE_COUNT_COLUMNS.values()))
+
+# Counts are small: read them as such instead of int64
+VEHICLE_DTYPES = {"VEHICLE_COUNT": "uint16", **{c: "uint8" for c in TYPE_COUNT_COLUMNS.values()}}
+
+# Raw vehicles export columns kept by the ETL
+RAW_COLUMNS = ["UNIQUE_ID", "COLLISION_ID", "VEHICLE_TYPE", "VEHICLE_MAKE", "PRE_CRASH"]
+
+
+def type_codes(values):
+    """Position in VEHICLE_TYPES of each raw vehicle type, -1 where missing.
+
+    Only the distinct values are matched against TYPE_PATTERNS, then mapped
+    back by category code.
+    """
+    values = pd.Series(values)
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype("category")
+    lower = values.cat.categories.astype(str).str.strip().str.lower()
+    groups = np.full(len(lower), VEHICLE_TYPES.index("Other"), dtype=np.int8)
+    for group, pattern in reversed(TYPE_PATTERNS):
+        groups[np.asarray(lower.str.contains(pattern, regex=True))] = VEHICLE_TYPES.index(group)
+    groups[np.asarray(lower == "")] = -1
+    return np.append(groups, np.int8(-1))[values.cat.codes.to_numpy()]
+
+
+def _most_common(vehicles, column):
+    """Most frequent value of `column` per collision (the first seen at ties), indexed by COLLISION_ID."""
+    values = vehicles[["COLLISION_ID", column]].dropna()
+    counts = values.groupby(["COLLISION_ID", column], sort=False, observed=True).size().reset_index(name="n")
+    counts = counts.sort_values(["COLLISION_ID", "n"], ascending=[True, False], kind="stable")
+    return counts.drop_duplicates("COLLISION_ID").set_index("COLLISION_ID")[column]
+
+
+def aggregate_vehicles(vehicles):
+    """Vehicle columns of the integrated CSV, indexed by COLLISION_ID.
+
+    `vehicles` has COLLISION_ID (int) and VEHICLE_TYPE, and optionally
+    VEHICLE_MAKE and PRE_CRASH. Every row is a vehicle: VEHICLE_COUNT counts
+    them all, the type counts only those with a type. TOP_VEHICLE_TYPE is the
+    most frequent type, the earlier one in VEHICLE_TYPES at ties.
+    """
+    ids = vehicles["COLLISION_ID"].to_numpy(dtype=np.int64)
+    collisions, inverse = np.unique(ids, return_inverse=True)
+    codes = type_codes(vehicles["VEHICLE_TYPE"]).astype(np.int64)
+    typed = codes >= 0
+    # One bincount over (collision, type) keys instead of a groupby per type
+    counts = np.bincount(inverse[typed] * len(VEHICLE_TYPES) + codes[typed],
+                         minlength=len(collisions) * len(VEHICLE_TYPES)).reshape(len(collisions), len(VEHICLE_TYPES))
+    top = np.where(counts.any(axis=1), counts.argmax(axis=1), -1)
+
+    index = pd.Index(collisions, name="COLLISION_ID")
+    agg = pd.DataFrame({
+        "VEHICLE_COUNT": np.bincount(inverse, minlength=len(collisions)),
+        "TOP_VEHICLE_TYPE": pd.Categorical.from_codes(top, categories=VEHICLE_TYPES),
+    }, index=index)
+    for column, raw in [("TOP_VEHICLE_MAKE", "VEHICLE_MAKE"), ("TOP_PRE_CRASH", "PRE_CRASH")]:
+        if raw in vehicles.columns:
+            cleaned = vehicles[raw].str.strip().str.upper().replace("", np.nan)
+            agg[column] = _most_common(vehicles.assign(**{raw: cleaned}), raw).reindex(index)
+        else:
+            agg[column] = np.nan
+    for i, group in enumerate(VEHICLE_TYPES):
+        agg[TYPE_COUNT_COLUMNS[group]] = counts[:, i]
+    return agg[VEHICLE_AGG_COLUMNS]
+
+
+def vehicles_from_crashes(crashes):
+    """The crash table's VEHICLE TYPE CODE columns as vehicle rows, for when the vehicles export is not used."""
+    columns = [c for c in VEHICLE_TYPE_CODE_COLUMNS if c in crashes.columns]
+    melted = crashes.melt(id_vars=["COLLISION_ID"], value_vars=columns, value_name="VEHICLE_TYPE")
+    return melted.dropna(subset=["VEHICLE_TYPE"])[["COLLISION_ID", "VEHICLE_TYPE"]]
+
+
+def join_vehicles(crashes, vehicles_agg):
+    """Crash rows with the vehicle columns; collisions without vehicles get 0 / UNKNOWN."""
+    joined = crashes.join(vehicles_agg, on="COLLISION_ID")
+    for column in VEHICLE_AGG_COLUMNS:
+        if column.startswith("TOP_"):
+            joined[column] = joined[column].astype(object).fillna("UNKNOWN")
+        else:
+            joined[column] = joined[column].fillna(0).astype("int64")
+    return joined
+
+
+def type_bits(df):
+    """Bitmask per row of the VEHICLE_TYPES in the crash (bit i for VEHICLE_TYPES[i]), as uint16.
+
+    From the VEHICLES_* counts when `df` has them, else from the VEHICLE TYPE
+    CODE columns.
+    """
+    bits = np.zeros(len(df), dtype=np.uint16)
+    if all(c in df.columns for c in TYPE_COUNT_COLUMNS.values()):
+        for i, group in enumerate(VEHICLE_TYPES):
+            bits[df[TYPE_COUNT_COLUMNS[group]].fillna(0).to_numpy() > 0] |= np.uint16(1 << i)
+        return bits
+    for column in VEHICLE_TYPE_CODE_COLUMNS:
+        if column in df.columns:
+            codes = type_codes(df[column])
+            present = codes >= 0
+            bits[present] |= (np.uint16(1) << codes[present].astype(np.uint16))
+    return bits
+
+
+def wanted_bits(types):
+    """The bitmask of the named VEHICLE_TYPES (unknown names select nothing)."""
+    return sum(1 << VEHICLE_TYPES.index(t) for t in types if t in VEHICLE_TYPES)
+
+
+def types_in(bits):
+    """VEHICLE_TYPES with a bit set in any of `bits`."""
+    present = int(np.bitwise_or.reduce(np.asarray(bits, dtype=np.uint16))) if len(bits) else 0
+    return [t for i, t in enumerate(VEHICLE_TYPES) if present & (1 << i)]
+
+
+def build_vehicle_index(df):
+    """Vehicle-type bitmask of every row of the loaded table, by position (= index label)."""
+    return {"bits": type_bits(df), "n_rows": len(df)}
+
+
+def loaded_index():
+    """The vehicle index of the loaded table, or None before it is built."""
+    import crash_data
+
+    return crash_data.get_index("vehicles")
+
+
+def vehicle_type_mask(data, types, index=None):
+    """Boolean array: did any vehicle in each row of `data` have one of `types`.
+
+    Like factors.any_vehicle_mask, `data` is the loaded table or rows of it
+    that kept the index labels; without the index the bits are computed from
+    `data` itself.
+    """
+    index = index if index is not None else loaded_index()
+    bits = index["bits"][data.index.to_numpy()] if index is not None else type_bits(data)
+    return (bits & np.uint16(wanted_bits(types))) != 0
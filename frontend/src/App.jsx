@@ -5,23 +5,47 @@ import Plot from 'react-plotly.js'
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:5000'
 
+// Report charts in display order; "factors" is only sent when the server has
+// a factor index
+const CHART_NAMES = ['borough', 'time', 'severity', 'heatmap', 'factors']
+
+// One Server-Sent Events block ("event: ...\ndata: ...") as { event, data }
+const parseEvent = (block) => {
+  let event = 'message'
+  const data = []
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data.push(line.slice(5).trim())
+  }
+  return { event, data: data.length ? JSON.parse(data.join('\n')) : null }
+}
+
 export default function App() {
   const [filters, setFilters] = useState({
-    borough: 'All',
-    year: 'All',
-    factor: 'All',
-    severity: 'All',
-    search_query: ''
+    borough: ['All'],
+    year: ['All'],
+    factor: ['All'],
+    factor_scope: 'vehicle_1',
+    severity: ['All'],
+    vehicle_type: ['All'],
+    search_query: '',
+    start_date: '',
+    end_date: '',
+    granularity: 'month'
   })
 
   const [filterOptions, setFilterOptions] = useState({
     boroughs: [],
     years: [],
     factors: [],
-    severities: []
+    severities: [],
+    vehicle_types: [],
+    date_range: { min: null, max: null },
+    granularities: []
   })
 
   const [report, setReport] = useState(null)
+  const [hotspots, setHotspots] = useState(null)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState('')
 
@@ -47,17 +71,86 @@ export default function App() {
     }))
   }
 
+  // Multi-select: picking "All" together with other values keeps only the
+  // most recent choice, an empty selection falls back to "All"
+  const handleMultiSelectChange = (key, e) => {
+    let values = Array.from(e.target.selectedOptions, (o) => o.value)
+    if (values.length > 1 && values.includes('All')) {
+      values = filters[key].includes('All') ? values.filter((v) => v !== 'All') : ['All']
+    }
+    handleFilterChange(key, values.length ? values : ['All'])
+  }
+
+  // Top intersections for the same filters, answered from pre-aggregated counts
+  const fetchHotspots = async () => {
+    try {
+      const response = await axios.post(`${BACKEND_URL}/api/hotspots`, {
+        ...filters, kind: 'intersection', metric: 'crashes', k: 10
+      })
+      setHotspots(response.data)
+    } catch (err) {
+      console.error('Failed to fetch hotspots:', err)
+      setHotspots(null)
+    }
+  }
+
+  const handleEvent = ({ event, data }) => {
+    if (event === 'approximate') {
+      setReport(prev => ({ ...prev, approximate: data }))
+    } else if (event === 'summary') {
+      setReport(prev => ({ ...prev, summary: data }))
+    } else if (event === 'chart') {
+      setReport(prev => ({ ...prev, charts: { ...prev.charts, [data.name]: data.figure } }))
+    } else if (event === 'error') {
+      setError(data.error)
+      // Past its deadline, the estimate is all there is to show
+      if (!data.deadline_exceeded) setReport(prev => ({ ...prev, approximate: null }))
+    } else if (event === 'done') {
+      setReport(prev => ({ ...prev, approximate: null }))
+    }
+  }
+
+  // Until the exact parts arrive, the summary and charts come from the
+  // estimate the stream opens with
+  const estimate = report && report.approximate
+  const summary = report && (report.summary || (estimate && estimate.summary))
+  const chartFor = (name) => report.charts[name] || (estimate && estimate.charts[name])
+
   const handleGenerateReport = async () => {
     setLoading(true)
     setError('')
+    setReport({ summary: null, charts: {}, pending: true })
+    fetchHotspots()
     try {
-      const response = await axios.post(`${BACKEND_URL}/api/report`, filters)
-      setReport(response.data)
+      // The report streams as Server-Sent Events: an estimate from the
+      // sample, then the exact summary and each chart as soon as the server
+      // has built it, replacing the estimate part by part
+      const response = await fetch(`${BACKEND_URL}/api/report/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify(filters)
+      })
+      if (!response.ok) throw new Error(`HTTP ${response.status}`)
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      for (;;) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let end
+        while ((end = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, end).trim()
+          buffer = buffer.slice(end + 2)
+          if (block) handleEvent(parseEvent(block))
+        }
+      }
     } catch (err) {
       console.error('Failed to generate report:', err)
       setError('Failed to generate report. Please try again.')
     } finally {
       setLoading(false)
+      setReport(prev => prev && { ...prev, pending: false })
     }
   }
 
@@ -81,8 +174,9 @@ export default function App() {
             <div className="filter-item">
               <label>Borough</label>
               <select
+                multiple
                 value={filters.borough}
-                onChange={(e) => handleFilterChange('borough', e.target.value)}
+                onChange={(e) => handleMultiSelectChange('borough', e)}
               >
                 {filterOptions.boroughs.map((b) => (
                   <option key={b} value={b}>{b}</option>
@@ -93,8 +187,9 @@ export default function App() {
             <div className="filter-item">
               <label>Year</label>
               <select
+                multiple
                 value={filters.year}
-                onChange={(e) => handleFilterChange('year', e.target.value)}
+                onChange={(e) => handleMultiSelectChange('year', e)}
               >
                 {filterOptions.years.map((y) => (
                   <option key={y} value={y}>{y}</option>
@@ -105,26 +200,82 @@ export default function App() {
             <div className="filter-item">
               <label>Contributing Factor</label>
               <select
+                multiple
                 value={filters.factor}
-                onChange={(e) => handleFilterChange('factor', e.target.value)}
+                onChange={(e) => handleMultiSelectChange('factor', e)}
               >
                 {filterOptions.factors.map((f) => (
                   <option key={f} value={f}>{f}</option>
                 ))}
               </select>
+              <select
+                value={filters.factor_scope}
+                onChange={(e) => handleFilterChange('factor_scope', e.target.value)}
+              >
+                <option value="vehicle_1">Vehicle 1 only</option>
+                <option value="any_vehicle">Any vehicle</option>
+              </select>
             </div>
 
             <div className="filter-item">
               <label>Severity</label>
               <select
+                multiple
                 value={filters.severity}
-                onChange={(e) => handleFilterChange('severity', e.target.value)}
+                onChange={(e) => handleMultiSelectChange('severity', e)}
               >
                 {filterOptions.severities.map((s) => (
                   <option key={s} value={s}>{s}</option>
                 ))}
               </select>
             </div>
+
+            <div className="filter-item">
+              <label>Vehicle Type</label>
+              <select
+                multiple
+                value={filters.vehicle_type}
+                onChange={(e) => handleMultiSelectChange('vehicle_type', e)}
+              >
+                {filterOptions.vehicle_types.map((v) => (
+                  <option key={v} value={v}>{v}</option>
+                ))}
+              </select>
+            </div>
+
+            <div className="filter-item">
+              <label>From</label>
+              <input
+                type="date"
+                value={filters.start_date}
+                min={filterOptions.date_range.min || undefined}
+                max={filterOptions.date_range.max || undefined}
+                onChange={(e) => handleFilterChange('start_date', e.target.value)}
+              />
+            </div>
+
+            <div className="filter-item">
+              <label>To</label>
+              <input
+                type="date"
+                value={filters.end_date}
+                min={filterOptions.date_range.min || undefined}
+                max={filterOptions.date_range.max || undefined}
+                onChange={(e) => handleFilterChange('end_date', e.target.value)}
+              />
+            </div>
+
+            <div className="filter-item">
+              <label>Time Granularity</label>
+              <select
+                value={filters.granularity}
+                onChange={(e) => handleFilterChange('granularity', e.target.value)}
+              >
+                {filterOptions.granularities.map((g) => (
+                  <option key={g} value={g}>{g.charAt(0).toUpperCase() + g.slice(1)}</option>
+                ))}
+              </select>
+            </div>
           </div>
 
           <div className="search-section">
@@ -150,57 +301,67 @@ export default function App() {
 
         {error && <div className="error-message">{error}</div>}
 
+        {estimate && (
+          <div className="approximate-note">
+            ≈ {report.summary ? 'Charts not refined yet are estimated' : 'Estimated'} from a {(estimate.sample.fraction * 100).toFixed(0)}% sample
+            {!report.summary && ` (±${estimate.error_bounds.crashes.toLocaleString()} crashes)`}
+            {report.pending ? ', refining...' : ''}
+          </div>
+        )}
+
         {/* Summary Box */}
-        {report && report.summary && (
+        {summary && (
           <div className="summary-box">
             <div className="stat">
               <div className="stat-label">Total Crashes</div>
-              <div className="stat-value">{report.summary.crashes.toLocaleString()}</div>
+              <div className="stat-value">{summary.crashes.toLocaleString()}</div>
             </div>
             <div className="divider"></div>
             <div className="stat">
               <div className="stat-label">Injured</div>
-              <div className="stat-value">{report.summary.injured.toLocaleString()}</div>
+              <div className="stat-value">{summary.injured.toLocaleString()}</div>
             </div>
             <div className="divider"></div>
             <div className="stat">
               <div className="stat-label">Fatalities</div>
-              <div className="stat-value">{report.summary.killed.toLocaleString()}</div>
+              <div className="stat-value">{summary.killed.toLocaleString()}</div>
             </div>
           </div>
         )}
 
-        {/* Charts */}
-        {report && report.charts && (
+        {/* Charts, each shown as soon as it arrives (the estimate's until then) */}
+        {summary && summary.crashes > 0 && (
           <div className="charts-grid">
-            <div className="chart-card">
-              <Plot
-                data={report.charts.borough.data}
-                layout={{...report.charts.borough.layout, height: 400}}
-                config={{ responsive: true }}
-              />
-            </div>
-            <div className="chart-card">
-              <Plot
-                data={report.charts.time.data}
-                layout={{...report.charts.time.layout, height: 400}}
-                config={{ responsive: true }}
-              />
-            </div>
-            <div className="chart-card">
-              <Plot
-                data={report.charts.severity.data}
-                layout={{...report.charts.severity.layout, height: 400}}
-                config={{ responsive: true }}
-              />
-            </div>
-            <div className="chart-card">
-              <Plot
-                data={report.charts.heatmap.data}
-                layout={{...report.charts.heatmap.layout, height: 400}}
-                config={{ responsive: true }}
-              />
-            </div>
+            {CHART_NAMES.map((name) => chartFor(name) ? (
+              <div className="chart-card" key={name}>
+                <Plot
+                  data={chartFor(name).data}
+                  layout={{...chartFor(name).layout, height: 400}}
+                  config={{ responsive: true }}
+                />
+              </div>
+            ) : report.pending && (
+              <div className="chart-card chart-pending" key={name}>⏳ Loading chart...</div>
+            ))}
+          </div>
+        )}
+
+        {report && hotspots && hotspots.locations.length > 0 && (
+          <div className="chart-card hotspots">
+            <h3>Top Intersections</h3>
+            <table>
+              <thead>
+                <tr><th>#</th><th>Intersection</th><th>Crashes</th><th>Injured</th><th>Killed</th></tr>
+              </thead>
+              <tbody>
+                {hotspots.locations.map((l) => (
+                  <tr key={l.location}>
+                    <td>{l.rank}</td><td>{l.location}</td>
+                    <td>{l.crashes.toLocaleString()}</td><td>{l.injured.toLocaleString()}</td><td>{l.killed.toLocaleString()}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
           </div>
         )}
 